@@ -6,10 +6,11 @@ Implements CIA Triad: Confidentiality, Integrity, Availability
 
 import streamlit as st
 import pandas as pd
+import json
 from datetime import datetime, timedelta
 import plotly.express as px
 import plotly.graph_objects as go
-from database import DatabaseManager
+from database import DatabaseManager, BACKUP_DIR, list_backups
 import time
 
 # Page configuration
@@ -107,16 +108,16 @@ st.markdown("""
         z-index: 999;
         letter-spacing: .3px;
     }
-    .stTabs [data-baseweb="tab-list"] {
+    [class*="_section"] .stRadio [role="radiogroup"] {
         gap: 0.5rem;
     }
-    .stTabs [data-baseweb="tab"] {
+    [class*="_section"] .stRadio [role="radiogroup"] > label {
         background: #ffffff;
         padding: 0.6rem 1rem;
         border-radius: 4px;
         border: 1px solid var(--border-grey);
     }
-    .stTabs [aria-selected="true"] {
+    [class*="_section"] .stRadio [role="radiogroup"] > label:has(input:checked) {
         background: var(--primary-red);
         color: #ffffff;
         border-color: var(--primary-red-dark);
@@ -127,7 +128,12 @@ st.markdown("""
 # Initialize database
 @st.cache_resource
 def init_db():
-    return DatabaseManager()
+    db = DatabaseManager()
+    # Purge records past their retention date in the background (hourly)
+    db.start_retention_sweeper(interval_seconds=3600, batch_size=500)
+    # Daily compressed, encrypted snapshot; the last 7 are kept
+    db.start_backup_scheduler(BACKUP_DIR, interval_seconds=86400, keep=7)
+    return db
 
 db = init_db()
 
@@ -216,67 +222,97 @@ def login_page():
             - Password: `rec123`
             """)
 
+def render_sections(key, sections):
+    """Lazy navigation: render only the selected dashboard section
+    
+    Unlike st.tabs, which runs every tab's code on each rerun, sections that
+    are not visible issue no queries and build no charts.
+    """
+    selected = st.radio("Section", list(sections.keys()), horizontal=True,
+                        key=key, label_visibility="collapsed")
+    st.markdown("---")
+    sections[selected]()
+
 def admin_dashboard():
     """Admin Dashboard - Full Access"""
     user = st.session_state.user
     st.markdown(f"<h1 class='header-title'>Admin Dashboard</h1>", unsafe_allow_html=True)
     st.markdown(f"<p class='header-subtitle'>Welcome, {user['username']} | Full System Access</p>", unsafe_allow_html=True)
-    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
-        "Overview", "Patient Management", "Data Security", "Audit Logs", "Analytics", "GDPR Compliance"
-    ])
-    
-    with tab1:
-        show_overview_dashboard()
-    
-    with tab2:
-        show_patient_management(user, is_admin=True)
-    
-    with tab3:
-        show_data_security(user)
-    
-    with tab4:
-        show_audit_logs(user)
-    
-    with tab5:
-        show_analytics()
-    
-    with tab6:
-        show_gdpr_compliance(user)
+    render_sections("admin_section", {
+        "Overview": show_overview_dashboard,
+        "Patient Management": lambda: show_patient_management(user, is_admin=True),
+        "Import Patients": lambda: import_patients_form(user),
+        "Data Security": lambda: show_data_security(user),
+        "Audit Logs": lambda: show_audit_logs(user),
+        "Analytics": show_analytics,
+        "GDPR Compliance": lambda: show_gdpr_compliance(user),
+    })
 
 def doctor_dashboard():
     """Doctor Dashboard - Anonymized Data Access"""
     user = st.session_state.user
     st.markdown(f"<h1 class='header-title'>Doctor Dashboard</h1>", unsafe_allow_html=True)
     st.markdown(f"<p class='header-subtitle'>Welcome, Dr. {user['username']} | Anonymized Patient Data View</p>", unsafe_allow_html=True)
-    tab1, tab2 = st.tabs(["Overview", "Patients"])
-    
-    with tab1:
-        show_overview_dashboard()
-    
-    with tab2:
-        show_patient_list(user, can_edit=False)
+    render_sections("doctor_section", {
+        "Overview": show_overview_dashboard,
+        "Patients": lambda: show_patient_list(user, can_edit=False),
+    })
 
 def receptionist_dashboard():
     """Receptionist Dashboard - Add/Edit Records"""
     user = st.session_state.user
     st.markdown(f"<h1 class='header-title'>Receptionist Dashboard</h1>", unsafe_allow_html=True)
     st.markdown(f"<p class='header-subtitle'>Welcome, {user['username']} | Patient Records Management</p>", unsafe_allow_html=True)
-    tab1, tab2, tab3 = st.tabs(["Overview", "Add Patient", "Edit Patient"])
+    render_sections("receptionist_section", {
+        "Overview": show_overview_dashboard,
+        "Add Patient": lambda: add_patient_form(user),
+        "Edit Patient": lambda: edit_patient_form(user),
+        "Import Patients": lambda: import_patients_form(user),
+    })
+
+def paginate(key, fetch_page, reset_on=None):
+    """Render Previous/Next controls for a keyset-paginated query and return the current page
     
-    with tab1:
-        show_overview_dashboard()
+    Paging restarts from the first page whenever reset_on (e.g. the active filters) changes.
+    """
+    state_key = f"{key}_page"
+    state = st.session_state.get(state_key)
+    if state is None or state.get('reset_on') != reset_on:
+        state = {'cursor': None, 'direction': 'next', 'reset_on': reset_on}
+        st.session_state[state_key] = state
+    page = fetch_page(state['cursor'], state['direction'])
     
-    with tab2:
-        add_patient_form(user)
+    # The anchor row may have been deleted; fall back to the first page
+    if not page['rows'] and state['cursor'] is not None:
+        st.session_state[state_key] = {'cursor': None, 'direction': 'next', 'reset_on': reset_on}
+        page = fetch_page(None, 'next')
     
-    with tab3:
-        edit_patient_form(user)
+    col_prev, col_spacer, col_next = st.columns([1, 3, 1])
+    with col_prev:
+        if st.button("Previous", key=f"{key}_prev", use_container_width=True,
+                     disabled=page['prev_cursor'] is None):
+            st.session_state[state_key] = {'cursor': page['prev_cursor'], 'direction': 'prev', 'reset_on': reset_on}
+            st.rerun()
+    with col_next:
+        if st.button("Next", key=f"{key}_next", use_container_width=True,
+                     disabled=page['next_cursor'] is None):
+            st.session_state[state_key] = {'cursor': page['next_cursor'], 'direction': 'next', 'reset_on': reset_on}
+            st.rerun()
+    return page
+
+def view_changed(key, user, patient_ids):
+    """True when a view shows different patients than on the previous run (so views are logged once, not per rerun)"""
+    state_key = f"{key}_viewed"
+    shown = (user['user_id'], tuple(patient_ids))
+    if st.session_state.get(state_key) == shown:
+        return False
+    st.session_state[state_key] = shown
+    return True
 
 def show_overview_dashboard():
     """Overview metrics for all roles"""
     try:
-        patients = db.get_patients(st.session_state.user['role'])
-        logs = db.get_all_logs()
+        stats = db.get_statistics()
         
         col1, col2, col3, col4 = st.columns(4)
         
@@ -286,16 +322,15 @@ def show_overview_dashboard():
                     <h3>Total Patients</h3>
                     <p>{}</p>
                 </div>
-            """.format(len(patients)), unsafe_allow_html=True)
+            """.format(stats['total_patients']), unsafe_allow_html=True)
         
         with col2:
-            anonymized = sum(1 for p in patients if p[5] == 1)
             st.markdown("""
                 <div class='metric-card'>
                     <h3>Anonymized</h3>
                     <p>{}</p>
                 </div>
-            """.format(anonymized), unsafe_allow_html=True)
+            """.format(stats['anonymized_patients']), unsafe_allow_html=True)
         
         with col3:
             st.markdown("""
@@ -303,7 +338,7 @@ def show_overview_dashboard():
                     <h3>With Consent</h3>
                     <p>{}</p>
                 </div>
-            """.format(sum(1 for p in patients if p[6] == 1)), unsafe_allow_html=True)
+            """.format(stats['patients_with_consent']), unsafe_allow_html=True)
         
         with col4:
             st.markdown("""
@@ -311,15 +346,15 @@ def show_overview_dashboard():
                     <h3>Total Logs</h3>
                     <p>{}</p>
                 </div>
-            """.format(len(logs)), unsafe_allow_html=True)
+            """.format(stats['total_logs']), unsafe_allow_html=True)
         
         st.markdown("<br>", unsafe_allow_html=True)
         
         # Recent activity (admin only)
         if st.session_state.user.get('role') == 'admin':
             st.subheader("Recent System Activity")
-            if logs:
-                recent_logs = logs[:10]
+            recent_logs = db.get_logs_page(page_size=10)['rows']
+            if recent_logs:
                 df_logs = pd.DataFrame(recent_logs, columns=['Log ID', 'Username', 'Role', 'Action', 'Timestamp', 'Details'])
                 st.dataframe(df_logs, use_container_width=True, hide_index=True)
             else:
@@ -346,17 +381,44 @@ def show_patient_management(user, is_admin=False):
             st.rerun()
     
     show_anonymized = view_mode == "Anonymized View"
-    patients = db.get_patients(user['role'], show_anonymized=show_anonymized)
+    
+    # Exact lookup through the blind indexes (no decryption or table scan)
+    with st.expander("Find Patient"):
+        col_a, col_b = st.columns(2)
+        with col_a:
+            find_contact = st.text_input("Contact Number", key="find_contact")
+        with col_b:
+            find_name = st.text_input("Full Name", key="find_name")
+        if find_contact or find_name:
+            matches = db.find_patients(user['role'], contact=find_contact, name=find_name,
+                                       show_anonymized=show_anonymized)
+            if matches:
+                st.dataframe(pd.DataFrame(matches, columns=['ID', 'Name', 'Contact', 'Diagnosis', 'Date Added',
+                                                            'Anonymized', 'Consent']),
+                             use_container_width=True, hide_index=True)
+                if view_changed("find_patient", user, [p[0] for p in matches]):
+                    db.log_patient_access(user['user_id'], user['username'], user['role'],
+                                          [p[0] for p in matches], details='Found via patient lookup')
+            else:
+                st.info("No matching patient found.")
+    
+    page_size = st.selectbox("Rows per page", [25, 50, 100], index=0, key="patient_page_size")
+    page = paginate("patients", lambda cursor, direction: db.get_patients_page(
+        user['role'], show_anonymized=show_anonymized, page_size=page_size,
+        cursor=cursor, direction=direction))
+    patients = page['rows']
     
     if patients:
         df = pd.DataFrame(patients, columns=['ID', 'Name', 'Contact', 'Diagnosis', 'Date Added', 'Anonymized', 'Consent'])
         st.dataframe(df, use_container_width=True, hide_index=True)
+        if view_changed("patients", user, [p[0] for p in patients]):
+            db.log_patient_access(user['user_id'], user['username'], user['role'],
+                                  [p[0] for p in patients], details='Viewed in patient list')
         
         # Export option
-        csv_data = db.export_patients_csv(user['role'])
         st.download_button(
             label="Download Patient Data (CSV)",
-            data=csv_data,
+            data=lambda: read_export('patients', user['role']),
             file_name=f"patients_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
             mime="text/csv"
         )
@@ -378,6 +440,41 @@ def show_patient_management(user, is_admin=False):
                         st.rerun()
                     else:
                         st.error(message)
+            
+            with st.expander("Bulk Delete"):
+                cohort = st.radio("Delete", ["Patient IDs", "Patients without consent", "Patients added before"],
+                                  horizontal=True, key="bulk_delete_cohort")
+                if cohort == "Patient IDs":
+                    id_text = st.text_area("Patient IDs (comma or space separated)", key="bulk_delete_ids")
+                    tokens = id_text.replace(',', ' ').split()
+                    invalid = [t for t in tokens if not t.isdigit()]
+                    selection = {'patient_ids': [int(t) for t in tokens if t.isdigit()]}
+                elif cohort == "Patients without consent":
+                    invalid = []
+                    selection = {'where': 'consent_given = 0'}
+                else:
+                    before = st.date_input("Added before", key="bulk_delete_before")
+                    invalid = []
+                    selection = {'where': 'date_added < ?', 'params': (before.isoformat(),)}
+                
+                if invalid:
+                    st.warning(f"Not patient IDs: {', '.join(invalid)}")
+                else:
+                    # Deletion cannot be undone: show what matches and require the count to be typed back
+                    matching = db.count_patients(**selection)
+                    if matching:
+                        st.warning(f"{matching} patient record(s) match and will be permanently deleted.")
+                        confirm = st.text_input("Type the number of records to confirm", key="bulk_delete_confirm")
+                        if st.button("Delete Records", type="primary", key="bulk_delete_button",
+                                     disabled=confirm.strip() != str(matching)):
+                            with st.spinner("Deleting records..."):
+                                count = db.delete_patients(user['user_id'], user['username'], user['role'],
+                                                           **selection)
+                            st.success(f"Deleted {count} patient record(s)")
+                            time.sleep(1)
+                            st.rerun()
+                    else:
+                        st.info("No patient records match.")
     else:
         st.info("No patient records found.")
 
@@ -385,7 +482,9 @@ def show_patient_list(user, can_edit=False):
     """Display patient list for doctors"""
     st.subheader("Patient Records (Anonymized)")
     
-    patients = db.get_patients(user['role'])
+    page = paginate("patient_list", lambda cursor, direction: db.get_patients_page(
+        user['role'], page_size=25, cursor=cursor, direction=direction))
+    patients = page['rows']
     
     if patients:
         df = pd.DataFrame(patients, columns=['ID', 'Name', 'Contact', 'Diagnosis', 'Date Added', 'Anonymized', 'Consent'])
@@ -395,9 +494,12 @@ def show_patient_list(user, can_edit=False):
         
         st.info("Patient data is displayed in anonymized format to protect privacy.")
         
-        # Log view action
-        db.log_action(user['user_id'], user['username'], user['role'], 
-                     'view_patients', f'Viewed {len(patients)} patient records')
+        # Log view action (once per page shown, not on every rerun)
+        if view_changed("patient_list", user, [p[0] for p in patients]):
+            db.log_action(user['user_id'], user['username'], user['role'], 
+                         'view_patients', f'Viewed {len(patients)} patient records')
+            db.log_patient_access(user['user_id'], user['username'], user['role'],
+                                  [p[0] for p in patients], details='Viewed in patient list')
     else:
         st.warning("No patient records available.")
 
@@ -447,6 +549,9 @@ def edit_patient_form(user):
         
         # Get current data
         current_patient = [p for p in patients if p[0] == patient_id][0]
+        if view_changed("edit_patient", user, [patient_id]):
+            db.log_patient_access(user['user_id'], user['username'], user['role'],
+                                  [patient_id], details='Opened for editing')
         
         with st.form("edit_patient_form"):
             col1, col2 = st.columns(2)
@@ -476,6 +581,59 @@ def edit_patient_form(user):
     else:
         st.info("No patient records available for editing.")
 
+def import_patients_form(user):
+    """Bulk import of patient records from a CSV or JSON Lines file"""
+    st.subheader("Import Patient Records")
+    st.markdown("""
+        <div class='info-box'>
+            <p>Upload a CSV file with a header row, or a JSON Lines file with one record per line.
+            Required fields: <b>name</b>, <b>contact</b>, <b>diagnosis</b>; optional: <b>consent</b>
+            (yes/no, defaults to yes). Invalid rows are skipped and listed below.</p>
+        </div>
+    """, unsafe_allow_html=True)
+    
+    uploaded = st.file_uploader("Patient File", type=['csv', 'jsonl', 'ndjson'], key="import_file")
+    encrypt = st.checkbox("Encrypt records on import", value=db.encrypt_on_write, key="import_encrypt")
+    
+    if uploaded and st.button("Import Records", type="primary", use_container_width=True):
+        # Line count (less the CSV header) as the progress total
+        total = uploaded.getvalue().count(b'\n') + 1
+        if not uploaded.name.lower().endswith(('.jsonl', '.ndjson')):
+            total -= 1
+        progress_bar = st.progress(0.0, text="Importing records...")
+        
+        def report_progress(processed, imported, rows_per_sec):
+            progress_bar.progress(min(processed / total, 1.0) if total > 0 else 1.0,
+                                  text=f"Read {processed:,} rows, imported {imported:,} ({rows_per_sec:,.0f} rows/s)")
+        
+        try:
+            result = db.import_patients(uploaded, user['user_id'], user['username'], user['role'],
+                                        encrypt=encrypt, progress_callback=report_progress)
+        except ValueError as e:
+            progress_bar.empty()
+            st.error(str(e))
+            return
+        progress_bar.progress(1.0, text="Import complete")
+        st.success(f"Imported {result['imported']:,} of {result['processed']:,} records in "
+                   f"{result['seconds']:.1f}s ({result['rows_per_sec']:,.0f} rows/s).")
+        if result['rejected']:
+            st.warning(f"Rejected {result['rejected']:,} record(s).")
+            st.dataframe(pd.DataFrame(result['rejects'], columns=['Row', 'Reason']),
+                         use_container_width=True, hide_index=True)
+
+def read_export(kind, role=None):
+    """Load a cached CSV export; passed to st.download_button so it only runs on click"""
+    with open(db.get_export_file(kind, role), 'rb') as f:
+        return f.read()
+
+def make_progress_callback(progress_bar, verb):
+    """Build a bulk job progress callback that updates a Streamlit progress bar"""
+    def report_progress(processed, total, rows_per_sec):
+        fraction = min(processed / total, 1.0) if total else 1.0
+        progress_bar.progress(fraction, text=f"{verb} {processed:,} / {total:,} records "
+                                             f"({rows_per_sec:,.0f} rows/s)")
+    return report_progress
+
 def show_data_security(user):
     """Data security controls for admin"""
     st.subheader("Data Security & Anonymization")
@@ -491,11 +649,16 @@ def show_data_security(user):
         """, unsafe_allow_html=True)
         
         if st.button("Anonymize All Patient Data", use_container_width=True, type="primary"):
-            with st.spinner("Encrypting patient data..."):
-                count = db.anonymize_patient_data(user['user_id'], user['username'], user['role'])
+            progress_bar = st.progress(0.0, text="Encrypting patient data...")
+            try:
+                count = db.anonymize_patient_data(user['user_id'], user['username'], user['role'],
+                                                  progress_callback=make_progress_callback(progress_bar, "Encrypted"))
+                progress_bar.progress(1.0, text="Encryption complete")
                 st.success(f"Successfully anonymized {count} patient records with Fernet encryption.")
                 time.sleep(1)
                 st.rerun()
+            except RuntimeError as e:
+                st.warning(str(e))
     
     with col2:
         st.markdown("""
@@ -506,18 +669,23 @@ def show_data_security(user):
         """, unsafe_allow_html=True)
         
         if st.button("De-Anonymize Patient Data", use_container_width=True):
-            with st.spinner("Decrypting patient data..."):
-                count = db.de_anonymize_patient_data(user['user_id'], user['username'], user['role'])
+            progress_bar = st.progress(0.0, text="Decrypting patient data...")
+            try:
+                count = db.de_anonymize_patient_data(user['user_id'], user['username'], user['role'],
+                                                     progress_callback=make_progress_callback(progress_bar, "Decrypted"))
+                progress_bar.progress(1.0, text="Decryption complete")
                 st.success(f"Successfully de-anonymized {count} patient records.")
                 time.sleep(1)
                 st.rerun()
+            except RuntimeError as e:
+                st.warning(str(e))
     
     st.markdown("---")
     
     # Encryption status
-    patients = db.get_patients(user['role'])
-    anonymized_count = sum(1 for p in patients if p[5] == 1)
-    total_count = len(patients)
+    stats = db.get_statistics()
+    anonymized_count = stats['anonymized_patients']
+    total_count = stats['total_patients']
     
     st.subheader("Encryption Status")
     
@@ -528,6 +696,181 @@ def show_data_security(user):
                  f"{progress*100:.1f}% encrypted")
     else:
         st.info("No patient records in database.")
+    
+    # Encryption key rotation
+    st.markdown("---")
+    st.subheader("Encryption Keys")
+    
+    key_status = db.get_key_status()
+    old_key_rows = sum(count for version, count in key_status['rows_by_version'].items()
+                       if version != key_status['current_version'])
+    col_a, col_b, col_c, col_d = st.columns(4)
+    with col_a:
+        st.metric("Current Key Version", key_status['current_version'])
+    with col_b:
+        st.metric("Keys in Ring", len(key_status['versions']))
+    with col_c:
+        st.metric("Records on Older Keys", old_key_rows)
+    with col_d:
+        st.metric("Records to Re-index", key_status['stale_index_rows'])
+    if key_status['stale_index_rows']:
+        st.info(f"Patient lookup cannot find {key_status['stale_index_rows']} record(s) until their "
+                "blind indexes are rebuilt (button below or `python -m hospital_cli reindex`).")
+    
+    col_a, col_b, col_c = st.columns(3)
+    with col_a:
+        if st.button("Rotate Encryption Key", use_container_width=True):
+            progress_bar = st.progress(0.0, text="Re-encrypting patient data...")
+            try:
+                count = db.rotate_encryption_key(user['user_id'], user['username'], user['role'],
+                                                 progress_callback=make_progress_callback(progress_bar, "Re-encrypted"))
+                progress_bar.progress(1.0, text="Rotation complete")
+                st.success(f"Re-encrypted {count} patient records with key version {db.key_version}.")
+                time.sleep(1)
+                st.rerun()
+            except RuntimeError as e:
+                st.warning(str(e))
+    with col_b:
+        if st.button("Rebuild Blind Indexes", use_container_width=True):
+            progress_bar = st.progress(0.0, text="Indexing patient data...")
+            try:
+                count = db.rebuild_blind_indexes(user['user_id'], user['username'], user['role'],
+                                                 progress_callback=make_progress_callback(progress_bar, "Indexed"))
+                progress_bar.progress(1.0, text="Indexing complete")
+                st.success(f"Indexed {count} patient records.")
+                time.sleep(1)
+                st.rerun()
+            except RuntimeError as e:
+                st.warning(str(e))
+    with col_c:
+        if st.button("Retire Unused Keys", use_container_width=True):
+            retired = db.retire_encryption_keys()
+            if retired:
+                db.log_action(user['user_id'], user['username'], user['role'], 'retire_encryption_keys',
+                              f"Retired encryption key versions {', '.join(map(str, retired))}")
+                st.success(f"Retired key versions: {', '.join(map(str, retired))}")
+            else:
+                st.info("No unused keys to retire. Keys still used by patient records or "
+                        "encrypted backups are kept.")
+    
+    # Resumable bulk jobs
+    st.markdown("---")
+    st.subheader("Bulk Jobs")
+    
+    jobs = db.list_jobs()
+    if jobs:
+        df_jobs = pd.DataFrame(jobs, columns=['Job ID', 'Type', 'Status', 'Processed', 'Total',
+                                              'Last Patient ID', 'Started By', 'Created',
+                                              'Updated', 'Finished', 'Error'])
+        st.dataframe(df_jobs, use_container_width=True, hide_index=True)
+        
+        unfinished = [job[0] for job in jobs if job[2] != 'completed']
+        if unfinished:
+            col_a, col_b, col_c = st.columns([2, 1, 1])
+            with col_a:
+                job_id = st.selectbox("Unfinished Job", unfinished, key="bulk_job_id")
+            with col_b:
+                st.markdown("<br>", unsafe_allow_html=True)
+                if st.button("Resume Job", use_container_width=True):
+                    progress_bar = st.progress(0.0, text=f"Resuming job {job_id}...")
+                    try:
+                        job = db.run_job(job_id, progress_callback=make_progress_callback(progress_bar, "Processed"))
+                        st.success(f"Job {job_id} {job['status']}: {job['processed_count']} records processed.")
+                        time.sleep(1)
+                        st.rerun()
+                    except RuntimeError as e:
+                        st.warning(str(e))
+            with col_c:
+                st.markdown("<br>", unsafe_allow_html=True)
+                if st.button("Pause Job", use_container_width=True):
+                    if db.pause_job(job_id):
+                        st.info(f"Job {job_id} will pause after its current batch.")
+                    else:
+                        st.info(f"Job {job_id} is not running.")
+    else:
+        st.info("No bulk jobs have been run yet.")
+    
+    # Online backups
+    st.markdown("---")
+    st.subheader("Backups")
+    
+    col_a, col_b, col_c = st.columns([1, 1, 2])
+    with col_a:
+        compress = st.checkbox("Compress (gzip)", value=True, key="backup_compress")
+    with col_b:
+        encrypt = st.checkbox("Encrypt", value=True, key="backup_encrypt")
+    with col_c:
+        if st.button("Create Backup Now", use_container_width=True):
+            progress_bar = st.progress(0.0, text="Copying database pages...")
+            
+            def report_pages(copied, total):
+                progress_bar.progress(min(copied / total, 1.0) if total else 1.0,
+                                      text=f"Copied {copied:,} / {total:,} pages")
+            
+            result = db.backup_database(BACKUP_DIR, user['user_id'], user['username'], user['role'],
+                                        compress=compress, encrypt=encrypt, keep=7,
+                                        progress_callback=report_pages)
+            progress_bar.progress(1.0, text="Backup complete")
+            st.success(f"Saved {result['name']}: {result['size_bytes'] / 1024 / 1024:.1f} MB "
+                       f"(database {result['database_bytes'] / 1024 / 1024:.1f} MB) in {result['seconds']:.2f}s")
+    
+    backups = list_backups(BACKUP_DIR)
+    if backups:
+        df_backups = pd.DataFrame([(b['name'], f"{b['size_bytes'] / 1024 / 1024:.2f}",
+                                    datetime.fromtimestamp(b['modified']).strftime('%Y-%m-%d %H:%M:%S'))
+                                   for b in backups], columns=['Backup', 'Size (MB)', 'Created'])
+        st.dataframe(df_backups, use_container_width=True, hide_index=True)
+    else:
+        st.info("No backups yet.")
+    
+    scheduler_stats = db.get_backup_scheduler_stats()
+    if scheduler_stats:
+        st.caption(f"Scheduled backup every {scheduler_stats['interval_seconds'] // 3600} h, "
+                   f"keeping the last {scheduler_stats['keep']} | next run: {scheduler_stats['next_run'] or 'pending'}"
+                   + (f" | last error: {scheduler_stats['last_error']}" if scheduler_stats['last_error'] else ""))
+    
+    # Database performance statistics
+    st.markdown("---")
+    with st.expander("Database Performance Statistics"):
+        cache_stats = db.get_cache_stats()
+        if cache_stats:
+            col_a, col_b, col_c = st.columns(3)
+            with col_a:
+                st.metric("Cache Hit Rate", f"{cache_stats['hit_rate']*100:.1f}%")
+            with col_b:
+                st.metric("Cache Hits / Misses", f"{cache_stats['hits']} / {cache_stats['misses']}")
+            with col_c:
+                st.metric("Cached Queries", f"{cache_stats['entries']} / {cache_stats['max_entries']}")
+            if st.button("Clear Query Cache", use_container_width=True):
+                db.clear_cache()
+                st.rerun()
+        else:
+            st.info("Query caching is disabled.")
+        
+        st.markdown("**Query Cache**")
+        st.json(cache_stats or {})
+        st.markdown("**Connection Pool**")
+        st.json(db.get_pool_stats())
+        st.markdown("**Audit Log Writer**")
+        writer_stats = db.get_log_writer_stats()
+        if writer_stats.get('last_error'):
+            st.warning(f"Audit log writer error: {writer_stats['last_error']}")
+        st.json(writer_stats)
+        st.markdown("**Decryption Cache**")
+        st.json(db.get_decryption_cache_stats() or {})
+        
+        st.markdown("**Storage**")
+        storage = db.get_storage_stats()
+        st.json(storage)
+        if storage['auto_vacuum'] != 'incremental':
+            st.caption("Deleted records leave free pages in the file until the database is vacuumed. "
+                       "Enabling incremental vacuum runs one full VACUUM; later deletes reclaim their pages.")
+            if st.button("Enable Incremental Vacuum", use_container_width=True):
+                with st.spinner("Vacuuming database..."):
+                    db.enable_incremental_vacuum()
+                db.log_action(user['user_id'], user['username'], user['role'], 'enable_incremental_vacuum',
+                              'Converted database to incremental auto-vacuum')
+                st.rerun()
 
 def show_audit_logs(user):
     """Display audit logs for integrity monitoring"""
@@ -544,39 +887,56 @@ def show_audit_logs(user):
         </div>
     """, unsafe_allow_html=True)
     
-    logs = db.get_all_logs()
+    filter_values = db.get_log_filter_values()
     
-    if logs:
-        # Filters
+    if filter_values['actions']:
+        # Filters (applied in SQL)
         col1, col2, col3 = st.columns(3)
         
-        df_logs = pd.DataFrame(logs, columns=['Log ID', 'Username', 'Role', 'Action', 'Timestamp', 'Details'])
-        
         with col1:
-            filter_role = st.multiselect("Filter by Role", df_logs['Role'].unique(), default=df_logs['Role'].unique())
+            filter_role = st.multiselect("Filter by Role", filter_values['roles'], default=filter_values['roles'])
         
         with col2:
-            filter_action = st.multiselect("Filter by Action", df_logs['Action'].unique(), default=df_logs['Action'].unique())
+            filter_action = st.multiselect("Filter by Action", filter_values['actions'], default=filter_values['actions'])
         
         with col3:
-            limit = st.selectbox("Show Records", [10, 25, 50, 100, "All"], index=0)
+            limit = st.selectbox("Show Records", [10, 25, 50, 100], index=0)
+        
+        col4, col5, col6 = st.columns(3)
+        
+        with col4:
+            filter_user = st.multiselect("Filter by User", filter_values['users'])
+        
+        with col5:
+            date_range = st.date_input("Date Range", value=[])
         
-        # Apply filters
-        filtered_df = df_logs[
-            (df_logs['Role'].isin(filter_role)) &
-            (df_logs['Action'].isin(filter_action))
-        ]
+        with col6:
+            search_text = st.text_input("Search Details", placeholder="e.g. patient ID")
         
-        if limit != "All":
-            filtered_df = filtered_df.head(limit)
+        # Selecting every option needs no SQL filter; an empty user filter means all users
+        filters = {
+            'roles': None if set(filter_role) == set(filter_values['roles']) else filter_role,
+            'actions': None if set(filter_action) == set(filter_values['actions']) else filter_action,
+            'users': filter_user or None,
+            'since': None,
+            'until': None,
+            'text': search_text.strip() or None,
+        }
+        if len(date_range) == 2:
+            filters['since'] = date_range[0]
+            filters['until'] = date_range[1] + timedelta(days=1)
         
+        page = paginate("audit_logs", lambda cursor, direction: db.query_logs(
+            limit=limit, cursor=cursor, direction=direction, **filters),
+            reset_on=(repr(filters), limit))
+        
+        filtered_df = pd.DataFrame(page['rows'], columns=['Log ID', 'Username', 'Role', 'Action', 'Timestamp', 'Details'])
         st.dataframe(filtered_df, use_container_width=True, hide_index=True)
         
         # Export logs
-        csv_data = db.export_logs_csv()
         st.download_button(
             label="Download Audit Logs (CSV)",
-            data=csv_data,
+            data=lambda: read_export('logs'),
             file_name=f"audit_logs_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
             mime="text/csv"
         )
@@ -588,15 +948,13 @@ def show_audit_logs(user):
         col_a, col_b, col_c = st.columns(3)
         
         with col_a:
-            st.metric("Total Log Entries", len(df_logs))
+            st.metric("Total Log Entries", db.get_statistics()['total_logs'])
         
         with col_b:
-            unique_users = df_logs['Username'].nunique()
-            st.metric("Unique Users", unique_users)
+            st.metric("Unique Users", len(filter_values['users']))
         
         with col_c:
-            unique_actions = df_logs['Action'].nunique()
-            st.metric("Action Types", unique_actions)
+            st.metric("Action Types", len(filter_values['actions']))
         
     else:
         st.info("No audit logs available yet.")
@@ -608,7 +966,7 @@ def show_analytics():
     # Time range selector
     col1, col2 = st.columns([3, 1])
     with col1:
-        days = st.slider("Select Time Range (days)", 1, 30, 7)
+        days = st.slider("Select Time Range (days)", 1, 365, 7)
     with col2:
         if st.button("Refresh", use_container_width=True):
             st.rerun()
@@ -694,24 +1052,30 @@ def show_gdpr_compliance(user):
     
     with col2:
         # Show retention statistics
-        patients = db.get_patients(user['role'])
-        st.metric("Total Active Records", len(patients))
+        stats = db.get_statistics()
+        st.metric("Total Active Records", stats['total_patients'])
         st.info("Retention period: 30 days")
+        
+        sweeper_stats = db.get_retention_sweeper_stats()
+        if sweeper_stats:
+            st.caption(f"Automatic cleanup every {sweeper_stats['interval_seconds'] // 60} min | "
+                       f"last run: {sweeper_stats['last_run'] or 'pending'} | "
+                       f"removed so far: {sweeper_stats['total_deleted']}")
     
     st.markdown("---")
     
     # Consent Management
     st.markdown("### Consent Management")
-    patients = db.get_patients(user['role'])
+    total_patients = stats['total_patients']
     
-    if patients:
-        consent_given = sum(1 for p in patients if p[6] == 1)
-        consent_rate = (consent_given / len(patients)) * 100 if patients else 0
+    if total_patients:
+        consent_given = stats['patients_with_consent']
+        consent_rate = (consent_given / total_patients) * 100
         
         col_a, col_b = st.columns(2)
         
         with col_a:
-            st.metric("Patients with Consent", f"{consent_given} / {len(patients)}")
+            st.metric("Patients with Consent", f"{consent_given} / {total_patients}")
         
         with col_b:
             st.metric("Consent Rate", f"{consent_rate:.1f}%")
@@ -719,7 +1083,7 @@ def show_gdpr_compliance(user):
         # Consent pie chart
         fig_consent = go.Figure(data=[go.Pie(
             labels=['Consent Given', 'No Consent'],
-            values=[consent_given, len(patients) - consent_given],
+            values=[consent_given, total_patients - consent_given],
             hole=.3,
             marker_colors=['#2ecc71', '#e74c3c']
         )])
@@ -730,6 +1094,25 @@ def show_gdpr_compliance(user):
     
     st.markdown("---")
     
+    # Data subject requests (access history and portability)
+    st.markdown("### Data Subject Requests")
+    subject_id = st.number_input("Patient ID", min_value=1, step=1, key="subject_patient_id")
+    history = db.get_patient_access_history(subject_id, limit=100)
+    if history:
+        st.dataframe(pd.DataFrame(history, columns=['Log ID', 'Username', 'Role', 'Action', 'Timestamp', 'Details']),
+                     use_container_width=True, hide_index=True)
+    else:
+        st.info("No recorded access for this patient.")
+    st.download_button(
+        label="Download Patient Data (JSON)",
+        data=lambda: json.dumps(db.export_patient_data(subject_id, user['user_id'], user['username'],
+                                                       user['role']), indent=2),
+        file_name=f"patient_{subject_id}_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+        mime="application/json"
+    )
+    
+    st.markdown("---")
+    
     # GDPR Rights Summary
     st.markdown("### GDPR Rights Implementation")
     
@@ -741,7 +1124,7 @@ def show_gdpr_compliance(user):
             - Right to Access (role-based views)
             - Right to Rectification (edit patient records)
             - Right to Erasure (delete records)
-            - Right to Data Portability (CSV export)
+            - Right to Data Portability (CSV / per-patient JSON export)
             - Right to be Informed (consent banner)
         """)
     
@@ -753,6 +1136,7 @@ def show_gdpr_compliance(user):
             - Complete Audit Trail
             - Role-Based Access Control
             - Automated Data Retention
+            - Encrypted Online Backups
         """)
 
 def show_footer():
@@ -801,6 +1185,8 @@ def main():
                             st.session_state.user['role'], 
                             'logout', 
                             f"User {st.session_state.user['username']} logged out")
+                # Don't keep decrypted patient data in memory past the session
+                db.purge_decryption_cache()
                 st.session_state.logged_in = False
                 st.session_state.user = None
                 st.session_state.consent_shown = False
@@ -814,13 +1200,14 @@ def main():
                 - Availability: stable access & backup
             """)
         
-        # Route to appropriate dashboard
-        if st.session_state.user['role'] == 'admin':
-            admin_dashboard()
-        elif st.session_state.user['role'] == 'doctor':
-            doctor_dashboard()
-        else:
-            receptionist_dashboard()
+        # Route to appropriate dashboard; reads during this run share one snapshot
+        with db.read_context():
+            if st.session_state.user['role'] == 'admin':
+                admin_dashboard()
+            elif st.session_state.user['role'] == 'doctor':
+                doctor_dashboard()
+            else:
+                receptionist_dashboard()
         
         # Show footer
         show_footer()
@@ -0,0 +1,54 @@
+"""
+Cipher Benchmark Script
+Compares throughput and storage size of the Fernet and AES-GCM backends
+"""
+
+import argparse
+import time
+from cryptography.fernet import Fernet
+from database import CIPHER_BACKENDS, Cipher
+
+def sample_rows(count):
+    """Patient-like (name, contact, diagnosis) rows"""
+    return [(f'Patient Number {i}', f'555-{i % 1000:03d}-{i % 10000:04d}', 'Seasonal influenza, follow-up in 2 weeks')
+            for i in range(count)]
+
+def benchmark(backend, rows, key_ring):
+    """Encrypt and decrypt every field of rows; returns (encrypt rows/s, decrypt rows/s, bytes per row)"""
+    cipher = Cipher(key_ring, backend)
+    
+    start = time.perf_counter()
+    encrypted = [tuple(cipher.encrypt(value) for value in row) for row in rows]
+    encrypt_time = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    for row in encrypted:
+        for value in row:
+            cipher.decrypt(value)
+    decrypt_time = time.perf_counter() - start
+    
+    # Fernet tokens are stored as TEXT, AES-GCM values as BLOBs
+    stored = sum(len(value.encode() if isinstance(value, str) else value)
+                 for row in encrypted for value in row)
+    return len(rows) / encrypt_time, len(rows) / decrypt_time, stored / len(rows)
+
+def main():
+    """Main execution"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=20000, help='number of patient rows (default: 20000)')
+    args = parser.parse_args()
+    
+    rows = sample_rows(args.rows)
+    plaintext = sum(len(value.encode()) for row in rows for value in row) / len(rows)
+    key_ring = [(1, Fernet.generate_key())]
+    
+    print("🔐 Cipher Backend Benchmark")
+    print("="*60)
+    print(f"{args.rows:,} rows, 3 encrypted fields each, {plaintext:.0f} plaintext bytes per row\n")
+    print(f"{'Backend':10} {'Encrypt rows/s':>16} {'Decrypt rows/s':>16} {'Bytes/row':>12}")
+    for backend, name in CIPHER_BACKENDS.items():
+        encrypt_rate, decrypt_rate, size = benchmark(backend, rows, key_ring)
+        print(f"{name:10} {encrypt_rate:>16,.0f} {decrypt_rate:>16,.0f} {size:>12.0f}")
+
+if __name__ == "__main__":
+    main()
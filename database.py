@@ -4,477 +4,3140 @@ Handles SQLite database initialization, connections, and CRUD operations
 """
 
 import sqlite3
+import base64
 import hashlib
-from datetime import datetime
-from cryptography.fernet import Fernet
+import hmac
+import atexit
+import csv
+import functools
+import io
+import json
+import queue
+import shutil
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet, MultiFernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 import os
+import zlib
+import pandas as pd
+
+# PRAGMAs applied once to every pooled connection when it is opened
+SQLITE_PRAGMAS = {
+    # Must precede journal_mode: only takes effect before the first table is created
+    'auto_vacuum': 'INCREMENTAL', # deletes free pages for incremental_vacuum to reclaim
+    'journal_mode': 'WAL',        # readers never block the writer
+    'synchronous': 'NORMAL',      # safe with WAL, avoids an fsync per commit
+    'busy_timeout': 5000,         # wait up to 5s for locks instead of failing
+    'cache_size': -20000,         # ~20 MB page cache per connection
+    'mmap_size': 268435456,       # 256 MB memory-mapped I/O
+    'temp_store': 'MEMORY',
+}
+
+# Rebuilds the dashboard counters in stats_counters from the base tables
+RECOUNT_STATISTICS_SQL = '''
+    INSERT OR REPLACE INTO stats_counters (name, value)
+    SELECT 'patients_total', COUNT(*) FROM patients
+    UNION ALL SELECT 'patients_anonymized', COUNT(*) FROM patients WHERE is_anonymized = 1
+    UNION ALL SELECT 'patients_with_consent', COUNT(*) FROM patients WHERE consent_given = 1
+    UNION ALL SELECT 'logs_total', COUNT(*) FROM logs
+'''
+
+# Tables whose changes invalidate cached reads
+VERSIONED_TABLES = ('users', 'patients', 'logs', 'consent_records', 'jobs')
+
+
+def table_version_steps():
+    """Migration steps for table_versions and the triggers that bump it on every change"""
+    steps = [
+        '''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        ''',
+    ]
+    for table in VERSIONED_TABLES:
+        steps.append(f"INSERT OR IGNORE INTO table_versions (name, version) VALUES ('{table}', 0)")
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            steps.append(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()}
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE table_versions SET version = version + 1 WHERE name = '{table}';
+                END
+            ''')
+    return steps
+
+
+# Versioned schema migrations applied by DatabaseManager.migrate(). The last
+# applied version is stored in PRAGMA user_version. Steps are SQL strings or
+# callables taking a cursor. Append new migrations; never edit released ones.
+MIGRATIONS = [
+    (1, 'Secondary indexes for log, retention, anonymization and consent queries', [
+        # get_all_logs ORDER BY timestamp and the date-range analytics
+        'CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs(timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_logs_action_timestamp ON logs(action, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_logs_user_timestamp ON logs(user_id, timestamp)',
+        # is_anonymized filters; patient_id makes the job keyset scans index-ordered
+        'CREATE INDEX IF NOT EXISTS idx_patients_anonymized ON patients(is_anonymized, patient_id)',
+        'CREATE INDEX IF NOT EXISTS idx_patients_retention ON patients(data_retention_date)',
+        'CREATE INDEX IF NOT EXISTS idx_consent_patient ON consent_records(patient_id)',
+    ]),
+    (2, 'Indexes for audit log role/username filters and distinct-value lookups', [
+        'CREATE INDEX IF NOT EXISTS idx_logs_role ON logs(role)',
+        'CREATE INDEX IF NOT EXISTS idx_logs_username ON logs(username)',
+    ]),
+    (3, 'Per-day and per-hour activity rollups maintained by triggers on logs', [
+        '''
+        CREATE TABLE IF NOT EXISTS log_rollup_daily (
+            day TEXT NOT NULL,
+            action TEXT NOT NULL,
+            role TEXT NOT NULL,
+            username TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, action, role, username)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS log_rollup_hourly (
+            hour TEXT NOT NULL,
+            action TEXT NOT NULL,
+            role TEXT NOT NULL,
+            username TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (hour, action, role, username)
+        ) WITHOUT ROWID
+        ''',
+        # Backfill from existing logs (NULL role/username stored as '' so upserts match)
+        '''
+        INSERT INTO log_rollup_daily (day, action, role, username, count)
+        SELECT date(timestamp), action, COALESCE(role, ''), COALESCE(username, ''), COUNT(*)
+        FROM logs
+        WHERE timestamp IS NOT NULL
+        GROUP BY 1, 2, 3, 4
+        ''',
+        '''
+        INSERT INTO log_rollup_hourly (hour, action, role, username, count)
+        SELECT strftime('%Y-%m-%d %H:00:00', timestamp), action, COALESCE(role, ''),
+               COALESCE(username, ''), COUNT(*)
+        FROM logs
+        WHERE timestamp IS NOT NULL
+        GROUP BY 1, 2, 3, 4
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_logs_rollup_insert
+        AFTER INSERT ON logs WHEN NEW.timestamp IS NOT NULL
+        BEGIN
+            INSERT INTO log_rollup_daily (day, action, role, username, count)
+            VALUES (date(NEW.timestamp), NEW.action, COALESCE(NEW.role, ''), COALESCE(NEW.username, ''), 1)
+            ON CONFLICT (day, action, role, username) DO UPDATE SET count = count + 1;
+            INSERT INTO log_rollup_hourly (hour, action, role, username, count)
+            VALUES (strftime('%Y-%m-%d %H:00:00', NEW.timestamp), NEW.action,
+                    COALESCE(NEW.role, ''), COALESCE(NEW.username, ''), 1)
+            ON CONFLICT (hour, action, role, username) DO UPDATE SET count = count + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_logs_rollup_delete
+        AFTER DELETE ON logs WHEN OLD.timestamp IS NOT NULL
+        BEGIN
+            UPDATE log_rollup_daily SET count = count - 1
+            WHERE day = date(OLD.timestamp) AND action = OLD.action
+              AND role = COALESCE(OLD.role, '') AND username = COALESCE(OLD.username, '');
+            UPDATE log_rollup_hourly SET count = count - 1
+            WHERE hour = strftime('%Y-%m-%d %H:00:00', OLD.timestamp) AND action = OLD.action
+              AND role = COALESCE(OLD.role, '') AND username = COALESCE(OLD.username, '');
+        END
+        ''',
+    ]),
+    (4, 'Trigger-maintained counters for dashboard statistics', [
+        '''
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        ''',
+        RECOUNT_STATISTICS_SQL,
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_patients_count_insert
+        AFTER INSERT ON patients
+        BEGIN
+            UPDATE stats_counters SET value = value + 1 WHERE name = 'patients_total';
+            UPDATE stats_counters SET value = value + (NEW.is_anonymized IS 1) WHERE name = 'patients_anonymized';
+            UPDATE stats_counters SET value = value + (NEW.consent_given IS 1) WHERE name = 'patients_with_consent';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_patients_count_delete
+        AFTER DELETE ON patients
+        BEGIN
+            UPDATE stats_counters SET value = value - 1 WHERE name = 'patients_total';
+            UPDATE stats_counters SET value = value - (OLD.is_anonymized IS 1) WHERE name = 'patients_anonymized';
+            UPDATE stats_counters SET value = value - (OLD.consent_given IS 1) WHERE name = 'patients_with_consent';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_patients_count_update
+        AFTER UPDATE OF is_anonymized, consent_given ON patients
+        BEGIN
+            UPDATE stats_counters SET value = value + (NEW.is_anonymized IS 1) - (OLD.is_anonymized IS 1)
+            WHERE name = 'patients_anonymized';
+            UPDATE stats_counters SET value = value + (NEW.consent_given IS 1) - (OLD.consent_given IS 1)
+            WHERE name = 'patients_with_consent';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_logs_count_insert
+        AFTER INSERT ON logs
+        BEGIN
+            UPDATE stats_counters SET value = value + 1 WHERE name = 'logs_total';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_logs_count_delete
+        AFTER DELETE ON logs
+        BEGIN
+            UPDATE stats_counters SET value = value - 1 WHERE name = 'logs_total';
+        END
+        ''',
+    ]),
+    (5, 'Per-table change versions for query cache invalidation', table_version_steps()),
+    (6, 'Encryption key version of each patient row', [
+        'ALTER TABLE patients ADD COLUMN key_version INTEGER',
+        # Everything encrypted so far used the original (version 1) key
+        'UPDATE patients SET key_version = 1 WHERE encrypted_name IS NOT NULL',
+        'CREATE INDEX IF NOT EXISTS idx_patients_key_version ON patients(key_version)',
+    ]),
+    (7, 'Keyed blind indexes for equality lookups on patient name and contact', [
+        'ALTER TABLE patients ADD COLUMN name_index BLOB',
+        'ALTER TABLE patients ADD COLUMN contact_index BLOB',
+        # Key version the blind indexes were computed with (NULL until indexed)
+        'ALTER TABLE patients ADD COLUMN index_version INTEGER',
+        'CREATE INDEX IF NOT EXISTS idx_patients_name_index ON patients(name_index)',
+        'CREATE INDEX IF NOT EXISTS idx_patients_contact_index ON patients(contact_index)',
+        'CREATE INDEX IF NOT EXISTS idx_patients_index_version ON patients(index_version)',
+    ]),
+    (8, 'Structured patient reference on audit log entries', [
+        'ALTER TABLE logs ADD COLUMN patient_id INTEGER',
+        'ALTER TABLE logs ADD COLUMN target_type TEXT',
+        # Recover the ID from existing update/delete entries; add_patient only logged the name
+        """UPDATE logs
+           SET patient_id = CAST(substr(details, instr(details, 'ID: ') + 4) AS INTEGER),
+               target_type = 'patient'
+           WHERE action IN ('update_patient', 'delete_patient') AND details LIKE '%patient ID: %'""",
+        # Partial index: most entries (logins, jobs) have no patient
+        'CREATE INDEX IF NOT EXISTS idx_logs_patient_timestamp ON logs(patient_id, timestamp) '
+        'WHERE patient_id IS NOT NULL',
+    ]),
+]
+
+# Activity rows since :cutoff, exact to the second but O(buckets): whole days
+# from the daily rollup, whole hours of the boundary day from the hourly
+# rollup, and raw (timestamp-indexed) logs only for the partial boundary hour
+ROLLUP_WINDOW_SQL = '''
+    SELECT day, action, role, username, count FROM log_rollup_daily
+    WHERE day > date(:cutoff)
+    UNION ALL
+    SELECT date(hour), action, role, username, count FROM log_rollup_hourly
+    WHERE hour > strftime('%Y-%m-%d %H:00:00', :cutoff) AND hour < date(:cutoff, '+1 day')
+    UNION ALL
+    SELECT date(timestamp), action, COALESCE(role, ''), COALESCE(username, ''), 1 FROM logs
+    WHERE timestamp >= :cutoff AND timestamp < strftime('%Y-%m-%d %H:00:00', :cutoff, '+1 hour')
+'''
+
+# Newest log rows sampled to judge whether a filtered page is found faster by
+# walking log_id backwards than through the filter indexes
+LOG_FILTER_SAMPLE = 1000
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of long-lived SQLite connections"""
+    
+    def __init__(self, db_name, max_size=8, timeout=10.0, pragmas=None):
+        self.db_name = db_name
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pragmas = dict(SQLITE_PRAGMAS if pragmas is None else pragmas)
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+    
+    def connect(self):
+        """Open a new connection with the configured PRAGMAs applied"""
+        conn = sqlite3.connect(self.db_name, check_same_thread=False,
+                               timeout=self.pragmas.get('busy_timeout', 5000) / 1000)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+    
+    def acquire(self):
+        """Check out a connection, opening one if the pool is not yet full"""
+        start = time.perf_counter()
+        waited = False
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError('Connection pool is closed')
+                can_create = self._created < self.max_size
+                if can_create:
+                    self._created += 1
+            
+            if can_create:
+                try:
+                    conn = self.connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                waited = True
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._timeouts += 1
+                    raise TimeoutError(
+                        f'No database connection available after {self.timeout}s '
+                        f'(pool size {self.max_size})')
+        
+        wait_time = time.perf_counter() - start
+        with self._lock:
+            self._checkouts += 1
+            if waited:
+                self._waits += 1
+                self._total_wait += wait_time
+                self._max_wait = max(self._max_wait, wait_time)
+        return conn
+    
+    def release(self, conn):
+        """Return a connection to the pool, discarding any open transaction"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # Broken connection - drop it so a fresh one is opened next time
+            conn.close()
+            with self._lock:
+                self._created -= 1
+            return
+        
+        with self._lock:
+            closed = self._closed
+            if closed:
+                self._created -= 1
+        if closed:
+            conn.close()
+        else:
+            self._idle.put(conn)
+    
+    def close(self):
+        """Close all idle connections; busy ones are closed when released"""
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                # Refresh query planner statistics for the indexes it used
+                conn.execute('PRAGMA optimize')
+            except sqlite3.Error:
+                pass
+            conn.close()
+            with self._lock:
+                self._created -= 1
+    
+    def stats(self):
+        """Return pool size and wait-time statistics"""
+        with self._lock:
+            idle = self._idle.qsize()
+            return {
+                'max_size': self.max_size,
+                'open': self._created,
+                'in_use': self._created - idle,
+                'idle': idle,
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'timeouts': self._timeouts,
+                'avg_wait_ms': (self._total_wait / self._waits * 1000) if self._waits else 0.0,
+                'max_wait_ms': self._max_wait * 1000,
+            }
+
+
+def mask_name(patient_id):
+    """Pseudonymous display name for an anonymized patient"""
+    return f"ANON_{patient_id:04d}"
+
+
+def mask_contact(contact):
+    """Mask a contact number, keeping only the last four digits"""
+    return "XXX-XXX-" + contact[-4:] if len(contact) >= 4 else "XXX-XXX-XXXX"
+
+
+# AES-GCM values are BLOBs: format byte, key version, 12-byte nonce, then
+# ciphertext with its 16-byte tag. Fernet values stay base64 TEXT tokens.
+AESGCM_FORMAT = 1
+AESGCM_HEADER = struct.Struct('>BH')
+AESGCM_NONCE_SIZE = 12
+CIPHER_BACKENDS = {'fernet': 'Fernet', 'aesgcm': 'AES-GCM'}  # backend -> display name
+BLIND_INDEX_SIZE = 16  # truncated HMAC-SHA256; collisions are filtered by the exact match
+
+# Encrypted backups: header (magic, key version), then AES-GCM frames of up to
+# BACKUP_CHUNK_SIZE plaintext bytes. Each frame is (ciphertext length, last
+# flag, nonce, ciphertext) and authenticates its index and last flag, so
+# reordered or truncated files fail to decrypt.
+BACKUP_DIR = 'backups'
+BACKUP_PREFIX = 'hospital_backup_'
+BACKUP_MAGIC = b'HMSBAK'
+BACKUP_HEADER = struct.Struct('>6sH')
+BACKUP_FRAME = struct.Struct('>IB')
+BACKUP_CHUNK_SIZE = 1 << 20
+
+
+def normalize_lookup(field, value):
+    """Canonical form of a name or contact for blind indexing"""
+    if field == 'contact':
+        return ''.join(ch for ch in value if ch.isdigit())
+    return ' '.join(value.casefold().split())
+
+
+class Cipher:
+    """Encrypts with the newest key using the chosen backend; decrypts either format
+    
+    'fernet' produces base64 TEXT tokens (AES-CBC + HMAC). 'aesgcm' produces
+    compact binary BLOBs (authenticated AES-256-GCM). Both backends share
+    the key ring; the AES and blind-index keys are derived from each Fernet
+    key with HKDF so key material is never reused across algorithms.
+    """
+    
+    def __init__(self, key_ring, backend='fernet'):
+        if backend not in CIPHER_BACKENDS:
+            raise ValueError(f"cipher backend must be one of {', '.join(CIPHER_BACKENDS)}")
+        self.backend = backend
+        self.key_version = key_ring[0][0]
+        self._fernet = MultiFernet([Fernet(key) for _, key in key_ring])
+        self._aesgcm = {version: AESGCM(self._derive_key(key, b'patient-data-aesgcm'))
+                        for version, key in key_ring}
+        self._index_keys = {version: self._derive_key(key, b'patient-blind-index')
+                            for version, key in key_ring}
+        self._backup_keys = {version: AESGCM(self._derive_key(key, b'database-backup'))
+                             for version, key in key_ring}
+    
+    @staticmethod
+    def _derive_key(fernet_key, info):
+        return HKDF(algorithm=hashes.SHA256(), length=32, salt=None,
+                    info=info).derive(base64.urlsafe_b64decode(fernet_key))
+    
+    def blind_index(self, field, value, key_version=None):
+        """Keyed HMAC of a normalized 'name' or 'contact' for indexed equality lookups"""
+        key = self._index_keys[key_version or self.key_version]
+        message = field.encode() + b'\0' + normalize_lookup(field, value).encode()
+        return hmac.new(key, message, hashlib.sha256).digest()[:BLIND_INDEX_SIZE]
+    
+    def blind_indexes(self, field, value):
+        """Blind index of value under every key in the ring (rows may lag behind a rotation)"""
+        return [self.blind_index(field, value, version) for version in self._index_keys]
+    
+    def encrypt(self, plaintext):
+        """Encrypt a string; returns a str (Fernet) or bytes (AES-GCM)"""
+        if self.backend == 'aesgcm':
+            nonce = os.urandom(AESGCM_NONCE_SIZE)
+            return (AESGCM_HEADER.pack(AESGCM_FORMAT, self.key_version) + nonce +
+                    self._aesgcm[self.key_version].encrypt(nonce, plaintext.encode(), None))
+        return self._fernet.encrypt(plaintext.encode()).decode()
+    
+    def decrypt(self, token):
+        """Decrypt a Fernet token (str) or AES-GCM blob (bytes) made with any key in the ring"""
+        if isinstance(token, str):
+            return self._fernet.decrypt(token.encode()).decode()
+        token = bytes(token)
+        fmt, key_version = AESGCM_HEADER.unpack_from(token)
+        if fmt != AESGCM_FORMAT:
+            raise ValueError(f'Unsupported ciphertext format: {fmt}')
+        if key_version not in self._aesgcm:
+            raise ValueError(f'Encryption key version {key_version} is not in the key ring')
+        nonce_end = AESGCM_HEADER.size + AESGCM_NONCE_SIZE
+        return self._aesgcm[key_version].decrypt(
+            token[AESGCM_HEADER.size:nonce_end], token[nonce_end:], None).decode()
+    
+    def encrypt_stream(self, chunks):
+        """Encrypt a byte stream into the backup file format with the newest key"""
+        aesgcm = self._backup_keys[self.key_version]
+        yield BACKUP_HEADER.pack(BACKUP_MAGIC, self.key_version)
+        index = 0
+        pending = b''
+        for chunk in chunks:
+            pending += chunk
+            # Hold back the final chunk until the stream ends so it can be flagged as last
+            while len(pending) > BACKUP_CHUNK_SIZE:
+                yield self._backup_frame(aesgcm, index, pending[:BACKUP_CHUNK_SIZE], False)
+                pending = pending[BACKUP_CHUNK_SIZE:]
+                index += 1
+        yield self._backup_frame(aesgcm, index, pending, True)
+    
+    @staticmethod
+    def _backup_frame(aesgcm, index, data, last):
+        nonce = os.urandom(AESGCM_NONCE_SIZE)
+        ciphertext = aesgcm.encrypt(nonce, data, struct.pack('>Q?', index, last))
+        return BACKUP_FRAME.pack(len(ciphertext), last) + nonce + ciphertext
+    
+    def decrypt_stream(self, f):
+        """Decrypt a backup file object written by encrypt_stream, yielding plaintext chunks"""
+        header = f.read(BACKUP_HEADER.size)
+        if len(header) < BACKUP_HEADER.size or not header.startswith(BACKUP_MAGIC):
+            raise ValueError('Not an encrypted backup file')
+        key_version = BACKUP_HEADER.unpack(header)[1]
+        if key_version not in self._backup_keys:
+            raise ValueError(f'Encryption key version {key_version} is not in the key ring')
+        aesgcm = self._backup_keys[key_version]
+        index = 0
+        while True:
+            frame = f.read(BACKUP_FRAME.size)
+            if len(frame) < BACKUP_FRAME.size:
+                raise ValueError('Backup file is truncated')
+            length, last = BACKUP_FRAME.unpack(frame)
+            nonce = f.read(AESGCM_NONCE_SIZE)
+            ciphertext = f.read(length)
+            if len(ciphertext) < length:
+                raise ValueError('Backup file is truncated')
+            try:
+                yield aesgcm.decrypt(nonce, ciphertext, struct.pack('>Q?', index, bool(last)))
+            except InvalidTag:
+                raise ValueError('Backup file is corrupt or was encrypted with a different key') from None
+            if last:
+                return
+            index += 1
+    
+    def rotate(self, token):
+        """Re-encrypt a value with the newest key (and this backend)"""
+        if isinstance(token, str) and self.backend == 'fernet':
+            return self._fernet.rotate(token.encode()).decode()
+        return self.encrypt(self.decrypt(token))
+
+
+def anonymize_rows(cipher_config, rows):
+    """Mask and encrypt (patient_id, name, contact, diagnosis) rows with the newest key
+    
+    Module-level so it can run in a ProcessPoolExecutor worker; cipher_config
+    is the (key_ring, backend) pair given to Cipher.
+    Returns parameter tuples for the anonymization UPDATE.
+    """
+    cipher = Cipher(*cipher_config)
+    key_version = cipher.key_version
+    
+    def encrypt(value):
+        return cipher.encrypt(value) if value else None
+    
+    results = []
+    for patient_id, name, contact, diagnosis in rows:
+        results.append((
+            mask_name(patient_id),
+            mask_contact(contact),
+            encrypt(name),
+            encrypt(contact),
+            encrypt(diagnosis),
+            key_version,
+            cipher.blind_index('name', name),
+            cipher.blind_index('contact', contact),
+            key_version,
+            patient_id,
+        ))
+    return results
+
+
+def de_anonymize_rows(cipher_config, rows):
+    """Decrypt (patient_id, encrypted_name, encrypted_contact, encrypted_diagnosis) rows
+    
+    Rows missing any encrypted field are skipped.
+    Returns parameter tuples for the de-anonymization UPDATE.
+    """
+    cipher = Cipher(*cipher_config)
+    results = []
+    for patient_id, enc_name, enc_contact, enc_diagnosis in rows:
+        if enc_name and enc_contact and enc_diagnosis:
+            name = cipher.decrypt(enc_name)
+            contact = cipher.decrypt(enc_contact)
+            results.append((
+                name,
+                contact,
+                cipher.decrypt(enc_diagnosis),
+                cipher.blind_index('name', name),
+                cipher.blind_index('contact', contact),
+                cipher.key_version,
+                patient_id,
+            ))
+    return results
+
+
+def rotate_rows(cipher_config, rows):
+    """Re-encrypt (patient_id, encrypted_name, encrypted_contact, encrypted_diagnosis, key_version)
+    rows with the newest key
+    
+    Returns parameter tuples for the rotation UPDATE, which only applies if
+    the row is still on the key version it was read with.
+    """
+    cipher = Cipher(*cipher_config)
+    key_version = cipher.key_version
+    
+    def rotate(token):
+        return cipher.rotate(token) if token else None
+    
+    results = []
+    for patient_id, enc_name, enc_contact, enc_diagnosis, old_version in rows:
+        results.append((
+            rotate(enc_name),
+            rotate(enc_contact),
+            rotate(enc_diagnosis),
+            key_version,
+            patient_id,
+            old_version,
+        ))
+    return results
+
+
+def index_rows(cipher_config, rows):
+    """Compute blind indexes for (patient_id, name, contact, index_version) rows with the newest key
+    
+    Returns parameter tuples for the index UPDATE, which only applies if the
+    row is still on the index version it was read with.
+    """
+    cipher = Cipher(*cipher_config)
+    results = []
+    for patient_id, name, contact, old_version in rows:
+        results.append((
+            cipher.blind_index('name', name),
+            cipher.blind_index('contact', contact),
+            cipher.key_version,
+            patient_id,
+            old_version,
+        ))
+    return results
+
+
+# Bulk import: accepted consent spellings, and the row checks applied in order
+# (a rejected row reports the first check it fails)
+CONSENT_VALUES = {'': 1, '1': 1, 'true': 1, 'yes': 1, 'y': 1, '0': 0, 'false': 0, 'no': 0, 'n': 0}
+IMPORT_MAX_LENGTHS = {'name': 100, 'contact': 20, 'diagnosis': 500}
+CONTACT_PATTERN = r'\+?[\d\s().-]+'
+
+
+def validate_patient_frame(df):
+    """Validate a chunk of imported patient rows with vectorized checks
+    
+    df needs name, contact and diagnosis columns; consent is optional and
+    defaults to given. Returns (valid, reasons): valid holds the cleaned
+    name, contact, diagnosis and consent (0/1) of accepted rows, reasons a
+    Series with the rejection reason of every other row.
+    """
+    missing = [column for column in IMPORT_MAX_LENGTHS if column not in df.columns]
+    if missing:
+        raise ValueError(f"Import file is missing column(s): {', '.join(missing)}")
+    
+    # Blank cells and JSON nulls both become empty strings
+    clean = pd.DataFrame({column: df[column].fillna('').astype(str).str.strip()
+                          for column in IMPORT_MAX_LENGTHS}, index=df.index)
+    consent_text = (df['consent'].fillna('').astype(str).str.strip().str.lower()
+                    if 'consent' in df.columns else pd.Series('', index=df.index))
+    clean['consent'] = consent_text.map(CONSENT_VALUES)
+    
+    checks = [(clean[column] == '', f'missing {column}') for column in IMPORT_MAX_LENGTHS]
+    checks += [(clean[column].str.len() > limit, f'{column} longer than {limit} characters')
+               for column, limit in IMPORT_MAX_LENGTHS.items()]
+    checks += [
+        (~clean['contact'].str.fullmatch(CONTACT_PATTERN) |
+         (clean['contact'].str.count(r'\d') < 7), 'invalid contact number'),
+        (clean['consent'].isna(), 'invalid consent value'),
+    ]
+    reasons = pd.Series('', index=df.index)
+    for failed, reason in checks:
+        reasons = reasons.mask((reasons == '') & failed, reason)
+    
+    accepted = reasons == ''
+    valid = clean[accepted].astype({'consent': int})
+    return valid, reasons[~accepted]
+
+
+def read_jsonl_chunks(source, chunk_size):
+    """Yield DataFrames of up to chunk_size JSON Lines records, every value read as text
+    
+    Numbers keep their original spelling (a contact of 5551234567 must not
+    become '5551234567.0' when a missing value turns the column to float).
+    """
+    f = open(source, 'rb') if isinstance(source, str) else source
+    try:
+        records = []
+        for number, line in enumerate(f, 1):
+            if isinstance(line, bytes):
+                line = line.decode('utf-8')
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line, parse_int=str, parse_float=str)
+            except ValueError as e:
+                raise ValueError(f'Invalid JSON on line {number}: {e}') from e
+            if not isinstance(record, dict):
+                raise ValueError(f'Line {number} is not a JSON object')
+            records.append(record)
+            if len(records) == chunk_size:
+                yield pd.DataFrame.from_records(records)
+                records = []
+        if records:
+            yield pd.DataFrame.from_records(records)
+    finally:
+        if f is not source:
+            f.close()
+
+
+def import_rows(cipher_config, encrypt, rows):
+    """Prepare validated (name, contact, diagnosis, consent) rows for insertion
+    
+    Computes blind indexes, plus the encrypted columns when encrypt is set.
+    Masked values embed the patient ID, so they are added at insert time.
+    Returns (name, contact, diagnosis, encrypted_name, encrypted_contact,
+    encrypted_diagnosis, key_version, name_index, contact_index,
+    index_version, consent) tuples.
+    """
+    cipher = Cipher(*cipher_config)
+    key_version = cipher.key_version
+    results = []
+    for name, contact, diagnosis, consent in rows:
+        if encrypt:
+            encrypted = (cipher.encrypt(name), cipher.encrypt(contact), cipher.encrypt(diagnosis), key_version)
+        else:
+            encrypted = (None, None, None, None)
+        results.append((name, contact, diagnosis, *encrypted,
+                        cipher.blind_index('name', name), cipher.blind_index('contact', contact),
+                        key_version, consent))
+    return results
+
+
+# Resumable bulk jobs: rows after the job's checkpoint are selected in
+# patient_id order, transformed outside the transaction, then written back
+# together with the new checkpoint
+BULK_JOBS = {
+    'anonymize': {
+        'count': 'SELECT COUNT(*) FROM patients WHERE is_anonymized = 0',
+        'select': '''
+            SELECT patient_id, name, contact, diagnosis FROM patients
+            WHERE is_anonymized = 0 AND patient_id > ?
+            ORDER BY patient_id
+            LIMIT ?
+        ''',
+        'transform': anonymize_rows,
+        'update': '''
+            UPDATE patients
+            SET anonymized_name = ?,
+                anonymized_contact = ?,
+                encrypted_name = ?,
+                encrypted_contact = ?,
+                encrypted_diagnosis = ?,
+                key_version = ?,
+                name_index = ?,
+                contact_index = ?,
+                index_version = ?,
+                is_anonymized = 1
+            WHERE patient_id = ? AND is_anonymized = 0
+        ''',
+        'action': 'anonymize_data',
+        'message': 'Anonymized {count} patient records with {cipher} encryption',
+    },
+    'de_anonymize': {
+        'count': 'SELECT COUNT(*) FROM patients WHERE is_anonymized = 1',
+        'select': '''
+            SELECT patient_id, encrypted_name, encrypted_contact, encrypted_diagnosis
+            FROM patients
+            WHERE is_anonymized = 1 AND patient_id > ?
+            ORDER BY patient_id
+            LIMIT ?
+        ''',
+        'transform': de_anonymize_rows,
+        'update': '''
+            UPDATE patients
+            SET name = ?,
+                contact = ?,
+                diagnosis = ?,
+                name_index = ?,
+                contact_index = ?,
+                index_version = ?,
+                is_anonymized = 0
+            WHERE patient_id = ? AND is_anonymized = 1
+        ''',
+        'action': 'de_anonymize_data',
+        'message': 'De-anonymized {count} patient records',
+    },
+    'rotate_key': {
+        # Names of DatabaseManager attributes passed ahead of the job's own parameters
+        'params': ('key_version',),
+        'count': '''
+            SELECT COUNT(*) FROM patients
+            WHERE encrypted_name IS NOT NULL AND key_version != ?
+        ''',
+        'select': '''
+            SELECT patient_id, encrypted_name, encrypted_contact, encrypted_diagnosis, key_version
+            FROM patients
+            WHERE encrypted_name IS NOT NULL AND key_version != ? AND patient_id > ?
+            ORDER BY patient_id
+            LIMIT ?
+        ''',
+        'transform': rotate_rows,
+        'update': '''
+            UPDATE patients
+            SET encrypted_name = ?,
+                encrypted_contact = ?,
+                encrypted_diagnosis = ?,
+                key_version = ?
+            WHERE patient_id = ? AND key_version = ?
+        ''',
+        'action': 'rotate_key',
+        'message': 'Re-encrypted {count} patient records with key version {key_version}',
+    },
+    'blind_index': {
+        'params': ('key_version',),
+        'count': 'SELECT COUNT(*) FROM patients WHERE index_version IS NOT ?',
+        'select': '''
+            SELECT patient_id, name, contact, index_version
+            FROM patients
+            WHERE index_version IS NOT ? AND patient_id > ?
+            ORDER BY patient_id
+            LIMIT ?
+        ''',
+        'transform': index_rows,
+        'update': '''
+            UPDATE patients
+            SET name_index = ?,
+                contact_index = ?,
+                index_version = ?
+            WHERE patient_id = ? AND index_version IS ?
+        ''',
+        'action': 'rebuild_blind_index',
+        'message': 'Indexed {count} patient records with key version {key_version}',
+    },
+}
+
+
+# Insert errors that retrying cannot fix (unlike busy/locked OperationalErrors)
+PERMANENT_WRITE_ERRORS = (sqlite3.IntegrityError, sqlite3.ProgrammingError, sqlite3.InterfaceError)
+
+# A 'running' job without a checkpoint for this long is treated as abandoned
+JOB_STALE_SECONDS = 300
+
+
+class JobBusyError(RuntimeError):
+    """A bulk job is already running in this or another process"""
+
+
+def split_chunk(rows, parts):
+    """Split a list of rows into at most `parts` contiguous slices"""
+    size = max(1, -(-len(rows) // parts))
+    return [rows[i:i + size] for i in range(0, len(rows), size)]
+
+
+class AuditLogWriter:
+    """Background writer that group-commits queued audit log records"""
+    
+    INSERT_SQL = '''
+        INSERT INTO logs (user_id, username, role, action, details, timestamp, patient_id, target_type)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+    
+    def __init__(self, pool, batch_size=100, flush_interval_ms=200, max_queue_size=10000,
+                 submit_timeout=5.0):
+        self.pool = pool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.submit_timeout = submit_timeout
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._pending = []
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._max_depth = 0
+        self._flushes = 0
+        self._records_written = 0
+        self._direct_writes = 0
+        self._dropped = 0
+        self._errors = 0
+        self._last_error = None
+        self._last_flush_time = 0.0
+        self._total_flush_time = 0.0
+        self._max_flush_time = 0.0
+        self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+        self._thread.start()
+    
+    def submit(self, record):
+        """Queue a log record, waiting up to submit_timeout while the queue is full (backpressure)
+        
+        If the queue stays full (the writer is failing or far behind), the
+        record is committed directly instead; if that fails as well, a
+        RuntimeError reports the error together with the writer's last one.
+        """
+        if self._stopped.is_set():
+            raise RuntimeError('Audit log writer is stopped')
+        try:
+            self._queue.put(record, timeout=self.submit_timeout)
+        except queue.Full:
+            self._write_direct(record)
+            return
+        depth = self._queue.qsize()
+        with self._stats_lock:
+            self._max_depth = max(self._max_depth, depth)
+        if depth >= self.batch_size:
+            self._wakeup.set()
+    
+    def _write_direct(self, record):
+        """Commit one record past the full queue"""
+        try:
+            conn = self.pool.acquire()
+            try:
+                conn.execute(self.INSERT_SQL, record)
+                conn.commit()
+            finally:
+                self.pool.release(conn)
+        except Exception as e:
+            with self._stats_lock:
+                self._errors += 1
+                last_error, self._last_error = self._last_error, str(e)
+            raise RuntimeError(f'Audit log queue is full and a direct write failed: {e} '
+                               f'(last writer error: {last_error})') from e
+        with self._stats_lock:
+            self._direct_writes += 1
+    
+    def _write_batches(self):
+        """Drain the queue, committing up to batch_size records per transaction"""
+        written = 0
+        while True:
+            # Records stay in _pending until committed so a failed write is retried
+            while len(self._pending) < self.batch_size:
+                try:
+                    self._pending.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not self._pending:
+                return written
+            
+            start = time.perf_counter()
+            conn = self.pool.acquire()
+            try:
+                try:
+                    conn.executemany(self.INSERT_SQL, self._pending)
+                    count = len(self._pending)
+                except PERMANENT_WRITE_ERRORS:
+                    # Busy/locked errors propagate and the batch is retried later;
+                    # a record that can never be inserted must not block the rest
+                    conn.rollback()
+                    count = self._write_rows(conn)
+                conn.commit()
+            finally:
+                self.pool.release(conn)
+            elapsed = time.perf_counter() - start
+            
+            written += count
+            with self._stats_lock:
+                self._flushes += 1
+                self._records_written += count
+                self._last_flush_time = elapsed
+                self._total_flush_time += elapsed
+                self._max_flush_time = max(self._max_flush_time, elapsed)
+            self._pending = []
+    
+    def _write_rows(self, conn):
+        """Insert _pending one record at a time, dropping (and counting) those that fail permanently"""
+        count = 0
+        for record in self._pending:
+            try:
+                conn.execute(self.INSERT_SQL, record)
+                count += 1
+            except PERMANENT_WRITE_ERRORS as e:
+                with self._stats_lock:
+                    self._dropped += 1
+                    self._errors += 1
+                    self._last_error = f'Dropped audit record {record!r}: {e}'
+        return count
+    
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                with self._write_lock:
+                    self._write_batches()
+            except Exception as e:
+                with self._stats_lock:
+                    self._errors += 1
+                    self._last_error = str(e)
+    
+    def flush(self):
+        """Synchronously write every queued record; returns the number written"""
+        with self._write_lock:
+            return self._write_batches()
+    
+    def stop(self):
+        """Stop the writer thread after writing out remaining records"""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join()
+        self.flush()
+    
+    def stats(self):
+        """Return queue depth and flush latency statistics"""
+        with self._stats_lock:
+            return {
+                'queue_depth': self._queue.qsize() + len(self._pending),
+                'max_queue_depth': self._max_depth,
+                'flushes': self._flushes,
+                'records_written': self._records_written,
+                'direct_writes': self._direct_writes,
+                'dropped': self._dropped,
+                'errors': self._errors,
+                'last_error': self._last_error,
+                'last_flush_ms': self._last_flush_time * 1000,
+                'avg_flush_ms': (self._total_flush_time / self._flushes * 1000) if self._flushes else 0.0,
+                'max_flush_ms': self._max_flush_time * 1000,
+            }
+
+
+class RetentionSweeper:
+    """Background thread that periodically purges records past their retention date"""
+    
+    def __init__(self, db, interval_seconds=3600, batch_size=500):
+        self.db = db
+        self.interval = interval_seconds
+        self.batch_size = batch_size
+        self._stopped = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._runs = 0
+        self._total_deleted = 0
+        self._last_deleted = 0
+        self._last_run = None
+        self._errors = 0
+        self._last_error = None
+        self._thread = threading.Thread(target=self._run, name='retention-sweeper', daemon=True)
+        self._thread.start()
+    
+    def _run(self):
+        # Sweep immediately on start, then once per interval
+        while not self._stopped.is_set():
+            try:
+                deleted = self.db.check_data_retention(batch_size=self.batch_size)
+                with self._stats_lock:
+                    self._runs += 1
+                    self._total_deleted += deleted
+                    self._last_deleted = deleted
+                    self._last_run = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            except Exception as e:
+                with self._stats_lock:
+                    self._errors += 1
+                    self._last_error = str(e)
+            self._stopped.wait(self.interval)
+    
+    def stop(self):
+        """Stop the sweeper, waiting for a sweep in progress to finish"""
+        self._stopped.set()
+        self._thread.join()
+    
+    def stats(self):
+        """Return sweep counts and the last run time"""
+        with self._stats_lock:
+            return {
+                'interval_seconds': self.interval,
+                'batch_size': self.batch_size,
+                'runs': self._runs,
+                'total_deleted': self._total_deleted,
+                'last_deleted': self._last_deleted,
+                'last_run': self._last_run,
+                'errors': self._errors,
+                'last_error': self._last_error,
+            }
+
+
+class BackupScheduler:
+    """Background thread that takes a database snapshot every interval and prunes old ones"""
+    
+    def __init__(self, db, directory, interval_seconds=86400, keep=7, compress=True, encrypt=True):
+        self.db = db
+        self.directory = directory
+        self.interval = interval_seconds
+        self.keep = keep
+        self.compress = compress
+        self.encrypt = encrypt
+        self._stopped = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._runs = 0
+        self._last_backup = None
+        self._next_run = None
+        self._errors = 0
+        self._last_error = None
+        self._thread = threading.Thread(target=self._run, name='backup-scheduler', daemon=True)
+        self._thread.start()
+    
+    def _run(self):
+        while not self._stopped.is_set():
+            # Count from the newest snapshot on disk, so restarts do not trigger extra backups
+            backups = list_backups(self.directory)
+            age = time.time() - backups[0]['modified'] if backups else self.interval
+            wait = self.interval - age
+            if wait <= 0:
+                try:
+                    result = self.db.backup_database(self.directory, 0, 'system', 'system',
+                                                     compress=self.compress, encrypt=self.encrypt,
+                                                     keep=self.keep)
+                    with self._stats_lock:
+                        self._runs += 1
+                        self._last_backup = result
+                except Exception as e:
+                    with self._stats_lock:
+                        self._errors += 1
+                        self._last_error = str(e)
+                wait = self.interval
+            with self._stats_lock:
+                self._next_run = datetime.fromtimestamp(time.time() + wait).strftime('%Y-%m-%d %H:%M:%S')
+            self._stopped.wait(wait)
+    
+    def stop(self):
+        """Stop the scheduler, waiting for a backup in progress to finish"""
+        self._stopped.set()
+        self._thread.join()
+    
+    def stats(self):
+        """Return backup counts, the last result and the next scheduled run"""
+        with self._stats_lock:
+            return {
+                'directory': self.directory,
+                'interval_seconds': self.interval,
+                'keep': self.keep,
+                'runs': self._runs,
+                'last_backup': self._last_backup,
+                'next_run': self._next_run,
+                'errors': self._errors,
+                'last_error': self._last_error,
+            }
+
+
+def list_backups(directory):
+    """Backup files in directory, newest first, with their size and modification time"""
+    if not os.path.isdir(directory):
+        return []
+    backups = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.startswith(BACKUP_PREFIX) and os.path.isfile(path):
+            stat = os.stat(path)
+            backups.append({'name': name, 'path': path, 'size_bytes': stat.st_size,
+                            'modified': stat.st_mtime})
+    return sorted(backups, key=lambda backup: (backup['modified'], backup['name']), reverse=True)
+
+
+def backup_key_versions(directory):
+    """Key versions the encrypted backups in directory need in order to be restored"""
+    versions = set()
+    for backup in list_backups(directory):
+        try:
+            with open(backup['path'], 'rb') as f:
+                header = f.read(BACKUP_HEADER.size)
+        except FileNotFoundError:
+            continue  # pruned meanwhile
+        if len(header) == BACKUP_HEADER.size and header.startswith(BACKUP_MAGIC):
+            versions.add(BACKUP_HEADER.unpack(header)[1])
+    return versions
+
+
+def prune_backups(directory, keep):
+    """Delete all but the newest `keep` backups; returns the names removed"""
+    removed = []
+    for backup in list_backups(directory)[keep:]:
+        os.remove(backup['path'])
+        removed.append(backup['name'])
+    return removed
+
+
+def read_file_chunks(path, chunk_size=BACKUP_CHUNK_SIZE):
+    """Yield a file's contents in chunks"""
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def gzip_chunks(chunks):
+    """Gzip-compress a byte stream"""
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def gunzip_chunks(chunks):
+    """Decompress a gzip byte stream"""
+    decompressor = zlib.decompressobj(wbits=31)
+    for chunk in chunks:
+        yield decompressor.decompress(chunk)
+    yield decompressor.flush()
+    if not decompressor.eof:
+        raise ValueError('Compressed backup is truncated')
+
+
+class QueryCache:
+    """Size-bounded LRU cache of read results with TTL and table-version invalidation"""
+    
+    def __init__(self, max_entries=256, ttl_seconds=300):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        self._expirations = 0
+        self._evictions = 0
+    
+    def get(self, key, versions):
+        """Return (hit, value); entries built from older table versions are dropped"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, entry_versions, expires_at = entry
+                if entry_versions != versions:
+                    self._invalidations += 1
+                    del self._entries[key]
+                elif time.monotonic() >= expires_at:
+                    self._expirations += 1
+                    del self._entries[key]
+                else:
+                    self._hits += 1
+                    self._entries.move_to_end(key)
+                    return True, value
+            self._misses += 1
+            return False, None
+    
+    def put(self, key, versions, value):
+        with self._lock:
+            self._entries[key] = (value, versions, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self):
+        """Return hit/miss counts and current size"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+                'invalidations': self._invalidations,
+                'expirations': self._expirations,
+                'evictions': self._evictions,
+            }
+
+
+def _freeze(value):
+    """Make call arguments hashable for use in a cache key"""
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = [_freeze(v) for v in value]
+        return tuple(sorted(items, key=repr)) if isinstance(value, (set, frozenset)) else tuple(items)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+def cached_read(*tables, flush_logs=False):
+    """Cache a DatabaseManager read method until one of `tables` changes
+    
+    The key is the method name plus its arguments (which include the role
+    where results are role-dependent). Cached results are shared between
+    sessions and must be treated as read-only. Inside a read_context() the
+    call is also memoized for the rest of the unit of work.
+    flush_logs=True writes out queued audit records first, for the audit
+    log views; counters and analytics may lag by one group commit.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            context = getattr(self._local, 'read_context', None)
+            if self.query_cache is None and context is None:
+                return method(self, *args, **kwargs)
+            if flush_logs:
+                # Queued audit records must be visible to (and versioned for) this read
+                self.flush_logs()
+            key = (method.__name__, _freeze(args), _freeze(kwargs))
+            if context is not None:
+                return context.read(key, tables, lambda versions: self._cached_call(
+                    key, versions, lambda: context.run(method, self, *args, **kwargs)))
+            return self._cached_call(key, self._table_versions(tables),
+                                     lambda: method(self, *args, **kwargs))
+        return wrapper
+    return decorator
+
+
+class ReadContext:
+    """Unit of work for one page render: memoized reads over a single read snapshot
+    
+    Reads run on a connection checked out of the separate read pool on first
+    use, so concurrent page renders never compete with writers for pool
+    slots. The read transaction is ended before this thread writes, flushes
+    the audit log or starts a long operation, so it never holds back WAL
+    checkpoints; the next read starts a new snapshot and recomputes memoized
+    results for the tables that changed.
+    """
+    
+    def __init__(self, db):
+        self.db = db
+        self.conn = None
+        self.memo = {}
+        self.versions = None
+        self.stale = True
+        self.reads = 0
+        self.hits = 0
+    
+    def invalidate(self):
+        """End the read transaction; the next read starts a new snapshot"""
+        if self.conn is not None and self.conn.in_transaction:
+            self.conn.rollback()
+        self.stale = True
+    
+    def _refresh_snapshot(self):
+        """Start a new read transaction if the previous one was ended"""
+        if not self.stale:
+            return
+        if self.conn is None:
+            self.conn = self.db.read_pool.acquire()
+        if self.conn.in_transaction:
+            self.conn.rollback()
+        self.conn.execute('BEGIN')
+        # Reading the versions inside the transaction pins the snapshot to them
+        snapshot = dict(self.conn.execute('SELECT name, version FROM table_versions'))
+        self.versions = {table: snapshot.get(table, 0) for table in VERSIONED_TABLES}
+        self.stale = False
+    
+    def read(self, key, tables, compute):
+        """Return the memoized result for key, calling compute(versions) on a miss"""
+        self.reads += 1
+        self._refresh_snapshot()
+        versions = tuple(self.versions[table] for table in tables)
+        entry = self.memo.get(key)
+        if entry is not None and entry[0] == versions:
+            self.hits += 1
+            return entry[1]
+        value = compute(versions)
+        self.memo[key] = (versions, value)
+        return value
+    
+    def run(self, method, *args, **kwargs):
+        """Call a read method with the snapshot connection as this thread's connection"""
+        local = self.db._local
+        if getattr(local, 'conn', None) is not None:
+            return method(*args, **kwargs)
+        local.conn = self.conn
+        try:
+            return method(*args, **kwargs)
+        finally:
+            local.conn = None
+    
+    def close(self):
+        """End the read transaction and return the connection to the read pool"""
+        if self.conn is not None:
+            self.db.read_pool.release(self.conn)
+            self.conn = None
+    
+    def stats(self):
+        """Read and memo hit counts for this unit of work"""
+        return {'reads': self.reads, 'hits': self.hits, 'entries': len(self.memo)}
+
 
 class DatabaseManager:
-    def __init__(self, db_name='hospital_management.db'):
+    def __init__(self, db_name='hospital_management.db', pool_size=8, pool_timeout=10.0,
+                 log_durability='group', log_batch_size=100, log_flush_interval_ms=200,
+                 log_queue_size=10000, cache_size=256, cache_ttl=300, encrypt_on_write=False,
+                 key_file='encryption.key', cipher_backend='fernet', decrypt_cache_size=0,
+                 decrypt_cache_ttl=300, log_submit_timeout=5.0, read_pool_size=32):
+        if log_durability not in ('strict', 'group'):
+            raise ValueError("log_durability must be 'strict' or 'group'")
         self.db_name = db_name
+        self.key_file = key_file
+        self.cipher_backend = cipher_backend
+        # Opt-in: decrypted plaintext held in memory, keyed by ciphertext hash
+        self.decrypt_cache = QueryCache(decrypt_cache_size, decrypt_cache_ttl) if decrypt_cache_size else None
         self.encryption_key = self._get_or_create_key()
-        self.cipher = Fernet(self.encryption_key)
+        self.pool = ConnectionPool(db_name, max_size=pool_size, timeout=pool_timeout)
+        # Read-context snapshots are held for a whole page render, so they
+        # get their own connections and never wait on (or starve) writers
+        self.read_pool = ConnectionPool(db_name, max_size=read_pool_size, timeout=pool_timeout)
+        self._local = threading.local()
+        self._active_jobs = set()
+        self._jobs_lock = threading.Lock()
+        self.retention_sweeper = None
+        self.backup_scheduler = None
+        self.backup_dirs = set()  # searched for encrypted backups before retiring keys
+        # Mask and encrypt patient rows as they are written instead of in a bulk sweep
+        self.encrypt_on_write = encrypt_on_write
+        self._export_dir = None
+        self._export_lock = threading.Lock()
         self.init_database()
+        
+        # Read cache, invalidated through table_versions. A dedicated connection
+        # watches PRAGMA data_version, which changes whenever any other
+        # connection (pooled or another process) commits.
+        self.query_cache = QueryCache(cache_size, cache_ttl) if cache_size else None
+        self._version_conn = self.pool.connect()
+        self._version_lock = threading.Lock()
+        self._data_version = None
+        self._versions = {}
+        
+        # Strict mode commits every audit event; group mode batches them in the background
+        self.log_durability = log_durability
+        self.log_writer = None
+        if log_durability == 'group':
+            self.log_writer = AuditLogWriter(self.pool, batch_size=log_batch_size,
+                                             flush_interval_ms=log_flush_interval_ms,
+                                             max_queue_size=log_queue_size,
+                                             submit_timeout=log_submit_timeout)
+        atexit.register(self.close)
     
     def _get_or_create_key(self):
-        """Get or create encryption key for Fernet"""
-        key_file = 'encryption.key'
-        if os.path.exists(key_file):
-            with open(key_file, 'rb') as f:
-                return f.read()
-        else:
+        """Get or create the encryption key ring; returns the current (newest) key
+        
+        The key file holds one "version:key" line per key. A file with a
+        single bare key, as originally created, is key version 1.
+        """
+        if not os.path.exists(self.key_file):
             key = Fernet.generate_key()
-            with open(key_file, 'wb') as f:
+            with open(self.key_file, 'wb') as f:
                 f.write(key)
-            return key
+        
+        key_ring = []
+        with open(self.key_file, 'rb') as f:
+            for line in f.read().split():
+                version, _, key = line.rpartition(b':')
+                key_ring.append((int(version) if version else 1, key))
+        key_ring.sort(reverse=True)
+        
+        self.key_ring = key_ring
+        self.key_version = key_ring[0][0]
+        self.cipher = Cipher(key_ring, self.cipher_backend)
+        return key_ring[0][1]
+    
+    def _save_key_ring(self, key_ring):
+        """Atomically rewrite the key file and reload the ring from it"""
+        tmp_path = self.key_file + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(b''.join(b'%d:%s\n' % (version, key) for version, key in key_ring))
+        os.replace(tmp_path, self.key_file)
+        self.encryption_key = self._get_or_create_key()
+        self.purge_decryption_cache()
+    
+    def add_encryption_key(self):
+        """Generate a new current key; older keys stay in the ring for decryption"""
+        version = self.key_version + 1
+        key_ring = [(version, Fernet.generate_key())] + self.key_ring
+        self._save_key_ring(key_ring)
+        return version
+    
+    def retire_encryption_keys(self, backup_dirs=None):
+        """Drop old keys that no patient row or encrypted backup uses any more; returns their versions
+        
+        Backups are looked for in backup_dirs, by default every directory
+        this manager has written or scheduled backups to.
+        """
+        with self.connection() as conn:
+            in_use = {row[0] for row in conn.execute('''
+                SELECT key_version FROM patients WHERE key_version IS NOT NULL
+                UNION
+                SELECT index_version FROM patients WHERE index_version IS NOT NULL
+            ''')}
+        for directory in (self.backup_dirs if backup_dirs is None else backup_dirs):
+            in_use |= backup_key_versions(directory)
+        retired = [v for v, _ in self.key_ring[1:] if v not in in_use]
+        if retired:
+            key_ring = [(v, key) for v, key in self.key_ring if v not in retired]
+            self._save_key_ring(key_ring)
+        return retired
     
     def get_connection(self):
-        """Create and return database connection"""
-        return sqlite3.connect(self.db_name, check_same_thread=False)
+        """Create and return a new (unpooled) database connection"""
+        return self.pool.connect()
+    
+    @contextmanager
+    def connection(self):
+        """Borrow a pooled connection; nested use in the same thread shares it"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+        
+        self._end_read_snapshot()
+        conn = self.pool.acquire()
+        self._local.conn = conn
+        changes = conn.total_changes
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            context = getattr(self._local, 'read_context', None)
+            if context is not None and conn.total_changes != changes:
+                context.invalidate()
+            self.pool.release(conn)
+    
+    def _end_read_snapshot(self):
+        """End this thread's read-context snapshot before a write, flush or long operation"""
+        context = getattr(self._local, 'read_context', None)
+        if context is not None and getattr(self._local, 'conn', None) is None:
+            context.invalidate()
+    
+    def get_pool_stats(self):
+        """Connection pool statistics for monitoring (read-context connections under 'read_pool')"""
+        stats = self.pool.stats()
+        stats['read_pool'] = self.read_pool.stats()
+        return stats
+    
+    def flush_logs(self):
+        """Write out queued audit log records (no-op in strict mode)"""
+        if self.log_writer:
+            self._end_read_snapshot()
+            return self.log_writer.flush()
+        return 0
+    
+    def get_log_writer_stats(self):
+        """Audit log writer queue depth and flush latency statistics"""
+        stats = {'durability': self.log_durability}
+        if self.log_writer:
+            stats.update(self.log_writer.stats())
+        return stats
+    
+    def _table_versions(self, tables):
+        """Current change versions of the given tables"""
+        with self._version_lock:
+            data_version = self._version_conn.execute('PRAGMA data_version').fetchone()[0]
+            if data_version != self._data_version:
+                self._versions = dict(self._version_conn.execute('SELECT name, version FROM table_versions'))
+                self._data_version = data_version
+            return tuple(self._versions.get(table, 0) for table in tables)
+    
+    def _cached_call(self, key, versions, compute):
+        """Serve key from the query cache if it was stored at these table versions"""
+        if self.query_cache is None:
+            return compute()
+        hit, value = self.query_cache.get(key, versions)
+        if hit:
+            return value
+        value = compute()
+        self.query_cache.put(key, versions, value)
+        return value
+    
+    @contextmanager
+    def read_context(self):
+        """Memoize reads and share one read snapshot for the duration of the block
+        
+        Meant to wrap a single script run. Nested use in the same thread
+        joins the outer context. Writes still go through their own
+        connection; reads after them see the written data.
+        """
+        context = getattr(self._local, 'read_context', None)
+        if context is not None:
+            yield context
+            return
+        
+        context = ReadContext(self)
+        self._local.read_context = context
+        try:
+            yield context
+        finally:
+            self._local.read_context = None
+            context.close()
+    
+    def get_cache_stats(self):
+        """Query cache hit/miss statistics, or None if caching is disabled"""
+        if self.query_cache:
+            return self.query_cache.stats()
+        return None
+    
+    def clear_cache(self):
+        """Drop all cached read results"""
+        if self.query_cache:
+            self.query_cache.clear()
+    
+    def start_retention_sweeper(self, interval_seconds=3600, batch_size=500):
+        """Start purging expired records in the background (no-op if already running)"""
+        if self.retention_sweeper is None:
+            self.retention_sweeper = RetentionSweeper(self, interval_seconds, batch_size)
+        return self.retention_sweeper
+    
+    def get_retention_sweeper_stats(self):
+        """Background retention sweeper statistics, or None if it is not running"""
+        if self.retention_sweeper:
+            return self.retention_sweeper.stats()
+        return None
+    
+    def start_backup_scheduler(self, directory=BACKUP_DIR, interval_seconds=86400, keep=7,
+                               compress=True, encrypt=True):
+        """Start taking scheduled snapshots in the background (no-op if already running)"""
+        if self.backup_scheduler is None:
+            self.backup_dirs.add(directory)
+            self.backup_scheduler = BackupScheduler(self, directory, interval_seconds, keep,
+                                                    compress, encrypt)
+        return self.backup_scheduler
+    
+    def get_backup_scheduler_stats(self):
+        """Backup scheduler statistics, or None if it is not running"""
+        if self.backup_scheduler:
+            return self.backup_scheduler.stats()
+        return None
+    
+    def close(self):
+        """Stop background work, flush queued audit logs and close all pooled connections"""
+        if self.retention_sweeper:
+            self.retention_sweeper.stop()
+            self.retention_sweeper = None
+        if self.backup_scheduler:
+            self.backup_scheduler.stop()
+            self.backup_scheduler = None
+        if self.log_writer:
+            self.log_writer.stop()
+        self.pool.close()
+        self.read_pool.close()
+        with self._version_lock:
+            self._version_conn.close()
+        with self._export_lock:
+            if self._export_dir:
+                shutil.rmtree(self._export_dir, ignore_errors=True)
+                self._export_dir = None
+        self.purge_decryption_cache()
     
     def init_database(self):
         """Initialize database with tables and default data"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self.connection() as conn:
+            cursor = conn.cursor()
         
-        # Create users table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password TEXT NOT NULL,
-                role TEXT NOT NULL CHECK(role IN ('admin', 'doctor', 'receptionist')),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+            # Create users table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    username TEXT UNIQUE NOT NULL,
+                    password TEXT NOT NULL,
+                    role TEXT NOT NULL CHECK(role IN ('admin', 'doctor', 'receptionist')),
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
         
-        # Create patients table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS patients (
-                patient_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                contact TEXT NOT NULL,
-                diagnosis TEXT NOT NULL,
-                anonymized_name TEXT,
-                anonymized_contact TEXT,
-                encrypted_name TEXT,
-                encrypted_contact TEXT,
-                encrypted_diagnosis TEXT,
-                date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                is_anonymized INTEGER DEFAULT 0,
-                data_retention_date TIMESTAMP,
-                consent_given INTEGER DEFAULT 0
-            )
-        ''')
+            # Create patients table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS patients (
+                    patient_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    contact TEXT NOT NULL,
+                    diagnosis TEXT NOT NULL,
+                    anonymized_name TEXT,
+                    anonymized_contact TEXT,
+                    encrypted_name TEXT,
+                    encrypted_contact TEXT,
+                    encrypted_diagnosis TEXT,
+                    date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    is_anonymized INTEGER DEFAULT 0,
+                    data_retention_date TIMESTAMP,
+                    consent_given INTEGER DEFAULT 0
+                )
+            ''')
         
-        # Create logs table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS logs (
-                log_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                username TEXT,
-                role TEXT,
-                action TEXT NOT NULL,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                details TEXT,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
-        ''')
+            # Create logs table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS logs (
+                    log_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER,
+                    username TEXT,
+                    role TEXT,
+                    action TEXT NOT NULL,
+                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    details TEXT,
+                    FOREIGN KEY (user_id) REFERENCES users(user_id)
+                )
+            ''')
         
-        # Create consent_records table (GDPR compliance)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS consent_records (
-                consent_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                patient_id INTEGER,
-                consent_type TEXT,
-                consent_given INTEGER DEFAULT 1,
-                consent_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
-            )
-        ''')
+            # Create consent_records table (GDPR compliance)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS consent_records (
+                    consent_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    patient_id INTEGER,
+                    consent_type TEXT,
+                    consent_given INTEGER DEFAULT 1,
+                    consent_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
+                )
+            ''')
         
-        # Insert default users if not exists
-        try:
-            # Hash passwords for security
-            admin_pass = hashlib.sha256('admin123'.encode()).hexdigest()
-            doc_pass = hashlib.sha256('doc123'.encode()).hexdigest()
-            rec_pass = hashlib.sha256('rec123'.encode()).hexdigest()
-            
+            # Create jobs table (checkpoints for resumable bulk operations)
             cursor.execute('''
-                INSERT OR IGNORE INTO users (username, password, role) VALUES
-                ('admin', ?, 'admin'),
-                ('DrBob', ?, 'doctor'),
-                ('Alice_recep', ?, 'receptionist')
-            ''', (admin_pass, doc_pass, rec_pass))
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_type TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending'
+                        CHECK(status IN ('pending', 'running', 'paused', 'completed', 'failed')),
+                    last_patient_id INTEGER DEFAULT 0,
+                    processed_count INTEGER DEFAULT 0,
+                    total_count INTEGER DEFAULT 0,
+                    user_id INTEGER,
+                    username TEXT,
+                    role TEXT,
+                    error TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    finished_at TIMESTAMP
+                )
+            ''')
+        
+            # Insert default users if not exists
+            try:
+                # Hash passwords for security
+                admin_pass = hashlib.sha256('admin123'.encode()).hexdigest()
+                doc_pass = hashlib.sha256('doc123'.encode()).hexdigest()
+                rec_pass = hashlib.sha256('rec123'.encode()).hexdigest()
             
-            # Insert sample patients if table is empty
-            cursor.execute('SELECT COUNT(*) FROM patients')
-            if cursor.fetchone()[0] == 0:
-                sample_patients = [
-                    ('John Smith', '555-123-4567', 'Hypertension'),
-                    ('Emma Johnson', '555-987-6543', 'Type 2 Diabetes'),
-                    ('Michael Brown', '555-456-7890', 'Asthma'),
-                    ('Sarah Davis', '555-321-0987', 'Migraine'),
-                    ('David Wilson', '555-654-3210', 'Arthritis')
-                ]
-                for name, contact, diagnosis in sample_patients:
-                    cursor.execute('''
-                        INSERT INTO patients (name, contact, diagnosis, consent_given)
-                        VALUES (?, ?, ?, 1)
-                    ''', (name, contact, diagnosis))
+                cursor.execute('''
+                    INSERT OR IGNORE INTO users (username, password, role) VALUES
+                    ('admin', ?, 'admin'),
+                    ('DrBob', ?, 'doctor'),
+                    ('Alice_recep', ?, 'receptionist')
+                ''', (admin_pass, doc_pass, rec_pass))
             
-            conn.commit()
-        except sqlite3.IntegrityError:
-            pass
+                conn.commit()
+            except sqlite3.IntegrityError:
+                pass
         
-        conn.close()
+        self.migrate()
+        # Seeded after migrating so the sample patients get blind indexes
+        self._seed_sample_patients()
+    
+    def _seed_sample_patients(self):
+        """Insert sample patients if the table is empty"""
+        sample_patients = [
+            ('John Smith', '555-123-4567', 'Hypertension'),
+            ('Emma Johnson', '555-987-6543', 'Type 2 Diabetes'),
+            ('Michael Brown', '555-456-7890', 'Asthma'),
+            ('Sarah Davis', '555-321-0987', 'Migraine'),
+            ('David Wilson', '555-654-3210', 'Arthritis')
+        ]
+        with self.connection() as conn:
+            # Write lock first so two processes starting together seed only once
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if conn.execute('SELECT COUNT(*) FROM patients').fetchone()[0] == 0:
+                    conn.executemany('''
+                        INSERT INTO patients (name, contact, diagnosis, name_index, contact_index,
+                                              index_version, consent_given)
+                        VALUES (?, ?, ?, ?, ?, ?, 1)
+                    ''', [(name, contact, diagnosis, *self._index_values(name, contact))
+                          for name, contact, diagnosis in sample_patients])
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    
+    def get_schema_version(self):
+        """Return the schema version stored in PRAGMA user_version"""
+        with self.connection() as conn:
+            return conn.execute('PRAGMA user_version').fetchone()[0]
+    
+    def migrate(self):
+        """Apply pending schema migrations; returns the versions applied
+        
+        Each migration runs in its own IMMEDIATE transaction together with
+        the user_version bump, so a failed migration leaves the schema
+        unchanged and concurrent processes never apply the same one twice.
+        """
+        applied = []
+        with self.connection() as conn:
+            for version, description, steps in MIGRATIONS:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    # Re-check inside the write lock in case another process migrated
+                    if conn.execute('PRAGMA user_version').fetchone()[0] >= version:
+                        conn.rollback()
+                        continue
+                    cursor = conn.cursor()
+                    for step in steps:
+                        if callable(step):
+                            step(cursor)
+                        else:
+                            cursor.execute(step)
+                    cursor.execute(f'PRAGMA user_version = {int(version)}')
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                applied.append(version)
+        return applied
     
     def authenticate_user(self, username, password):
         """Authenticate user and return user details"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self.connection() as conn:
+            cursor = conn.cursor()
         
-        hashed_password = hashlib.sha256(password.encode()).hexdigest()
-        cursor.execute('''
-            SELECT user_id, username, role FROM users 
-            WHERE username = ? AND password = ?
-        ''', (username, hashed_password))
+            hashed_password = hashlib.sha256(password.encode()).hexdigest()
+            cursor.execute('''
+                SELECT user_id, username, role FROM users 
+                WHERE username = ? AND password = ?
+            ''', (username, hashed_password))
         
-        user = cursor.fetchone()
-        conn.close()
+            user = cursor.fetchone()
         
         if user:
             self.log_action(user[0], username, user[2], 'login', f'User {username} logged in')
             return {'user_id': user[0], 'username': user[1], 'role': user[2]}
         return None
     
-    def log_action(self, user_id, username, role, action, details=''):
-        """Log user action for audit trail"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    def log_action(self, user_id, username, role, action, details='', patient_id=None, target_type=None):
+        """Log user action for audit trail
         
-        cursor.execute('''
-            INSERT INTO logs (user_id, username, role, action, details)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (user_id, username, role, action, details))
+        Actions on a single patient pass patient_id (target_type defaults to
+        'patient') so the patient's access history is an indexed lookup.
+        """
+        if patient_id is not None and target_type is None:
+            target_type = 'patient'
+        self._write_log_records([(user_id, username, role, action, details, patient_id, target_type)])
+    
+    def log_patient_access(self, user_id, username, role, patient_ids, action='view_patient', details=''):
+        """Record one audit entry per patient whose record was shown to the user"""
+        self._write_log_records([(user_id, username, role, action, details, patient_id, 'patient')
+                                 for patient_id in patient_ids])
+    
+    def _write_log_records(self, records):
+        """Queue or insert (user_id, username, role, action, details, patient_id, target_type) records"""
+        if not records:
+            return
+        for record in records:
+            if not isinstance(record[3], str) or not record[3]:
+                raise ValueError(f'Audit log action must be a non-empty string, got {record[3]!r}')
+        if self.log_writer:
+            # Record the event time now; the rows are committed with the next batch
+            timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+            for *fields, patient_id, target_type in records:
+                self.log_writer.submit((*fields, timestamp, patient_id, target_type))
+            context = getattr(self._local, 'read_context', None)
+            if context is not None:
+                context.invalidate()
+            return
         
-        conn.commit()
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+        
+            cursor.executemany('''
+                INSERT INTO logs (user_id, username, role, action, details, patient_id, target_type)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', records)
+        
+            conn.commit()
     
+    @cached_read('logs', flush_logs=True)
     def get_all_logs(self):
         """Retrieve all logs (Admin only)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        self.flush_logs()
+        with self.connection() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute('''
+            cursor.execute('''
+                SELECT log_id, username, role, action, timestamp, details
+                FROM logs
+                ORDER BY timestamp DESC
+            ''')
+        
+            logs = cursor.fetchall()
+        return logs
+    
+    def _log_filters(self, roles=None, actions=None, users=None, since=None, until=None, text=None,
+                     use_indexes=True):
+        """Build a WHERE clause and parameters for audit log filters
+        
+        List filters left as None are not applied; an empty list matches
+        nothing. since is inclusive and until exclusive; both accept
+        datetime/date objects or 'YYYY-MM-DD HH:MM:SS' strings.
+        use_indexes=False writes the columns as +column so SQLite cannot
+        use their indexes and scans in log_id order instead.
+        """
+        hint = '' if use_indexes else '+'
+        conditions = []
+        params = []
+        for column, values in (('role', roles), ('action', actions), ('username', users)):
+            if values is None:
+                continue
+            values = list(values)
+            if not values:
+                conditions.append('0')
+                continue
+            conditions.append(f"{hint}{column} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+        for operator, value in (('>=', since), ('<', until)):
+            if value is None:
+                continue
+            if hasattr(value, 'strftime'):
+                value = value.strftime('%Y-%m-%d %H:%M:%S')
+            conditions.append(f'{hint}timestamp {operator} ?')
+            params.append(value)
+        if text:
+            escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            conditions.append("details LIKE ? ESCAPE '\\'")
+            params.append(f'%{escaped}%')
+        return 'WHERE ' + (' AND '.join(conditions) if conditions else '1 = 1'), params
+    
+    @cached_read('logs', flush_logs=True)
+    def query_logs(self, roles=None, actions=None, users=None, since=None, until=None, text=None,
+                   limit=50, cursor=None, direction='next'):
+        """Filtered, keyset-paginated audit log query (newest first)
+        
+        All filtering, ordering and limiting happens in SQL. Returns the
+        same page dict as get_logs_page().
+        """
+        self.flush_logs()
+        where, params = self._log_page_filters(roles, actions, users, since, until, text, limit)
+        select_sql = f'''
             SELECT log_id, username, role, action, timestamp, details
             FROM logs
-            ORDER BY timestamp DESC
-        ''')
+            {where}
+        '''
+        return self._keyset_page(select_sql, 'log_id', params, limit, cursor, direction)
+    
+    def _log_page_filters(self, roles, actions, users, since, until, text, limit):
+        """WHERE clause for one query_logs() page, choosing between index lookups and a log_id scan
         
-        logs = cursor.fetchall()
-        conn.close()
-        return logs
+        A filter index returns its matches in index order, so a broad filter
+        (most actions, every role) sorts nearly the whole table in a temp
+        B-tree to find the newest page. When the newest LOG_FILTER_SAMPLE
+        rows already hold a page of matches, walking log_id backwards finds
+        it after a few hundred rows, so the indexes are bypassed.
+        """
+        where, params = self._log_filters(roles, actions, users, since, until, text)
+        if where == 'WHERE 1 = 1':
+            return where, params
+        with self.connection() as conn:
+            matches = conn.execute(f'''
+                SELECT COUNT(*) FROM (
+                    SELECT role, action, username, timestamp, details FROM logs
+                    ORDER BY log_id DESC LIMIT ?
+                ) {where}
+            ''', [LOG_FILTER_SAMPLE] + params).fetchone()[0]
+        if matches > limit:
+            return self._log_filters(roles, actions, users, since, until, text, use_indexes=False)
+        return where, params
+    
+    @cached_read('logs', flush_logs=True)
+    def count_logs(self, roles=None, actions=None, users=None, since=None, until=None, text=None):
+        """Count audit log entries matching the same filters as query_logs()"""
+        self.flush_logs()
+        where, params = self._log_filters(roles, actions, users, since, until, text)
+        with self.connection() as conn:
+            return conn.execute(f'SELECT COUNT(*) FROM logs {where}', params).fetchone()[0]
+    
+    def _distinct_log_values(self, column):
+        """Distinct values of an indexed logs column via a loose index scan
+        
+        Each step seeks the next larger value in the index, so the cost
+        depends on the number of distinct values, not the number of rows.
+        """
+        with self.connection() as conn:
+            rows = conn.execute(f'''
+                WITH RECURSIVE distinct_values(value) AS (
+                    SELECT MIN({column}) FROM logs
+                    UNION ALL
+                    SELECT (SELECT MIN({column}) FROM logs WHERE {column} > value)
+                    FROM distinct_values
+                    WHERE value IS NOT NULL
+                )
+                SELECT value FROM distinct_values WHERE value IS NOT NULL
+            ''').fetchall()
+        return [row[0] for row in rows]
+    
+    @cached_read('logs', flush_logs=True)
+    def get_patient_access_history(self, patient_id, limit=None):
+        """Audit entries that touched one patient, newest first (served by the patient index)"""
+        self.flush_logs()
+        with self.connection() as conn:
+            return conn.execute('''
+                SELECT log_id, username, role, action, timestamp, details
+                FROM logs
+                WHERE patient_id = ?
+                ORDER BY timestamp DESC, log_id DESC
+                LIMIT ?
+            ''', (patient_id, -1 if limit is None else limit)).fetchall()
+    
+    @cached_read('logs')
+    def get_log_filter_values(self):
+        """Distinct roles, actions and usernames for populating log filters"""
+        return {
+            'roles': self._distinct_log_values('role'),
+            'actions': self._distinct_log_values('action'),
+            'users': self._distinct_log_values('username'),
+        }
+    
+    @cached_read('patients', 'logs')
+    def get_statistics(self):
+        """Dashboard counts (patients, anonymized, with consent, logs) from the counters table"""
+        with self.connection() as conn:
+            counters = dict(conn.execute('SELECT name, value FROM stats_counters').fetchall())
+        return {
+            'total_patients': counters.get('patients_total', 0),
+            'anonymized_patients': counters.get('patients_anonymized', 0),
+            'patients_with_consent': counters.get('patients_with_consent', 0),
+            'total_logs': counters.get('logs_total', 0),
+        }
+    
+    def recount_statistics(self):
+        """Rebuild the counters from the base tables (e.g. after manual edits)"""
+        with self.connection() as conn:
+            conn.execute(RECOUNT_STATISTICS_SQL)
+            conn.commit()
+        return self.get_statistics()
     
+    def _activity_cutoff(self, days):
+        """Start of an analytics window, in the logs table's UTC timestamp format"""
+        return (datetime.now(timezone.utc) - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+    
+    @cached_read('logs')
     def get_logs_by_date_range(self, days=7):
-        """Get logs for activity graphs"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        """Get logs for activity graphs (served from the activity rollups)"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT DATE(timestamp) as date, COUNT(*) as count
-            FROM logs
-            WHERE timestamp >= datetime('now', '-' || ? || ' days')
-            GROUP BY DATE(timestamp)
-            ORDER BY date
-        ''', (days,))
+            cursor.execute(f'''
+                SELECT day as date, SUM(count) as count
+                FROM ({ROLLUP_WINDOW_SQL})
+                GROUP BY day
+                HAVING SUM(count) > 0
+                ORDER BY date
+            ''', {'cutoff': self._activity_cutoff(days)})
         
-        logs = cursor.fetchall()
-        conn.close()
+            logs = cursor.fetchall()
         return logs
     
+    @cached_read('logs')
     def get_action_counts(self, days=7):
-        """Get action counts for graphs"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT action, COUNT(*) as count
-            FROM logs
-            WHERE timestamp >= datetime('now', '-' || ? || ' days')
-            GROUP BY action
-            ORDER BY count DESC
-        ''', (days,))
-        
-        actions = cursor.fetchall()
-        conn.close()
-        return actions
+        """Get action counts for graphs (served from the activity rollups)"""
+        return self.get_activity_breakdown(days, 'action')
+    
+    @cached_read('logs')
+    def get_activity_breakdown(self, days=7, dimension='action'):
+        """Activity counts over the last `days` days grouped by action, role or username"""
+        if dimension not in ('action', 'role', 'username'):
+            raise ValueError("dimension must be 'action', 'role' or 'username'")
+        with self.connection() as conn:
+            return conn.execute(f'''
+                SELECT NULLIF({dimension}, '') as {dimension}, SUM(count) as count
+                FROM ({ROLLUP_WINDOW_SQL})
+                GROUP BY {dimension}
+                HAVING SUM(count) > 0
+                ORDER BY count DESC
+            ''', {'cutoff': self._activity_cutoff(days)}).fetchall()
+    
+    @cached_read('logs')
+    def get_hourly_activity(self, hours=24):
+        """Hourly activity counts for the last `hours` hours"""
+        with self.connection() as conn:
+            return conn.execute('''
+                SELECT hour, SUM(count) as count
+                FROM log_rollup_hourly
+                WHERE hour >= strftime('%Y-%m-%d %H:00:00', 'now', '-' || ? || ' hours')
+                GROUP BY hour
+                HAVING SUM(count) > 0
+                ORDER BY hour
+            ''', (hours,)).fetchall()
     
     def encrypt_data(self, data):
-        """Encrypt data using Fernet"""
+        """Encrypt data with the configured cipher backend"""
         if data:
-            return self.cipher.encrypt(data.encode()).decode()
+            return self.cipher.encrypt(data)
         return None
     
     def decrypt_data(self, encrypted_data):
-        """Decrypt data using Fernet"""
-        if encrypted_data:
-            return self.cipher.decrypt(encrypted_data.encode()).decode()
+        """Decrypt data (Fernet token or AES-GCM blob), through the decryption cache if enabled"""
+        if not encrypted_data:
+            return None
+        if self.decrypt_cache is None:
+            return self.cipher.decrypt(encrypted_data)
+        
+        token = encrypted_data.encode() if isinstance(encrypted_data, str) else bytes(encrypted_data)
+        key = hashlib.sha256(token).digest()
+        # Entries are stamped with the current key version, so a key change invalidates them
+        hit, value = self.decrypt_cache.get(key, self.key_version)
+        if not hit:
+            value = self.cipher.decrypt(encrypted_data)
+            self.decrypt_cache.put(key, self.key_version, value)
+        return value
+    
+    def purge_decryption_cache(self):
+        """Drop all cached plaintext (call on logout; done automatically when keys change)"""
+        if self.decrypt_cache:
+            self.decrypt_cache.clear()
+    
+    def get_decryption_cache_stats(self):
+        """Decryption cache hit/miss statistics, or None if it is disabled"""
+        if self.decrypt_cache:
+            return self.decrypt_cache.stats()
         return None
     
-    def anonymize_patient_data(self, user_id, username, role):
-        """Anonymize all patient records with Fernet encryption (reversible)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT patient_id, name, contact, diagnosis FROM patients WHERE is_anonymized = 0')
-        patients = cursor.fetchall()
-        
-        anonymized_count = 0
-        for patient in patients:
-            patient_id, name, contact, diagnosis = patient
-            
-            # Create anonymized versions
-            anon_name = f"ANON_{patient_id:04d}"
-            anon_contact = "XXX-XXX-" + contact[-4:] if len(contact) >= 4 else "XXX-XXX-XXXX"
-            
-            # Encrypt original data (reversible with Fernet)
-            encrypted_name = self.encrypt_data(name)
-            encrypted_contact = self.encrypt_data(contact)
-            encrypted_diagnosis = self.encrypt_data(diagnosis)
-            
-            cursor.execute('''
-                UPDATE patients
-                SET anonymized_name = ?,
-                    anonymized_contact = ?,
-                    encrypted_name = ?,
-                    encrypted_contact = ?,
-                    encrypted_diagnosis = ?,
-                    is_anonymized = 1
-                WHERE patient_id = ?
-            ''', (anon_name, anon_contact, encrypted_name, encrypted_contact, 
-                  encrypted_diagnosis, patient_id))
-            
-            anonymized_count += 1
+    def anonymize_patient_data(self, user_id, username, role, chunk_size=500, workers=4,
+                               use_processes=False, progress_callback=None):
+        """Anonymize all patient records with reversible encryption (Fernet or AES-GCM)
         
-        conn.commit()
-        conn.close()
+        Runs as a resumable job: an interrupted anonymization is picked up
+        from its last checkpoint instead of starting over.
+        """
+        job_id = self.get_or_create_job('anonymize', user_id, username, role)
+        job = self.run_job(job_id, batch_size=chunk_size, workers=workers,
+                           use_processes=use_processes, progress_callback=progress_callback)
+        return job['processed_count']
+    
+    def de_anonymize_patient_data(self, user_id, username, role, chunk_size=500, workers=4,
+                                  use_processes=False, progress_callback=None):
+        """De-anonymize patient records (decrypt data) as a resumable job"""
+        job_id = self.get_or_create_job('de_anonymize', user_id, username, role)
+        job = self.run_job(job_id, batch_size=chunk_size, workers=workers,
+                           use_processes=use_processes, progress_callback=progress_callback)
+        return job['processed_count']
+    
+    def rotate_encryption_key(self, user_id, username, role, chunk_size=500, workers=4,
+                              use_processes=False, progress_callback=None):
+        """Switch to a new encryption key and re-encrypt all patient data with it
         
-        self.log_action(user_id, username, role, 'anonymize_data', 
-                       f'Anonymized {anonymized_count} patient records with Fernet encryption')
+        New writes use the new key at once while older keys stay readable, so
+        the app keeps serving during the rotation. Runs as a resumable job; a
+        new key is only generated when no earlier rotation is unfinished.
+        """
+        job_id = self._unfinished_job('rotate_key')
+        if job_id is None:
+            version = self.add_encryption_key()
+            self.log_action(user_id, username, role, 'add_encryption_key',
+                           f'Generated encryption key version {version}')
+            job_id = self.create_job('rotate_key', user_id, username, role)
+        job = self.run_job(job_id, batch_size=chunk_size, workers=workers,
+                           use_processes=use_processes, progress_callback=progress_callback)
+        if job['status'] == 'completed':
+            # Blind indexes are keyed per version too; bring them onto the new key
+            self.rebuild_blind_indexes(user_id, username, role, chunk_size, workers, use_processes)
+        return job['processed_count']
+    
+    def rebuild_blind_indexes(self, user_id, username, role, chunk_size=500, workers=4,
+                              use_processes=False, progress_callback=None):
+        """Compute missing or outdated blind indexes as a resumable job; returns rows indexed"""
+        job_id = self.get_or_create_job('blind_index', user_id, username, role)
+        job = self.run_job(job_id, batch_size=chunk_size, workers=workers,
+                           use_processes=use_processes, progress_callback=progress_callback)
+        return job['processed_count']
+    
+    @cached_read('patients')
+    def _key_version_counts(self):
+        """Encrypted patient rows per key version"""
+        with self.connection() as conn:
+            return dict(conn.execute('''
+                SELECT key_version, COUNT(*) FROM patients
+                WHERE key_version IS NOT NULL
+                GROUP BY key_version
+            ''').fetchall())
+    
+    @cached_read('patients')
+    def _stale_index_count(self, key_version):
+        """Patient rows whose blind indexes are missing or use an older key"""
+        with self.connection() as conn:
+            return conn.execute('SELECT COUNT(*) FROM patients WHERE index_version IS NOT ?',
+                                (key_version,)).fetchone()[0]
+    
+    def get_key_status(self):
+        """Current key version, key versions in the ring, encrypted rows per version
+        and rows needing a blind index rebuild"""
+        return {
+            'current_version': self.key_version,
+            'versions': [version for version, _ in self.key_ring],
+            'rows_by_version': self._key_version_counts(),
+            'stale_index_rows': self._stale_index_count(self.key_version),
+        }
+    
+    def create_job(self, job_type, user_id, username, role):
+        """Create a new bulk job and return its ID"""
+        if job_type not in BULK_JOBS:
+            raise ValueError(f'Unknown job type: {job_type}')
+        with self.connection() as conn:
+            total = conn.execute(BULK_JOBS[job_type]['count'],
+                                 self._job_params(BULK_JOBS[job_type])).fetchone()[0]
+            cursor = conn.execute('''
+                INSERT INTO jobs (job_type, total_count, user_id, username, role)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (job_type, total, user_id, username, role))
+            conn.commit()
+            return cursor.lastrowid
+    
+    def _job_params(self, spec):
+        """Leading query parameters a job spec takes from this manager (e.g. the key version)"""
+        return tuple(getattr(self, name) for name in spec.get('params', ()))
+    
+    def _unfinished_job(self, job_type):
+        """ID of the most recent unfinished job of this type, or None"""
+        with self.connection() as conn:
+            row = conn.execute('''
+                SELECT job_id FROM jobs
+                WHERE job_type = ? AND status IN ('pending', 'running', 'paused', 'failed')
+                ORDER BY job_id DESC
+                LIMIT 1
+            ''', (job_type,)).fetchone()
+        return row[0] if row else None
+    
+    def get_or_create_job(self, job_type, user_id, username, role):
+        """Return the unfinished job of this type if there is one, else create it"""
+        job_id = self._unfinished_job(job_type)
+        if job_id is not None:
+            return job_id
+        return self.create_job(job_type, user_id, username, role)
+    
+    def get_job(self, job_id):
+        """Return a job as a dict, or None if it does not exist"""
+        with self.connection() as conn:
+            cursor = conn.execute('SELECT * FROM jobs WHERE job_id = ?', (job_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return dict(zip([col[0] for col in cursor.description], row))
+    
+    @cached_read('jobs')
+    def list_jobs(self, limit=20):
+        """Most recent bulk jobs"""
+        with self.connection() as conn:
+            return conn.execute('''
+                SELECT job_id, job_type, status, processed_count, total_count,
+                       last_patient_id, username, created_at, updated_at, finished_at, error
+                FROM jobs
+                ORDER BY job_id DESC
+                LIMIT ?
+            ''', (limit,)).fetchall()
+    
+    def get_resumable_jobs(self):
+        """Unfinished jobs, including ones left 'running' by a crashed process"""
+        with self.connection() as conn:
+            job_ids = [row[0] for row in conn.execute('''
+                SELECT job_id FROM jobs
+                WHERE status IN ('pending', 'running', 'paused', 'failed')
+                ORDER BY job_id
+            ''')]
+        with self._jobs_lock:
+            return [job_id for job_id in job_ids if job_id not in self._active_jobs]
+    
+    def pause_job(self, job_id):
+        """Ask a running job to stop after its current batch"""
+        with self.connection() as conn:
+            cursor = conn.execute('''
+                UPDATE jobs SET status = 'paused', updated_at = CURRENT_TIMESTAMP
+                WHERE job_id = ? AND status IN ('pending', 'running')
+            ''', (job_id,))
+            conn.commit()
+            return cursor.rowcount > 0
+    
+    def _set_job_status(self, job_id, status, error=None):
+        with self.connection() as conn:
+            conn.execute('''
+                UPDATE jobs
+                SET status = ?, error = ?, updated_at = CURRENT_TIMESTAMP,
+                    finished_at = CASE WHEN ? = 'completed' THEN CURRENT_TIMESTAMP ELSE finished_at END
+                WHERE job_id = ?
+            ''', (status, error, status, job_id))
+            conn.commit()
+    
+    def _claim_job(self, job_id):
+        """Mark a job running unless another process is running it; returns True if claimed
         
-        return anonymized_count
+        A running job refreshes updated_at with every batch, so one that has
+        not checkpointed for JOB_STALE_SECONDS was left by a crashed process.
+        """
+        with self.connection() as conn:
+            cursor = conn.execute('''
+                UPDATE jobs SET status = 'running', error = NULL, updated_at = CURRENT_TIMESTAMP
+                WHERE job_id = ? AND (status != 'running' OR updated_at < datetime('now', ?))
+            ''', (job_id, f'-{JOB_STALE_SECONDS} seconds'))
+            conn.commit()
+            return cursor.rowcount > 0
     
-    def de_anonymize_patient_data(self, user_id, username, role):
-        """De-anonymize patient records (decrypt data)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    def run_job(self, job_id, batch_size=500, max_batches=None, workers=4,
+                use_processes=False, progress_callback=None):
+        """Run or resume a bulk job from its last checkpoint
         
-        cursor.execute('''
-            SELECT patient_id, encrypted_name, encrypted_contact, encrypted_diagnosis 
-            FROM patients WHERE is_anonymized = 1
-        ''')
-        patients = cursor.fetchall()
+        Each batch is read after the checkpoint, transformed across a worker
+        pool outside any transaction, then written back together with the new
+        checkpoint in one short transaction. A crash therefore loses at most
+        the batch in flight. The job stops as 'paused' after max_batches or
+        when pause_job() is called from another session.
+        progress_callback(processed, total, rows_per_sec) is called after each batch.
+        """
+        job = self.get_job(job_id)
+        if job is None:
+            raise ValueError(f'Unknown job: {job_id}')
+        if job['status'] == 'completed':
+            return job
+        spec = BULK_JOBS[job['job_type']]
+        
+        with self._jobs_lock:
+            if job_id in self._active_jobs:
+                raise JobBusyError(f'Job {job_id} is already running')
+            self._active_jobs.add(job_id)
+        if not self._claim_job(job_id):
+            with self._jobs_lock:
+                self._active_jobs.discard(job_id)
+            raise JobBusyError(f'Job {job_id} is already running in another process')
         
-        de_anonymized_count = 0
-        for patient in patients:
-            patient_id, enc_name, enc_contact, enc_diagnosis = patient
+        executor = None
+        try:
+            if workers and workers > 1:
+                executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+                executor = executor_class(max_workers=workers)
             
-            # Decrypt data
-            if enc_name and enc_contact and enc_diagnosis:
-                name = self.decrypt_data(enc_name)
-                contact = self.decrypt_data(enc_contact)
-                diagnosis = self.decrypt_data(enc_diagnosis)
+            start = time.perf_counter()
+            last_id = job['last_patient_id']
+            processed = job['processed_count']
+            processed_this_run = 0
+            batches = 0
+            status = 'completed'
+            while True:
+                if max_batches is not None and batches >= max_batches:
+                    status = 'paused'
+                    break
+                with self.connection() as conn:
+                    if conn.execute('SELECT status FROM jobs WHERE job_id = ?', (job_id,)).fetchone()[0] == 'paused':
+                        status = 'paused'
+                        break
+                    rows = conn.execute(spec['select'],
+                                        self._job_params(spec) + (last_id, batch_size)).fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
                 
-                cursor.execute('''
-                    UPDATE patients
-                    SET name = ?,
-                        contact = ?,
-                        diagnosis = ?,
-                        is_anonymized = 0
-                    WHERE patient_id = ?
-                ''', (name, contact, diagnosis, patient_id))
+                cipher_config = (self.key_ring, self.cipher_backend)
+                if executor:
+                    updates = []
+                    slices = split_chunk(rows, workers)
+                    for part in executor.map(spec['transform'], [cipher_config] * len(slices), slices):
+                        updates.extend(part)
+                else:
+                    updates = spec['transform'](cipher_config, rows)
                 
-                de_anonymized_count += 1
-        
-        conn.commit()
-        conn.close()
-        
-        self.log_action(user_id, username, role, 'de_anonymize_data', 
-                       f'De-anonymized {de_anonymized_count} patient records')
+                with self.connection() as conn:
+                    conn.executemany(spec['update'], updates)
+                    conn.execute('''
+                        UPDATE jobs
+                        SET last_patient_id = ?, processed_count = processed_count + ?,
+                            updated_at = CURRENT_TIMESTAMP
+                        WHERE job_id = ?
+                    ''', (last_id, len(updates), job_id))
+                    conn.commit()
+                
+                processed += len(updates)
+                processed_this_run += len(updates)
+                batches += 1
+                if progress_callback:
+                    elapsed = time.perf_counter() - start
+                    progress_callback(processed, max(job['total_count'], processed),
+                                      processed_this_run / elapsed if elapsed > 0 else 0.0)
+            
+            self._set_job_status(job_id, status)
+        except Exception as e:
+            self._set_job_status(job_id, 'failed', str(e))
+            raise
+        except BaseException:
+            # Interrupted (e.g. Ctrl-C): resumable from its checkpoint, so release the claim
+            self._set_job_status(job_id, 'paused', 'Interrupted')
+            raise
+        finally:
+            if executor:
+                executor.shutdown()
+            with self._jobs_lock:
+                self._active_jobs.discard(job_id)
         
-        return de_anonymized_count
+        if status == 'completed':
+            elapsed = time.perf_counter() - start
+            rate = processed_this_run / elapsed if elapsed > 0 else 0.0
+            self.log_action(job['user_id'], job['username'], job['role'], spec['action'],
+                           spec['message'].format(count=processed, key_version=self.key_version,
+                                                  cipher=CIPHER_BACKENDS[self.cipher_backend]) +
+                           f' (job {job_id}, {elapsed:.2f}s, {rate:.0f} rows/s)')
+        return self.get_job(job_id)
     
-    def get_patients(self, role, show_anonymized=False):
-        """Get patient data based on role"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
+    def _patient_columns(self, role, show_anonymized=False):
+        """SELECT column list for patient rows as visible to this role"""
         if role == 'admin' and not show_anonymized:
             # Admin can see raw data
-            cursor.execute('''
-                SELECT patient_id, name, contact, diagnosis, date_added, 
-                       is_anonymized, consent_given
+            return '''patient_id, name, contact, diagnosis, date_added, 
+                   is_anonymized, consent_given'''
+        # Admin viewing anonymized data, or Doctor / Receptionist (anonymized only)
+        return '''patient_id,
+                   CASE WHEN is_anonymized = 1 THEN anonymized_name ELSE name END as name,
+                   CASE WHEN is_anonymized = 1 THEN anonymized_contact ELSE contact END as contact,
+                   CASE WHEN is_anonymized = 1 THEN '[ENCRYPTED]' ELSE diagnosis END as diagnosis,
+                   date_added, is_anonymized, consent_given'''
+    
+    @cached_read('patients')
+    def get_patients(self, role, show_anonymized=False):
+        """Get patient data based on role"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT {self._patient_columns(role, show_anonymized)}
                 FROM patients
                 ORDER BY patient_id DESC
             ''')
-        elif role == 'admin' and show_anonymized:
-            # Admin viewing anonymized data
-            cursor.execute('''
-                SELECT patient_id, 
-                       CASE WHEN is_anonymized = 1 THEN anonymized_name ELSE name END as name,
-                       CASE WHEN is_anonymized = 1 THEN anonymized_contact ELSE contact END as contact,
-                       CASE WHEN is_anonymized = 1 THEN '[ENCRYPTED]' ELSE diagnosis END as diagnosis,
-                       date_added, is_anonymized, consent_given
+            patients = cursor.fetchall()
+        return patients
+    
+    def find_patients(self, role, contact=None, name=None, show_anonymized=False):
+        """Find patients by exact contact number and/or name through the blind indexes
+        
+        Matching ignores case and spacing in names and punctuation in contact
+        numbers. Each value is looked up under every key in the ring, so rows
+        not yet re-indexed after a key rotation are still found.
+        """
+        conditions, params = [], []
+        for field, value in (('contact', contact), ('name', name)):
+            if value:
+                indexes = self.cipher.blind_indexes(field, value)
+                conditions.append(f"{field}_index IN ({', '.join('?' * len(indexes))})")
+                params.extend(indexes)
+        if not conditions:
+            raise ValueError('find_patients needs a contact or a name')
+        
+        with self.connection() as conn:
+            return conn.execute(f'''
+                SELECT {self._patient_columns(role, show_anonymized)}
                 FROM patients
+                WHERE {' AND '.join(conditions)}
                 ORDER BY patient_id DESC
-            ''')
+            ''', params).fetchall()
+    
+    def _keyset_page(self, select_sql, key_column, params, page_size, cursor, direction):
+        """Fetch one page of a newest-first listing using keyset pagination
+        
+        select_sql must end with a WHERE clause that the key condition can be
+        ANDed onto. Returns a dict with 'rows', 'next_cursor' (older rows)
+        and 'prev_cursor' (newer rows); a cursor is None when there is no
+        page in that direction.
+        """
+        if direction not in ('next', 'prev'):
+            raise ValueError("direction must be 'next' or 'prev'")
+        
+        if cursor is None:
+            condition, order = '1 = 1', 'DESC'
+        elif direction == 'next':
+            condition, order = f'{key_column} < ?', 'DESC'
+            params = list(params) + [cursor]
         else:
-            # Doctor and Receptionist see anonymized data only
-            cursor.execute('''
-                SELECT patient_id,
-                       CASE WHEN is_anonymized = 1 THEN anonymized_name ELSE name END as name,
-                       CASE WHEN is_anonymized = 1 THEN anonymized_contact ELSE contact END as contact,
-                       CASE WHEN is_anonymized = 1 THEN '[ENCRYPTED]' ELSE diagnosis END as diagnosis,
-                       date_added, is_anonymized, consent_given
-                FROM patients
-                ORDER BY patient_id DESC
-            ''')
+            condition, order = f'{key_column} > ?', 'ASC'
+            params = list(params) + [cursor]
         
-        patients = cursor.fetchall()
-        conn.close()
-        return patients
+        with self.connection() as conn:
+            rows = conn.execute(f'''
+                {select_sql} AND {condition}
+                ORDER BY {key_column} {order}
+                LIMIT ?
+            ''', list(params) + [page_size + 1]).fetchall()
+        
+        # One extra row tells us whether another page exists in this direction
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if direction == 'prev' and cursor is not None:
+            rows.reverse()
+        
+        if not rows:
+            return {'rows': [], 'next_cursor': None, 'prev_cursor': None}
+        if cursor is None:
+            has_newer, has_older = False, has_more
+        elif direction == 'next':
+            has_newer, has_older = True, has_more
+        else:
+            has_newer, has_older = has_more, True
+        return {
+            'rows': rows,
+            'next_cursor': rows[-1][0] if has_older else None,
+            'prev_cursor': rows[0][0] if has_newer else None,
+        }
+    
+    @cached_read('patients')
+    def get_patients_page(self, role, show_anonymized=False, page_size=25, cursor=None, direction='next'):
+        """Get one page of patients (newest first), keyset-paginated on patient_id"""
+        select_sql = f'''
+            SELECT {self._patient_columns(role, show_anonymized)}
+            FROM patients
+            WHERE 1 = 1
+        '''
+        return self._keyset_page(select_sql, 'patient_id', [], page_size, cursor, direction)
+    
+    @cached_read('logs', flush_logs=True)
+    def get_logs_page(self, page_size=50, cursor=None, direction='next'):
+        """Get one page of logs (newest first), keyset-paginated on log_id"""
+        self.flush_logs()
+        select_sql = '''
+            SELECT log_id, username, role, action, timestamp, details
+            FROM logs
+            WHERE 1 = 1
+        '''
+        return self._keyset_page(select_sql, 'log_id', [], page_size, cursor, direction)
+    
+    def _protected_values(self, patient_id, name, contact, diagnosis):
+        """Masked and encrypted column values for one patient (as the anonymize job writes them)"""
+        return (mask_name(patient_id), mask_contact(contact), self.encrypt_data(name),
+                self.encrypt_data(contact), self.encrypt_data(diagnosis), self.key_version)
+    
+    def _index_values(self, name, contact):
+        """Blind index column values (name_index, contact_index, index_version) for one patient"""
+        return (self.cipher.blind_index('name', name), self.cipher.blind_index('contact', contact),
+                self.key_version)
+    
+    def _next_patient_id(self, cursor):
+        """Next AUTOINCREMENT patient_id; only stable while the write lock is held"""
+        cursor.execute('''
+            SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'patients'), 0),
+                       COALESCE(MAX(patient_id), 0)) + 1
+            FROM patients
+        ''')
+        return cursor.fetchone()[0]
     
     def add_patient(self, name, contact, diagnosis, user_id, username, role, consent=True):
-        """Add new patient record"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
+        """Add new patient record (already anonymized when encrypt_on_write is enabled)"""
         try:
-            # Calculate data retention date (30 days from now as per GDPR)
-            cursor.execute('''
-                INSERT INTO patients (name, contact, diagnosis, consent_given, data_retention_date)
-                VALUES (?, ?, ?, ?, datetime('now', '+30 days'))
-            ''', (name, contact, diagnosis, 1 if consent else 0))
-            
-            patient_id = cursor.lastrowid
-            
-            # Record consent
-            if consent:
-                cursor.execute('''
-                    INSERT INTO consent_records (patient_id, consent_type, consent_given)
-                    VALUES (?, 'data_processing', 1)
-                ''', (patient_id,))
-            
-            conn.commit()
-            
-            self.log_action(user_id, username, role, 'add_patient', 
-                           f'Added new patient: {name}')
-            
-            conn.close()
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                
+                # Calculate data retention date (30 days from now as per GDPR)
+                if self.encrypt_on_write:
+                    # The masked name embeds the patient ID, so allocate it under the write lock
+                    cursor.execute('BEGIN IMMEDIATE')
+                    patient_id = self._next_patient_id(cursor)
+                    cursor.execute('''
+                        INSERT INTO patients (patient_id, name, contact, diagnosis,
+                                              anonymized_name, anonymized_contact, encrypted_name,
+                                              encrypted_contact, encrypted_diagnosis, key_version,
+                                              name_index, contact_index, index_version,
+                                              is_anonymized, consent_given, data_retention_date)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, ?, datetime('now', '+30 days'))
+                    ''', (patient_id, name, contact, diagnosis,
+                          *self._protected_values(patient_id, name, contact, diagnosis),
+                          *self._index_values(name, contact), 1 if consent else 0))
+                else:
+                    cursor.execute('''
+                        INSERT INTO patients (name, contact, diagnosis, name_index, contact_index,
+                                              index_version, consent_given, data_retention_date)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now', '+30 days'))
+                    ''', (name, contact, diagnosis, *self._index_values(name, contact),
+                          1 if consent else 0))
+                    patient_id = cursor.lastrowid
+                
+                # Record consent
+                if consent:
+                    cursor.execute('''
+                        INSERT INTO consent_records (patient_id, consent_type, consent_given)
+                        VALUES (?, 'data_processing', 1)
+                    ''', (patient_id,))
+                
+                conn.commit()
+                
+                self.log_action(user_id, username, role, 'add_patient', 
+                               f'Added new patient: {name}', patient_id=patient_id)
+                
             return True, "Patient added successfully"
         except Exception as e:
-            conn.close()
             return False, f"Error adding patient: {str(e)}"
     
-    def update_patient(self, patient_id, name, contact, diagnosis, user_id, username, role):
-        """Update patient record"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    def import_patients(self, source, user_id, username, role, file_format=None, chunk_size=5000,
+                        encrypt=None, workers=4, use_processes=False, max_rejects=1000,
+                        progress_callback=None):
+        """Stream patient records from a CSV or JSON Lines file into the database
         
+        source is a path or a binary file object; file_format ('csv' or
+        'jsonl') is taken from the file name when not given. Each chunk of
+        chunk_size rows is validated with pandas, prepared across a worker pool
+        (encrypted when encrypt is set, which defaults to encrypt_on_write) and
+        inserted with its consent records in one short transaction, followed by
+        one summarized audit entry. Rows that fail validation are skipped.
+        progress_callback(processed, imported, rows_per_sec) is called after each chunk.
+        Returns import counts, up to max_rejects (row number, reason) pairs
+        with 1-based data row numbers, and throughput.
+        """
+        if file_format is None:
+            name = source if isinstance(source, str) else getattr(source, 'name', '')
+            file_format = 'jsonl' if name.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+        if file_format == 'csv':
+            chunks = pd.read_csv(source, dtype=str, keep_default_na=False, chunksize=chunk_size)
+        elif file_format == 'jsonl':
+            chunks = read_jsonl_chunks(source, chunk_size)
+        else:
+            raise ValueError("file_format must be 'csv' or 'jsonl'")
+        if encrypt is None:
+            encrypt = self.encrypt_on_write
+        
+        executor = None
+        if workers and workers > 1:
+            executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+            executor = executor_class(max_workers=workers)
+        
+        start = time.perf_counter()
+        processed = imported = rejected = 0
+        rejects = []
         try:
-            cursor.execute('''
-                UPDATE patients
-                SET name = ?, contact = ?, diagnosis = ?, is_anonymized = 0
-                WHERE patient_id = ?
-            ''', (name, contact, diagnosis, patient_id))
-            
-            conn.commit()
-            
-            self.log_action(user_id, username, role, 'update_patient', 
-                           f'Updated patient ID: {patient_id}')
-            
-            conn.close()
+            for chunk in chunks:
+                chunk.columns = [str(column).strip().lower() for column in chunk.columns]
+                # Row numbers continue across chunks
+                chunk.index = range(processed + 1, processed + len(chunk) + 1)
+                processed += len(chunk)
+                valid, reasons = validate_patient_frame(chunk)
+                rejected += len(reasons)
+                rejects.extend(list(reasons.items())[:max(0, max_rejects - len(rejects))])
+                if valid.empty:
+                    continue
+                
+                rows = list(valid.itertuples(index=False, name=None))
+                cipher_config = (self.key_ring, self.cipher_backend)
+                if executor:
+                    prepared = []
+                    slices = split_chunk(rows, workers)
+                    for part in executor.map(import_rows, [cipher_config] * len(slices),
+                                             [encrypt] * len(slices), slices):
+                        prepared.extend(part)
+                else:
+                    prepared = import_rows(cipher_config, encrypt, rows)
+                
+                first_id, last_id = self._insert_imported_rows(prepared, encrypt)
+                imported += len(prepared)
+                self.log_action(user_id, username, role, 'import_patients',
+                               f'Imported {len(prepared)} patient records (IDs {first_id}-{last_id}), '
+                               f'rejected {len(reasons)}')
+                if progress_callback:
+                    elapsed = time.perf_counter() - start
+                    progress_callback(processed, imported, processed / elapsed if elapsed > 0 else 0.0)
+        finally:
+            if executor:
+                executor.shutdown()
+        
+        elapsed = time.perf_counter() - start
+        return {
+            'processed': processed,
+            'imported': imported,
+            'rejected': rejected,
+            'rejects': rejects,
+            'encrypted': bool(encrypt),
+            'seconds': elapsed,
+            'rows_per_sec': processed / elapsed if elapsed > 0 else 0.0,
+        }
+    
+    def _insert_imported_rows(self, prepared, encrypted):
+        """Insert rows from import_rows and their consent records; returns the first and last patient ID"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            # Allocate a contiguous ID range under the write lock
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                first_id = self._next_patient_id(cursor)
+                patient_ids = range(first_id, first_id + len(prepared))
+                cursor.executemany('''
+                    INSERT INTO patients (patient_id, name, contact, diagnosis,
+                                          anonymized_name, anonymized_contact, encrypted_name,
+                                          encrypted_contact, encrypted_diagnosis, key_version,
+                                          name_index, contact_index, index_version,
+                                          is_anonymized, consent_given, data_retention_date)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now', '+30 days'))
+                ''', ((patient_id, name, contact, diagnosis,
+                       mask_name(patient_id) if encrypted else None,
+                       mask_contact(contact) if encrypted else None,
+                       *rest, 1 if encrypted else 0, consent)
+                      for patient_id, (name, contact, diagnosis, *rest, consent) in zip(patient_ids, prepared)))
+                cursor.executemany('''
+                    INSERT INTO consent_records (patient_id, consent_type, consent_given)
+                    VALUES (?, 'data_processing', 1)
+                ''', ((patient_id,) for patient_id, row in zip(patient_ids, prepared) if row[-1]))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return first_id, patient_ids[-1]
+    
+    def update_patient(self, patient_id, name, contact, diagnosis, user_id, username, role):
+        """Update patient record (re-encrypted in place when encrypt_on_write is enabled)"""
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                
+                if self.encrypt_on_write:
+                    cursor.execute('''
+                        UPDATE patients
+                        SET name = ?, contact = ?, diagnosis = ?,
+                            anonymized_name = ?, anonymized_contact = ?, encrypted_name = ?,
+                            encrypted_contact = ?, encrypted_diagnosis = ?, key_version = ?,
+                            name_index = ?, contact_index = ?, index_version = ?, is_anonymized = 1
+                        WHERE patient_id = ?
+                    ''', (name, contact, diagnosis,
+                          *self._protected_values(patient_id, name, contact, diagnosis),
+                          *self._index_values(name, contact), patient_id))
+                else:
+                    cursor.execute('''
+                        UPDATE patients
+                        SET name = ?, contact = ?, diagnosis = ?, name_index = ?, contact_index = ?,
+                            index_version = ?, is_anonymized = 0
+                        WHERE patient_id = ?
+                    ''', (name, contact, diagnosis, *self._index_values(name, contact), patient_id))
+                
+                conn.commit()
+                
+                self.log_action(user_id, username, role, 'update_patient', 
+                               f'Updated patient ID: {patient_id}', patient_id=patient_id)
+                
             return True, "Patient updated successfully"
         except Exception as e:
-            conn.close()
             return False, f"Error updating patient: {str(e)}"
     
     def delete_patient(self, patient_id, user_id, username, role):
         """Delete patient record (Admin only)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
         try:
-            # Delete associated consent records first
-            cursor.execute('DELETE FROM consent_records WHERE patient_id = ?', (patient_id,))
-            
-            # Delete patient
-            cursor.execute('DELETE FROM patients WHERE patient_id = ?', (patient_id,))
-            
-            conn.commit()
-            
-            self.log_action(user_id, username, role, 'delete_patient', 
-                           f'Deleted patient ID: {patient_id}')
-            
-            conn.close()
+            with self.connection() as conn:
+                # Consent records go with the patient, in the same transaction
+                self._delete_patient_batch(conn, [patient_id])
+                
+                self.log_action(user_id, username, role, 'delete_patient', 
+                               f'Deleted patient ID: {patient_id}', patient_id=patient_id)
+                
             return True, "Patient deleted successfully"
         except Exception as e:
-            conn.close()
             return False, f"Error deleting patient: {str(e)}"
     
-    def check_data_retention(self):
-        """Check and delete records past retention date"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    def _delete_patient_batch(self, conn, patient_ids):
+        """Delete patients and their consent records in one transaction; returns rows deleted"""
+        placeholders = ', '.join('?' * len(patient_ids))
+        conn.execute(f'DELETE FROM consent_records WHERE patient_id IN ({placeholders})', patient_ids)
+        deleted = conn.execute(f'DELETE FROM patients WHERE patient_id IN ({placeholders})', patient_ids).rowcount
+        conn.commit()
+        self._reclaim_free_pages(conn)
+        return deleted
+    
+    def _reclaim_free_pages(self, conn, max_pages=None):
+        """Return free pages to the filesystem with incremental_vacuum; returns pages reclaimed
         
-        cursor.execute('''
-            SELECT patient_id, name FROM patients
-            WHERE data_retention_date < datetime('now')
-        ''')
+        Only reclaims on databases using auto_vacuum = INCREMENTAL (see
+        enable_incremental_vacuum); otherwise freed pages stay reusable in the file.
+        """
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            return 0
+        before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if before:
+            # executescript steps the pragma to completion (execute frees only one page)
+            conn.executescript(f'PRAGMA incremental_vacuum({int(max_pages or before)})')
+        return before - conn.execute('PRAGMA freelist_count').fetchone()[0]
+    
+    def delete_patients(self, user_id, username, role, patient_ids=None, where=None, params=(),
+                        batch_size=500):
+        """Delete many patient records in bounded batches (Admin only)
+        
+        Patients are selected either by patient_ids or by a trusted SQL
+        predicate over the patients table (where, with params). Each batch of
+        up to batch_size patients is deleted in its own short transaction
+        with one summarized audit entry, and the pages it frees are reclaimed
+        by incremental vacuum. Returns the number of records deleted.
+        """
+        if (patient_ids is None) == (where is None):
+            raise ValueError('delete_patients needs either patient_ids or where')
+        if patient_ids is not None:
+            ids = sorted({int(patient_id) for patient_id in patient_ids})
+            batches = (ids[i:i + batch_size] for i in range(0, len(ids), batch_size))
+        else:
+            batches = self._matching_patient_batches(where, params, batch_size)
         
-        expired_records = cursor.fetchall()
+        total_deleted = 0
+        for batch in batches:
+            with self.connection() as conn:
+                deleted = self._delete_patient_batch(conn, batch)
+            if deleted:
+                total_deleted += deleted
+                self.log_action(user_id, username, role, 'bulk_delete_patients',
+                               f'Deleted {deleted} patient records: {", ".join(str(i) for i in batch)}')
+        return total_deleted
+    
+    def count_patients(self, patient_ids=None, where=None, params=()):
+        """Number of existing records delete_patients() would delete for the same selection"""
+        if (patient_ids is None) == (where is None):
+            raise ValueError('count_patients needs either patient_ids or where')
+        with self.connection() as conn:
+            if where is not None:
+                return conn.execute(f'SELECT COUNT(*) FROM patients WHERE {where}', params).fetchone()[0]
+            ids = sorted({int(patient_id) for patient_id in patient_ids})
+            count = 0
+            for i in range(0, len(ids), 500):
+                batch = ids[i:i + 500]
+                count += conn.execute(f'''
+                    SELECT COUNT(*) FROM patients WHERE patient_id IN ({', '.join('?' * len(batch))})
+                ''', batch).fetchone()[0]
+            return count
+    
+    def _matching_patient_batches(self, where, params, batch_size):
+        """Yield ascending batches of patient IDs matching a predicate (keyset on patient_id)"""
+        last_id = 0
+        while True:
+            with self.connection() as conn:
+                batch = [row[0] for row in conn.execute(f'''
+                    SELECT patient_id FROM patients
+                    WHERE patient_id > ? AND ({where})
+                    ORDER BY patient_id
+                    LIMIT ?
+                ''', (last_id, *params, batch_size))]
+            if not batch:
+                return
+            yield batch
+            if len(batch) < batch_size:
+                return
+            last_id = batch[-1]
+    
+    def check_data_retention(self, batch_size=500):
+        """Check and delete records past retention date
         
-        for patient_id, name in expired_records:
-            cursor.execute('DELETE FROM consent_records WHERE patient_id = ?', (patient_id,))
-            cursor.execute('DELETE FROM patients WHERE patient_id = ?', (patient_id,))
+        Expired patients are deleted set-based in bounded batches (found via
+        the retention index), each batch in its own short transaction with
+        one summarized audit entry. Returns the number of records deleted.
+        """
+        total_deleted = 0
+        while True:
+            with self.connection() as conn:
+                expired_ids = [row[0] for row in conn.execute('''
+                    SELECT patient_id FROM patients
+                    WHERE data_retention_date < datetime('now')
+                    ORDER BY data_retention_date
+                    LIMIT ?
+                ''', (batch_size,))]
+                if not expired_ids:
+                    break
+                
+                self._delete_patient_batch(conn, expired_ids)
+            
+            total_deleted += len(expired_ids)
             self.log_action(0, 'system', 'system', 'data_retention_cleanup', 
-                           f'Auto-deleted expired patient record: {patient_id}')
+                           f'Auto-deleted {len(expired_ids)} expired patient records: '
+                           f'{", ".join(str(i) for i in sorted(expired_ids))}')
+            
+            if len(expired_ids) < batch_size:
+                break
         
-        conn.commit()
-        conn.close()
+        return total_deleted
+    
+    def backup_database(self, directory, user_id, username, role, compress=False, encrypt=False,
+                        pages=1024, sleep=0.01, keep=None, progress_callback=None):
+        """Write an online snapshot of the database to directory; returns backup statistics
+        
+        Uses the SQLite backup API, copying `pages` pages per step and
+        sleeping between steps so other connections keep their share of I/O.
+        The source stays in one read transaction for the whole copy: in WAL
+        mode writers carry on, and the snapshot never has to restart because
+        of their commits. The copy is optionally gzip-compressed and/or
+        encrypted with the newest key; `keep` prunes older backups.
+        progress_callback(copied_pages, total_pages) is called after each step.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.backup_dirs.add(directory)
+        self.flush_logs()
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        suffix = '.db' + ('.gz' if compress else '') + ('.enc' if encrypt else '')
+        name = f'{BACKUP_PREFIX}{stamp}{suffix}'
+        # Several backups within one second (scheduled and manual) get a counter
+        counter = 1
+        while os.path.exists(os.path.join(directory, name)):
+            name = f'{BACKUP_PREFIX}{stamp}_{counter}{suffix}'
+            counter += 1
+        path = os.path.join(directory, name)
+        # The plaintext copy is staged in a private (owner-only) temporary
+        # directory, never next to the backups
+        snapshot_dir = tempfile.mkdtemp(prefix='hospital_backup_')
+        snapshot_path = os.path.join(snapshot_dir, 'snapshot.db')
+        
+        start = time.perf_counter()
+        self._end_read_snapshot()
+        source = self.pool.acquire()
+        target = sqlite3.connect(snapshot_path)
+        try:
+            def step_done(status, remaining, total):
+                if progress_callback:
+                    progress_callback(total - remaining, total)
+                if remaining and sleep:
+                    time.sleep(sleep)
+            
+            # Pin one snapshot for every backup step
+            source.execute('BEGIN')
+            source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+            source.backup(target, pages=pages, progress=step_done)
+            database_bytes = target.execute('PRAGMA page_count').fetchone()[0] * \
+                target.execute('PRAGMA page_size').fetchone()[0]
+            target.close()
+            
+            if compress or encrypt:
+                chunks = read_file_chunks(snapshot_path)
+                if compress:
+                    chunks = gzip_chunks(chunks)
+                if encrypt:
+                    chunks = self.cipher.encrypt_stream(chunks)
+                size = self.write_stream_to_file(chunks, path)
+            else:
+                shutil.move(snapshot_path, path)
+                size = os.path.getsize(path)
+        finally:
+            source.rollback()
+            self.pool.release(source)
+            target.close()
+            shutil.rmtree(snapshot_dir, ignore_errors=True)
+        elapsed = time.perf_counter() - start
         
-        return len(expired_records)
+        self.log_action(user_id, username, role, 'backup_database',
+                       f'Backed up database to {name} ({size} bytes, {elapsed:.2f}s)')
+        return {
+            'name': name,
+            'path': path,
+            'database_bytes': database_bytes,
+            'size_bytes': size,
+            'seconds': elapsed,
+            'compressed': compress,
+            'encrypted': encrypt,
+            'pruned': prune_backups(directory, keep) if keep else [],
+        }
     
-    def export_logs_csv(self):
-        """Export logs to CSV format"""
-        import csv
-        import io
+    def restore_backup(self, backup_path, target_path):
+        """Decrypt / decompress a backup into a new database file and check its integrity
         
-        logs = self.get_all_logs()
+        Never restores over the live database: stop the app and move the
+        restored file into place. Returns the integrity_check result ('ok').
+        """
+        if os.path.abspath(target_path) == os.path.abspath(self.db_name):
+            raise ValueError('Restore to a new file, not over the database in use')
+        with open(backup_path, 'rb') as f:
+            chunks = iter(lambda: f.read(BACKUP_CHUNK_SIZE), b'')
+            if backup_path.endswith('.enc'):
+                chunks = self.cipher.decrypt_stream(f)
+            if backup_path.endswith(('.gz', '.gz.enc')):
+                chunks = gunzip_chunks(chunks)
+            try:
+                self.write_stream_to_file(chunks, target_path)
+            except zlib.error as e:
+                raise ValueError(f'Compressed backup is corrupt: {e}') from None
         
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(['Log ID', 'Username', 'Role', 'Action', 'Timestamp', 'Details'])
+        conn = sqlite3.connect(target_path)
+        try:
+            return conn.execute('PRAGMA integrity_check').fetchone()[0]
+        except sqlite3.DatabaseError as e:
+            return str(e)
+        finally:
+            conn.close()
+    
+    def get_storage_stats(self):
+        """Database file size, free pages and auto_vacuum mode"""
+        with self.connection() as conn:
+            page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+            page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+            free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            mode = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+        return {
+            'page_size': page_size,
+            'page_count': page_count,
+            'free_pages': free_pages,
+            'size_bytes': page_size * page_count,
+            'auto_vacuum': {0: 'none', 1: 'full', 2: 'incremental'}.get(mode, str(mode)),
+        }
+    
+    def enable_incremental_vacuum(self):
+        """Switch an existing database to auto_vacuum = INCREMENTAL
+        
+        Needs one full VACUUM, which rewrites the file and blocks writers
+        while it runs; databases created by this version start out incremental.
+        Returns True if the database was converted.
+        """
+        with self.connection() as conn:
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+                return False
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+            return True
+    
+    def _stream_csv(self, query, params, header, chunk_size=1000, compress=False):
+        """Yield CSV-encoded byte chunks for a query, fetching chunk_size rows at a time
         
-        for log in logs:
-            writer.writerow(log)
+        Memory stays bounded by chunk_size regardless of table size. The
+        query runs on its own pooled connection (one read snapshot) so the
+        generator can be consumed lazily without tying up this thread's
+        shared connection. compress=True yields a gzip stream.
+        """
+        compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31: gzip container
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(header)
         
-        return output.getvalue()
+        self._end_read_snapshot()
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                writer.writerows(rows)
+                data = buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+                if compressor:
+                    data = compressor.compress(data)
+                if data:
+                    yield data
+                if not rows:
+                    break
+            cursor.close()
+        finally:
+            self.pool.release(conn)
+        
+        if compressor:
+            yield compressor.flush()
+    
+    def stream_logs_csv(self, chunk_size=1000, compress=False):
+        """Stream all logs as CSV byte chunks"""
+        self.flush_logs()
+        return self._stream_csv('''
+            SELECT log_id, username, role, action, timestamp, details
+            FROM logs
+            ORDER BY timestamp DESC
+        ''', (), ['Log ID', 'Username', 'Role', 'Action', 'Timestamp', 'Details'],
+            chunk_size, compress)
+    
+    def stream_patients_csv(self, role, chunk_size=1000, compress=False):
+        """Stream patient data (as visible to this role) as CSV byte chunks"""
+        return self._stream_csv(f'''
+            SELECT {self._patient_columns(role)}
+            FROM patients
+            ORDER BY patient_id DESC
+        ''', (), ['Patient ID', 'Name', 'Contact', 'Diagnosis', 'Date Added', 
+                   'Is Anonymized', 'Consent Given'],
+            chunk_size, compress)
+    
+    def write_stream_to_file(self, chunks, path):
+        """Write byte chunks to path atomically; returns the number of bytes written"""
+        tmp_path = path + '.tmp'
+        size = 0
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    size += len(chunk)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return size
+    
+    def export_logs_to_file(self, path, compress=None):
+        """Export logs to a CSV file (gzip-compressed if path ends in .gz)"""
+        if compress is None:
+            compress = path.endswith('.gz')
+        return self.write_stream_to_file(self.stream_logs_csv(compress=compress), path)
+    
+    def export_patients_to_file(self, role, path, compress=None):
+        """Export patient data to a CSV file (gzip-compressed if path ends in .gz)"""
+        if compress is None:
+            compress = path.endswith('.gz')
+        return self.write_stream_to_file(self.stream_patients_csv(role, compress=compress), path)
+    
+    def get_export_file(self, kind, role=None):
+        """Path to a CSV export of 'logs' or 'patients', regenerated only when the data changes
+        
+        Exports are written to a private temp directory and named by table
+        version (and role, since patient columns are masked per role), so
+        repeated downloads of unchanged data are served from disk.
+        """
+        if kind == 'logs':
+            self.flush_logs()
+            prefix = 'logs_'
+        elif kind == 'patients':
+            prefix = f'patients_{role}_'
+        else:
+            raise ValueError("kind must be 'logs' or 'patients'")
+        
+        with self._export_lock:
+            if self._export_dir is None:
+                self._export_dir = tempfile.mkdtemp(prefix='hospital_exports_')
+            version = self._table_versions((kind,))[0]
+            path = os.path.join(self._export_dir, f'{prefix}v{version}.csv')
+            if not os.path.exists(path):
+                if kind == 'logs':
+                    self.export_logs_to_file(path)
+                else:
+                    self.export_patients_to_file(role, path)
+                # Drop exports of older versions
+                for name in os.listdir(self._export_dir):
+                    if name.startswith(prefix) and name != os.path.basename(path):
+                        os.remove(os.path.join(self._export_dir, name))
+            return path
+    
+    def export_logs_csv(self):
+        """Export logs to CSV format"""
+        return b''.join(self.stream_logs_csv()).decode('utf-8')
     
     def export_patients_csv(self, role):
         """Export patient data to CSV format"""
-        import csv
-        import io
+        return b''.join(self.stream_patients_csv(role)).decode('utf-8')
+    
+    def export_patient_data(self, patient_id, user_id, username, role):
+        """Data portability export for one patient (Admin only)
         
-        patients = self.get_patients(role)
+        Returns a JSON-serializable dict with the patient record, its consent
+        records and its access history, or None if the patient does not exist.
+        Every lookup is by patient_id, so the cost does not grow with the logs.
+        """
+        with self.connection() as conn:
+            cursor = conn.execute('''
+                SELECT patient_id, name, contact, diagnosis, date_added, consent_given,
+                       data_retention_date, is_anonymized
+                FROM patients
+                WHERE patient_id = ?
+            ''', (patient_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            patient = dict(zip([column[0] for column in cursor.description], row))
+            
+            cursor = conn.execute('''
+                SELECT consent_id, consent_type, consent_given, consent_date
+                FROM consent_records
+                WHERE patient_id = ?
+                ORDER BY consent_id
+            ''', (patient_id,))
+            columns = [column[0] for column in cursor.description]
+            consents = [dict(zip(columns, record)) for record in cursor.fetchall()]
         
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(['Patient ID', 'Name', 'Contact', 'Diagnosis', 'Date Added', 
-                        'Is Anonymized', 'Consent Given'])
+        history = [dict(zip(['log_id', 'username', 'role', 'action', 'timestamp', 'details'], entry))
+                   for entry in self.get_patient_access_history(patient_id)]
         
-        for patient in patients:
-            writer.writerow(patient)
+        self.log_action(user_id, username, role, 'export_patient_data',
+                       f'Exported data of patient ID: {patient_id}', patient_id=patient_id)
         
-        return output.getvalue()
+        return {
+            'exported_at': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+            'patient': patient,
+            'consent_records': consents,
+            'access_history': history,
+        }
@@ -0,0 +1,224 @@
+"""
+Hospital Management Command Line Tool
+Runs bulk operations against the hospital database without the web interface,
+e.g. from cron:  python -m hospital_cli anonymize --batch-size 5000 --workers 8
+"""
+
+import argparse
+import sqlite3
+import sys
+import time
+from database import DatabaseManager, JobBusyError, BACKUP_DIR
+
+# Exit codes
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_REJECTED = 3   # completed, but some input rows were rejected
+EXIT_BUSY = 4       # the job is already running (in the app or another process)
+EXIT_PAUSED = 5     # the job was paused before it finished; run again to resume
+
+# Bulk job commands: job type and the verb used in progress and summary output
+JOB_COMMANDS = {
+    'anonymize': ('anonymize', 'Anonymized'),
+    'de-anonymize': ('de_anonymize', 'De-anonymized'),
+    'reindex': ('blind_index', 'Indexed'),
+}
+
+def job_progress(processed, total, rows_per_sec):
+    """Overwrite one status line on stderr after each batch"""
+    percent = f" ({processed / total * 100:.0f}%)" if total else ''
+    print(f"\r  processed {processed:,} / {total:,}{percent} at {rows_per_sec:,.0f} rows/s",
+          end='', file=sys.stderr, flush=True)
+
+def import_progress(processed, imported, rows_per_sec):
+    """Overwrite one status line on stderr after each chunk"""
+    print(f"\r  read {processed:,} rows, imported {imported:,} ({rows_per_sec:,.0f} rows/s)",
+          end='', file=sys.stderr, flush=True)
+
+def end_progress(args):
+    """Finish the progress line"""
+    if not args.quiet:
+        print(file=sys.stderr)
+
+def summary(verb, count, elapsed):
+    """One-line timing summary"""
+    rate = count / elapsed if elapsed > 0 else 0.0
+    print(f"{verb} {count:,} records in {elapsed:.2f}s ({rate:,.0f} rows/s)")
+
+def job_command(db, args):
+    """Run or resume a resumable bulk job (anonymize, de-anonymize, reindex)"""
+    job_type, verb = JOB_COMMANDS[args.command]
+    start = time.perf_counter()
+    job_id = db.get_or_create_job(job_type, 0, args.operator, 'system')
+    processed_before = db.get_job(job_id)['processed_count']
+    try:
+        job = db.run_job(job_id, batch_size=args.batch_size, workers=args.workers,
+                         use_processes=args.processes,
+                         progress_callback=None if args.quiet else job_progress)
+    except KeyboardInterrupt:
+        end_progress(args)
+        print(f"Job {job_id} interrupted and paused; run the command again to resume", file=sys.stderr)
+        return EXIT_PAUSED
+    end_progress(args)
+    summary(verb, job['processed_count'] - processed_before, time.perf_counter() - start)
+    if job['status'] != 'completed':
+        print(f"Job {job_id} {job['status']} at {job['processed_count']:,} / {job['total_count']:,} records")
+        return EXIT_PAUSED
+    return EXIT_OK
+
+def retention_command(db, args):
+    """Delete patient records past their retention date"""
+    start = time.perf_counter()
+    count = db.check_data_retention(batch_size=args.batch_size)
+    summary("Deleted expired", count, time.perf_counter() - start)
+    return EXIT_OK
+
+def export_command(db, args):
+    """Export logs or patient data to a CSV file"""
+    start = time.perf_counter()
+    compress = True if args.compress else None
+    if args.kind == 'logs':
+        size = db.export_logs_to_file(args.output, compress=compress)
+    else:
+        size = db.export_patients_to_file(args.role, args.output, compress=compress)
+    print(f"Exported {args.kind} to {args.output} ({size:,} bytes) in {time.perf_counter() - start:.2f}s")
+    return EXIT_OK
+
+def import_command(db, args):
+    """Import patients from a CSV or JSON Lines file"""
+    result = db.import_patients(args.file, 0, args.operator, 'system', file_format=args.format,
+                                chunk_size=args.batch_size, encrypt=args.encrypt, workers=args.workers,
+                                use_processes=args.processes,
+                                progress_callback=None if args.quiet else import_progress)
+    end_progress(args)
+    print(f"Imported {result['imported']:,} of {result['processed']:,} records"
+          f"{' (encrypted)' if result['encrypted'] else ''} in {result['seconds']:.2f}s "
+          f"({result['rows_per_sec']:,.0f} rows/s)")
+    if result['rejected']:
+        print(f"Rejected {result['rejected']:,} record(s):")
+        for row, reason in result['rejects'][:args.show_rejects]:
+            print(f"  row {row}: {reason}")
+        if result['rejected'] > args.show_rejects:
+            print(f"  ... and {result['rejected'] - args.show_rejects:,} more")
+        return EXIT_REJECTED
+    return EXIT_OK
+
+def backup_progress(copied, total):
+    """Overwrite one status line on stderr after each backup step"""
+    print(f"\r  copied {copied:,} / {total:,} pages", end='', file=sys.stderr, flush=True)
+
+def backup_command(db, args):
+    """Write an online snapshot of the database"""
+    result = db.backup_database(args.dir, 0, args.operator, 'system', compress=args.compress,
+                                encrypt=args.encrypt, pages=args.pages, sleep=args.sleep, keep=args.keep,
+                                progress_callback=None if args.quiet else backup_progress)
+    end_progress(args)
+    print(f"Backed up {result['database_bytes']:,} bytes to {result['path']} "
+          f"({result['size_bytes']:,} bytes) in {result['seconds']:.2f}s")
+    for name in result['pruned']:
+        print(f"  removed old backup {name}")
+    return EXIT_OK
+
+def restore_command(db, args):
+    """Restore a backup into a new database file"""
+    start = time.perf_counter()
+    check = db.restore_backup(args.backup, args.target)
+    print(f"Restored {args.backup} to {args.target} in {time.perf_counter() - start:.2f}s "
+          f"(integrity check: {check})")
+    return EXIT_OK if check == 'ok' else EXIT_ERROR
+
+def jobs_command(db, args):
+    """List recent bulk jobs"""
+    print(f"{'Job':>5} {'Type':14} {'Status':10} {'Processed':>12} {'Total':>12}  Updated")
+    for job_id, job_type, status, processed, total, _, _, _, updated, _, _ in db.list_jobs(args.limit):
+        print(f"{job_id:>5} {job_type:14} {status:10} {processed:>12,} {total:>12,}  {updated}")
+    return EXIT_OK
+
+def add_worker_options(parser, batch_size):
+    """Batch size and parallelism flags shared by the bulk commands"""
+    parser.add_argument('--batch-size', type=int, default=batch_size,
+                        help='records per transaction (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=4, help='encryption workers (default: %(default)s)')
+    parser.add_argument('--processes', action='store_true', help='use worker processes instead of threads')
+
+def build_parser():
+    """Command line arguments"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='hospital_management.db', help='database file (default: %(default)s)')
+    parser.add_argument('--key-file', default='encryption.key', help='encryption key ring (default: %(default)s)')
+    parser.add_argument('--cipher', choices=['fernet', 'aesgcm'], default='fernet',
+                        help='cipher backend for newly encrypted values (default: %(default)s)')
+    parser.add_argument('--operator', default='cli', help='name recorded in the audit log (default: %(default)s)')
+    parser.add_argument('--quiet', action='store_true', help='no progress output')
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    helps = {
+        'anonymize': 'encrypt and mask all patient records',
+        'de-anonymize': 'decrypt all anonymized patient records',
+        'reindex': 'rebuild missing or outdated blind indexes',
+    }
+    for name, help_text in helps.items():
+        job = commands.add_parser(name, help=help_text)
+        add_worker_options(job, 500)
+        job.set_defaults(handler=job_command)
+    
+    retention = commands.add_parser('retention', help='delete records past their retention date')
+    retention.add_argument('--batch-size', type=int, default=500, help='records per transaction (default: %(default)s)')
+    retention.set_defaults(handler=retention_command)
+    
+    export = commands.add_parser('export', help='export logs or patient data to CSV')
+    export.add_argument('kind', choices=['logs', 'patients'])
+    export.add_argument('output', help='output file (gzip-compressed if it ends in .gz)')
+    export.add_argument('--role', choices=['admin', 'doctor', 'receptionist'], default='admin',
+                        help='patient columns as visible to this role (default: %(default)s)')
+    export.add_argument('--compress', action='store_true', help='gzip the output regardless of its name')
+    export.set_defaults(handler=export_command)
+    
+    importer = commands.add_parser('import', help='bulk import patients from CSV or JSON Lines')
+    importer.add_argument('file', help='input file (.csv, .jsonl or .ndjson)')
+    importer.add_argument('--format', choices=['csv', 'jsonl'], help='input format (default: from file name)')
+    importer.add_argument('--encrypt', action='store_true', default=None, help='anonymize records on import')
+    add_worker_options(importer, 5000)
+    importer.add_argument('--show-rejects', type=int, default=20, help='rejected rows to list (default: %(default)s)')
+    importer.set_defaults(handler=import_command)
+    
+    backup = commands.add_parser('backup', help='online snapshot of the database')
+    backup.add_argument('--dir', default=BACKUP_DIR, help='backup directory (default: %(default)s)')
+    backup.add_argument('--compress', action='store_true', help='gzip the snapshot')
+    backup.add_argument('--encrypt', action='store_true', help='encrypt the snapshot with the newest key')
+    backup.add_argument('--keep', type=int, help='delete all but the newest KEEP backups')
+    backup.add_argument('--pages', type=int, default=1024, help='pages copied per step (default: %(default)s)')
+    backup.add_argument('--sleep', type=float, default=0.01, help='seconds to pause between steps (default: %(default)s)')
+    backup.set_defaults(handler=backup_command)
+    
+    restore = commands.add_parser('restore', help='restore a backup into a new database file')
+    restore.add_argument('backup', help='backup file (.db, .db.gz, .db.enc or .db.gz.enc)')
+    restore.add_argument('target', help='new database file to create')
+    restore.set_defaults(handler=restore_command)
+    
+    jobs = commands.add_parser('jobs', help='list recent bulk jobs')
+    jobs.add_argument('--limit', type=int, default=20, help='jobs to list (default: %(default)s)')
+    jobs.set_defaults(handler=jobs_command)
+    return parser
+
+def main(argv=None):
+    """Main execution; returns the process exit code"""
+    args = build_parser().parse_args(argv)
+    db = None
+    try:
+        db = DatabaseManager(args.db, key_file=args.key_file, cipher_backend=args.cipher)
+        return args.handler(db, args)
+    except JobBusyError as e:
+        end_progress(args)
+        print(f"Busy: {e}", file=sys.stderr)
+        return EXIT_BUSY
+    except (ValueError, OSError, RuntimeError, sqlite3.Error) as e:
+        end_progress(args)
+        print(f"Error: {e}", file=sys.stderr)
+        return EXIT_ERROR
+    finally:
+        if db is not None:
+            db.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
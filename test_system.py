@@ -66,9 +66,8 @@ def test_database_module():
             return False
         
         # Clean up test database
-        import os
-        if os.path.exists('test_hospital.db'):
-            os.remove('test_hospital.db')
+        db.close()
+        remove_test_db('test_hospital.db')
         if os.path.exists('encryption.key'):
             # Keep the key if it exists
             pass
@@ -80,6 +79,1346 @@ def test_database_module():
         print(f"  ❌ Database test error: {e}")
         return False
 
+def remove_test_file(path):
+    """Delete a file left behind by a previous test run (e.g. a key ring)"""
+    if os.path.exists(path):
+        os.remove(path)
+
+def remove_test_db(db_name):
+    """Delete a test database together with its WAL side files"""
+    for suffix in ('', '-wal', '-shm'):
+        remove_test_file(db_name + suffix)
+
+def seed_patients(db, count, diagnosis='Checkup', consent=None):
+    """Insert 'Patient i' rows directly, bypassing blind indexes and audit logging
+    
+    consent, if given, maps the row number to consent_given.
+    """
+    with db.connection() as conn:
+        if consent is None:
+            conn.executemany('INSERT INTO patients (name, contact, diagnosis) VALUES (?, ?, ?)',
+                             [(f'Patient {i}', f'555-000-{i:04d}', diagnosis) for i in range(count)])
+        else:
+            conn.executemany('INSERT INTO patients (name, contact, diagnosis, consent_given) VALUES (?, ?, ?, ?)',
+                             [(f'Patient {i}', f'555-000-{i:04d}', diagnosis, consent(i)) for i in range(count)])
+        conn.commit()
+
+def test_connection_pool():
+    """Test pooled connection reuse, PRAGMAs and bounded checkout"""
+    print("\nTesting connection pool...")
+    try:
+        from database import DatabaseManager
+        
+        remove_test_db('test_pool.db')
+        # Caching disabled so every read checks out a connection
+        db = DatabaseManager('test_pool.db', pool_size=2, pool_timeout=0.2, cache_size=0)
+        
+        # Connections are reused instead of reopened per call
+        for _ in range(20):
+            db.get_patients('admin')
+        stats = db.get_pool_stats()
+        if stats['open'] <= 2 and stats['checkouts'] >= 20:
+            print(f"  ✅ Connections reused ({stats['open']} open, {stats['checkouts']} checkouts)")
+        else:
+            print(f"  ❌ Unexpected pool stats: {stats}")
+            return False
+        
+        # PRAGMAs applied once per connection
+        with db.connection() as conn:
+            journal_mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+            # Nested use in the same thread shares the connection
+            with db.connection() as inner:
+                shared = inner is conn
+        if journal_mode == 'wal' and shared:
+            print("  ✅ WAL mode enabled and nested checkout shares connection")
+        else:
+            print(f"  ❌ journal_mode={journal_mode}, shared={shared}")
+            return False
+        
+        # Pool is bounded: a third checkout times out while two are held
+        first = db.pool.acquire()
+        second = db.pool.acquire()
+        try:
+            db.pool.acquire()
+            print("  ❌ Pool exceeded its maximum size")
+            return False
+        except TimeoutError:
+            print("  ✅ Pool size is bounded")
+        finally:
+            db.pool.release(first)
+            db.pool.release(second)
+        
+        db.close()
+        remove_test_db('test_pool.db')
+        return True
+        
+    except Exception as e:
+        print(f"  ❌ Connection pool test error: {e}")
+        return False
+
+def test_audit_log_writer():
+    """Test batched background audit log writer"""
+    print("\nTesting audit log writer...")
+    try:
+        from database import DatabaseManager
+        
+        db = DatabaseManager('test_logwriter.db', log_durability='group',
+                             log_batch_size=50, log_flush_interval_ms=50)
+        
+        for i in range(200):
+            db.log_action(1, 'admin', 'admin', 'test', f'Event {i}')
+        db.flush_logs()
+        
+        logs = db.get_all_logs()
+        stats = db.get_log_writer_stats()
+        if len(logs) == 200 and stats['queue_depth'] == 0 and stats['flushes'] >= 4:
+            print(f"  ✅ Group commit wrote {len(logs)} logs in {stats['flushes']} flushes "
+                  f"(avg {stats['avg_flush_ms']:.2f} ms)")
+        else:
+            print(f"  ❌ Unexpected result: {len(logs)} logs, stats {stats}")
+            return False
+        db.close()
+        remove_test_db('test_logwriter.db')
+        
+        # A full queue does not block forever: the record is written directly,
+        # and a failing direct write raises instead of hanging
+        db = DatabaseManager('test_logwriter.db', log_queue_size=2, log_batch_size=1000,
+                             log_flush_interval_ms=60000, log_submit_timeout=0.05)
+        for i in range(5):
+            db.log_action(1, 'admin', 'admin', 'test', f'Event {i}')
+        direct = db.get_log_writer_stats()['direct_writes']
+        with db.connection() as conn:
+            conn.execute('ALTER TABLE logs RENAME TO logs_moved')
+            conn.commit()
+        try:
+            db.log_action(1, 'admin', 'admin', 'test', 'Event while broken')
+            error = None
+        except RuntimeError as e:
+            error = str(e)
+        with db.connection() as conn:
+            conn.execute('ALTER TABLE logs_moved RENAME TO logs')
+            conn.commit()
+        db.flush_logs()
+        if direct == 3 and error and 'no such table' in error and len(db.get_all_logs()) == 5 \
+                and db.get_log_writer_stats()['last_error']:
+            print("  ✅ Full queue falls back to direct writes; failures raise with the last error")
+        else:
+            print(f"  ❌ Full queue handling failed: {direct} direct writes, error {error}")
+            return False
+        db.close()
+        remove_test_db('test_logwriter.db')
+        
+        # A record that can never be inserted is dropped instead of blocking the ones after it
+        db = DatabaseManager('test_logwriter.db', log_flush_interval_ms=60000)
+        try:
+            db.log_action(1, 'admin', 'admin', None, 'No action')
+            rejected = False
+        except ValueError:
+            rejected = True
+        db.log_writer.submit((1, 'admin', 'admin', None, 'Bad', '2024-01-01 00:00:00', None, None))
+        for i in range(5):
+            db.log_action(1, 'admin', 'admin', 'test', f'Good {i}')
+        db.flush_logs()
+        stats = db.get_log_writer_stats()
+        if rejected and len(db.get_all_logs()) == 5 and stats['dropped'] == 1 and 'Bad' in stats['last_error']:
+            print("  ✅ Invalid record rejected or dropped; later records still written")
+        else:
+            print(f"  ❌ Bad record handling failed: rejected {rejected}, stats {stats}")
+            return False
+        db.close()
+        remove_test_db('test_logwriter.db')
+        
+        # Strict mode commits each event immediately
+        db = DatabaseManager('test_logwriter.db', log_durability='strict')
+        db.log_action(1, 'admin', 'admin', 'test', 'Strict event')
+        if db.log_writer is None and len(db.get_all_logs()) == 1:
+            print("  ✅ Strict durability mode commits per event")
+        else:
+            print("  ❌ Strict durability mode failed")
+            return False
+        db.close()
+        remove_test_db('test_logwriter.db')
+        return True
+        
+    except Exception as e:
+        print(f"  ❌ Audit log writer test error: {e}")
+        return False
+
+def test_bulk_anonymization():
+    """Test chunked, parallel anonymization and de-anonymization"""
+    print("\nTesting bulk anonymization...")
+    try:
+        from database import DatabaseManager
+        
+        db = DatabaseManager('test_anonymize.db')
+        seed_patients(db, 95)
+        
+        progress = []
+        count = db.anonymize_patient_data(1, 'admin', 'admin', chunk_size=20, workers=3,
+                                          progress_callback=lambda done, total, rate: progress.append(done))
+        patients = db.get_patients('admin', show_anonymized=True)
+        if count == 100 and len(progress) == 5 and all(p[5] == 1 for p in patients):
+            print(f"  ✅ Anonymized {count} records in {len(progress)} chunks")
+        else:
+            print(f"  ❌ Anonymized {count} records, progress {progress}")
+            return False
+        
+        restored = db.de_anonymize_patient_data(1, 'admin', 'admin')
+        names = {p[1] for p in db.get_patients('admin')}
+        if restored == 100 and 'Patient 42' in names:
+            print("  ✅ De-anonymization restored original data")
+        else:
+            print("  ❌ De-anonymization failed")
+            return False
+        
+        db.close()
+        remove_test_db('test_anonymize.db')
+        return True
+        
+    except Exception as e:
+        print(f"  ❌ Bulk anonymization test error: {e}")
+        return False
+
+def test_encrypt_on_write():
+    """Test inline masking and encryption of new and updated patients"""
+    print("\nTesting encrypt-on-write...")
+    try:
+        from database import DatabaseManager
+        
+        remove_test_db('test_encrypt_write.db')
+        db = DatabaseManager('test_encrypt_write.db', encrypt_on_write=True)
+        backfill = db.get_statistics()['total_patients']
+        
+        # IDs are never reused, even after deleting the newest patient
+        db.add_patient('Temp Patient', '555-000-0000', 'Flu', 1, 'admin', 'admin')
+        deleted_id = db.get_patients('admin')[0][0]
+        db.delete_patient(deleted_id, 1, 'admin', 'admin')
+        db.add_patient('Inline Patient', '555-123-9876', 'Asthma', 1, 'admin', 'admin')
+        db.update_patient(deleted_id + 1, 'Inline Patient', '555-123-4321', 'Asthma', 1, 'admin', 'admin')
+        
+        with db.connection() as conn:
+            row = conn.execute('''
+                SELECT patient_id, anonymized_name, anonymized_contact, encrypted_contact, is_anonymized
+                FROM patients ORDER BY patient_id DESC LIMIT 1
+            ''').fetchone()
+        stats = db.get_statistics()
+        if (row[0] == deleted_id + 1 and row[1] == f'ANON_{row[0]:04d}' and row[2] == 'XXX-XXX-4321'
+                and db.decrypt_data(row[3]) == '555-123-4321' and row[4] == 1):
+            print(f"  ✅ New and updated rows stored masked and encrypted ({row[1]})")
+        else:
+            print(f"  ❌ Unexpected row: {row}")
+            return False
+        
+        # The bulk job only has the pre-existing rows left to backfill
+        count = db.anonymize_patient_data(1, 'admin', 'admin')
+        if stats['anonymized_patients'] == 1 and count == backfill:
+            print(f"  ✅ Bulk anonymization only backfilled {count} older records")
+        else:
+            print(f"  ❌ Backfill processed {count} records, stats {stats}")
+            return False
+        
+        db.close()
+        remove_test_db('test_encrypt_write.db')
+        return True
+        
+    except Exception as e:
+        print(f"  ❌ Encrypt-on-write test error: {e}")
+        return False
+
+def test_resumable_jobs():
+    """Test checkpointed, resumable anonymization jobs"""
+    print("\nTesting resumable jobs...")
+    try:
+        from database import DatabaseManager
+        
+        db = DatabaseManager('test_jobs.db')
+        seed_patients(db, 45)
+        
+        # Run two batches, then stop as if the process had been interrupted
+        job_id = db.create_job('anonymize', 1, 'admin', 'admin')
+        job = db.run_job(job_id, batch_size=10, max_batches=2, workers=1)
+        if job['status'] == 'paused' and job['processed_count'] == 20 and db.get_resumable_jobs() == [job_id]:
+            print(f"  ✅ Job checkpointed at patient {job['last_patient_id']}")
+        else:
+            print(f"  ❌ Unexpected checkpoint: {job}")
+            return False
+        
+        # A fresh manager resumes the same job from its checkpoint
+        db.close()
+        db = DatabaseManager('test_jobs.db')
+        count = db.anonymize_patient_data(1, 'admin', 'admin', chunk_size=10)
+        job = db.get_job(job_id)
+        if count == 50 and job['status'] == 'completed' and not db.get_resumable_jobs():
+            print(f"  ✅ Job resumed and completed ({count} records)")
+        else:
+            print(f"  ❌ Resume failed: {job}")
+            return False
+        
+        db.close()
+        remove_test_db('test_jobs.db')
+        return True
+        
+    except Exception as e:
+        print(f"  ❌ Resumable jobs test error: {e}")
+        return False
+
+def test_key_rotation():
+    """Test resumable re-encryption of patient data under a new key"""
+    print("\nTesting key rotation...")
+    try:
+        from database import DatabaseManager
+        
+        remove_test_db('test_rotation.db')
+        remove_test_file('test_rotation.key')
+        db = DatabaseManager('test_rotation.db', key_file='test_rotation.key')
+        seed_patients(db, 45)
+        db.anonymize_patient_data(1, 'admin', 'admin')
+        
+        # Interrupt a rotation after two batches, then resume it
+        version = db.add_encryption_key()
+        job_id = db.create_job('rotate_key', 1, 'admin', 'admin')
+        db.run_job(job_id, batch_size=10, max_batches=2, workers=1)
+        mixed = db.get_key_status()['rows_by_version']
+        count = db.rotate_encryption_key(1, 'admin', 'admin', chunk_size=10, workers=2)
+        status = db.get_key_status()
+        if (mixed == {1: 30, 2: 20} and count == 50 and db.get_job(job_id)['status'] == 'completed'
+                and status['current_version'] == version and status['rows_by_version'] == {2: 50}):
+            print(f"  ✅ Rotated {count} records to key version {version} across a resume")
+        else:
+            print(f"  ❌ Unexpected rotation state: {mixed}, {count}, {status}")
+            return False
+        
+        # Once unused, the old key can be dropped; the ring persists across restarts
+        retired = db.retire_encryption_keys()
+        db.close()
+        db = DatabaseManager('test_rotation.db', key_file='test_rotation.key')
+        restored = db.de_anonymize_patient_data(1, 'admin', 'admin')
+        names = {p[1] for p in db.get_patients('admin')}
+        if retired == [1] and db.key_ring[0][0] == version and restored == 50 and 'Patient 7' in names:
+            print("  ✅ Old key retired; data decrypts with the new key alone")
+        else:
+            print(f"  ❌ Retire/decrypt failed: retired {retired}, restored {restored}")
+            return False
+        
+        db.close()
+        remove_test_db('test_rotation.db')
+        os.remove('test_rotation.key')
+        return True
+        
+    except Exception as e:
+        print(f"  ❌ Key rotation test error: {e}")
+        return False
+
+def test_cipher_backends():
+    """Test AES-GCM blob encryption alongside existing Fernet data"""
+    print("\nTesting cipher backends...")
+    try:
+        from database import DatabaseManager
+        
+        remove_test_db('test_cipher.db')
+        remove_test_file('test_cipher.key')
+        db = DatabaseManager('test_cipher.db', key_file='test_cipher.key')
+        seed_patients(db, 20)
+        db.anonymize_patient_data(1, 'admin', 'admin')
+        fernet_token = db.encrypt_data('555-123-4567')
+        db.close()
+        
+        db = DatabaseManager('test_cipher.db', key_file='test_cipher.key', cipher_backend='aesgcm')
+        blob = db.encrypt_data('555-123-4567')
+        tampered = blob[:-1] + bytes([blob[-1] ^ 1])
+        try:
+            db.decrypt_data(tampered)
+            authenticated = False
+        except Exception:
+            authenticated = True
+        if (isinstance(blob, bytes) and blob[0] == 1 and db.decrypt_data(blob) == '555-123-4567'
+                and db.decrypt_data(fernet_token) == '555-123-4567' and authenticated):
+            print(f"  ✅ AES-GCM blob {len(blob)} bytes vs Fernet token {len(fernet_token)} bytes; "
+                  "Fernet still readable")
+        else:
+            print("  ❌ AES-GCM round trip failed")
+            return False
+        
+        # Rotation converts the existing Fernet rows to AES-GCM blobs
+        count = db.rotate_encryption_key(1, 'admin', 'admin')
+        with db.connection() as conn:
+            types = {row[0] for row in conn.execute('SELECT DISTINCT typeof(encrypted_name) FROM patients')}
+        restored = db.de_anonymize_patient_data(1, 'admin', 'admin')
+        names = {p[1] for p in db.get_patients('admin')}
+        if count == 25 and types == {'blob'} and restored == 25 and 'Patient 3' in names:
+            print(f"  ✅ Re-encrypted {count} Fernet records as AES-GCM blobs")
+        else:
+            print(f"  ❌ Conversion failed: {count}, {types}, {restored}")
+            return False
+        
+        db.close()
+        remove_test_db('test_cipher.db')
+        os.remove('test_cipher.key')
+        return True
+        
+    except Exception as e:
+        print(f"  ❌ Cipher backend test error: {e}")
+        return False
+
+def test_decryption_cache():
+    """Test the bounded decryption cache and its purges"""
+    print("\nTesting decryption cache...")
+    try:
+        from database import DatabaseManager
+        
+        remove_test_db('test_decrypt.db')
+        remove_test_file('test_decrypt.key')
+        db = DatabaseManager('test_decrypt.db', key_file='test_decrypt.key', decrypt_cache_size=2)
+        tokens = [db.encrypt_data(f'555-000-{i:04d}') for i in range(3)]
+        values = [db.decrypt_data(tokens[0]), db.decrypt_data(tokens[0])]
+        for token in tokens[1:]:
+            db.decrypt_data(token)
+        stats = db.get_decryption_cache_stats()
+        if values == ['555-000-0000'] * 2 and stats['hits'] == 1 and stats['entries'] == 2 and stats['evictions'] == 1:
+            print(f"  ✅ Repeated decrypt served from cache (bounded to {stats['max_entries']} entries)")
+        else:
+            print(f"  ❌ Unexpected cache stats: {stats}")
+            return False
+        
+        # Logout purges explicitly; changing keys purges automatically
+        db.purge_decryption_cache()
+        purged = db.get_decryption_cache_stats()['entries']
+        db.decrypt_data(tokens[2])
+        db.add_encryption_key()
+        if purged == 0 and db.get_decryption_cache_stats()['entries'] == 0 and db.decrypt_data(tokens[2]) == '555-000-0002':
+            print("  ✅ Cache purged on logout and key change")
+        else:
+            print("  ❌ Cache not purged")
+            return False
+        
+        db.close()
+        remove_test_db('test_decrypt.db')
+        os.remove('test_decrypt.key')
+        return True
+        
+    except Exception as e:
+        print(f"  ❌ Decryption cache test error: {e}")
+        return False
+
+def test_blind_index():
+    """Test indexed patient lookup by name and contact without decryption"""
+    print("\nTesting blind index lookups...")
+    try:
+        from database import DatabaseManager
+        
+        remove_test_db('test_blind.db')
+        remove_test_file('test_blind.key')
+        db = DatabaseManager('test_blind.db', key_file='test_blind.key')
+        
+        # The sample patients of a new database are indexed from the start
+        sample = db.find_patients('admin', contact='555-123-4567')
+        if [p[1] for p in sample] == ['John Smith'] and db.get_key_status()['stale_index_rows'] == 0:
+            print("  ✅ Sample patients seeded with blind indexes")
+        else:
+            print(f"  ❌ Sample patients not indexed: {sample}, {db.get_key_status()}")
+            return False
+        
+        seed_patients(db, 200)
+        db.add_patient('Jane  Doe', '555-867-5309', 'Flu', 1, 'admin', 'admin')
+        
+        # Rows inserted behind the manager's back are found once backfilled
+        missing = db.find_patients('admin', contact='555-000-0042')
+        indexed = db.rebuild_blind_indexes(1, 'admin', 'admin')
+        found = db.find_patients('admin', contact='555-000-0042')
+        if not missing and indexed == 200 and [p[1] for p in found] == ['Patient 42']:
+            print(f"  ✅ Backfilled blind indexes for {indexed} records")
+        else:
+            print(f"  ❌ Backfill failed: {indexed}, {found}")
+            return False
+        
+        db.anonymize_patient_data(1, 'admin', 'admin')
+        match = db.find_patients('doctor', contact='(555) 867 5309', name='jane doe')
+        with db.connection() as conn:
+            plan = ' '.join(row[3] for row in conn.execute(
+                'EXPLAIN QUERY PLAN SELECT patient_id FROM patients WHERE contact_index IN (?)', (b'x',)))
+        if len(match) == 1 and match[0][1].startswith('ANON_') and 'idx_patients_contact_index' in plan:
+            print(f"  ✅ Indexed lookup of anonymized patient ({match[0][1]})")
+        else:
+            print(f"  ❌ Lookup failed: {match}, plan {plan}")
+            return False
+        
+        # Lookups keep working mid-rotation, and rotation re-keys the indexes
+        db.add_encryption_key()
+        db.create_job('rotate_key', 1, 'admin', 'admin')
+        during = db.find_patients('admin', name='Patient 7')
+        db.rotate_encryption_key(1, 'admin', 'admin')
+        status = db.get_key_status()
+        if len(during) == 1 and status['stale_index_rows'] == 0 and db.retire_encryption_keys() == [1] \
+                and len(db.find_patients('admin', name='patient 7')) == 1:
+            print("  ✅ Blind indexes rotated with the encryption key")
+        else:
+            print(f"  ❌ Rotation left stale indexes: {status}")
+            return False
+        
+        db.close()
+        remove_test_db('test_blind.db')
+        os.remove('test_blind.key')
+        return True
+        
+    except Exception as e:
+        print(f"  ❌ Blind index test error: {e}")
+        return False
+
+def test_patient_access_history():
+    """Test per-patient audit history and the single-patient portability export"""
+    print("\nTesting patient access history...")
+    try:
+        import json
+        from database import DatabaseManager
+        
+        remove_test_db('test_access.db')
+        db = DatabaseManager('test_access.db')
+        db.add_patient('Jane Doe', '555-867-5309', 'Flu', 2, 'Alice_recep', 'receptionist')
+        patient_id = db.find_patients('admin', name='Jane Doe')[0][0]
+        db.update_patient(patient_id, 'Jane Doe', '555-867-5309', 'Cold', 2, 'Alice_recep', 'receptionist')
+        db.log_patient_access(3, 'DrBob', 'doctor', [patient_id, 1, 2], details='Viewed in patient list')
+        for i in range(2000):
+            db.log_action(1, 'admin', 'admin', 'login', 'User admin logged in')
+        
+        history = db.get_patient_access_history(patient_id)
+        with db.connection() as conn:
+            plan = ' '.join(row[3] for row in conn.execute(
+                'EXPLAIN QUERY PLAN SELECT log_id FROM logs WHERE patient_id = ? '
+                'ORDER BY timestamp DESC, log_id DESC', (patient_id,)))
+        if [h[3] for h in history] == ['view_patient', 'update_patient', 'add_patient'] \
+                and 'idx_logs_patient_timestamp' in plan and 'TEMP B-TREE' not in plan:
+            print(f"  ✅ Access history of patient {patient_id} read through the patient index")
+        else:
+            print(f"  ❌ Unexpected history: {history}, plan {plan}")
+            return False
+        
+        export = db.export_patient_data(patient_id, 1, 'admin', 'admin')
+        json.dumps(export)
+        if export['patient']['diagnosis'] == 'Cold' and len(export['consent_records']) == 1 \
+                and len(export['access_history']) == 3 \
+                and db.get_patient_access_history(patient_id, limit=1)[0][3] == 'export_patient_data' \
+                and db.export_patient_data(999999, 1, 'admin', 'admin') is None:
+            print("  ✅ Portability export includes record, consent and access history")
+        else:
+            print(f"  ❌ Export incomplete: {export}")
+            return False
+        
+        db.close()
+        remove_test_db('test_access.db')
+        return True
+        
+    except Exception as e:
+        print(f"  ❌ Patient access history test error: {e}")
+        return False
+
+def test_bulk_delete():
+    """Test batched patient deletion by IDs and predicate with incremental vacuum"""
+    print("\nTesting bulk delete...")
+    try:
+        import sqlite3
+        from database import DatabaseManager
+        
+        remove_test_db('test_bulk_delete.db')
+        db = DatabaseManager('test_bulk_delete.db')
+        seed_patients(db, 3000, diagnosis='Checkup ' * 50, consent=lambda i: i % 2)
+        with db.connection() as conn:
+            conn.execute("INSERT INTO consent_records (patient_id, consent_type) "
+                         "SELECT patient_id, 'data_processing' FROM patients WHERE consent_given = 1")
+            conn.commit()
+        
+        # 3000 rows plus the 5 samples; IDs beyond the table are ignored; 1200 IDs in batches of 500 -> 3 audit entries
+        preview = db.count_patients(patient_ids=list(range(1, 1201)) + [999999])
+        deleted = db.delete_patients(1, 'admin', 'admin', patient_ids=list(range(1, 1201)) + [999999],
+                                     batch_size=500)
+        storage = db.get_storage_stats()
+        with db.connection() as conn:
+            consents = conn.execute('SELECT COUNT(*) FROM consent_records WHERE patient_id <= 1200').fetchone()[0]
+        entries = db.count_logs(actions=['bulk_delete_patients'])
+        if deleted == preview == 1200 and consents == 0 and entries == 3 and storage['auto_vacuum'] == 'incremental' \
+                and storage['free_pages'] == 0 and db.get_statistics()['total_patients'] == 3005 - 1200:
+            print(f"  ✅ Deleted {deleted} records by ID in {entries} batches, free pages reclaimed")
+        else:
+            print(f"  ❌ ID delete failed: {deleted}, consents {consents}, entries {entries}, {storage}")
+            return False
+        
+        without_consent = db.count_patients(where='consent_given = ?', params=(0,))
+        deleted = db.delete_patients(1, 'admin', 'admin', where='consent_given = ?', params=(0,), batch_size=250)
+        remaining = db.get_statistics()
+        if deleted == without_consent > 0 and remaining['total_patients'] == remaining['patients_with_consent'] \
+                and db.get_storage_stats()['size_bytes'] < storage['size_bytes']:
+            print(f"  ✅ Deleted {deleted} records matching a predicate, file shrank")
+        else:
+            print(f"  ❌ Predicate delete failed: {deleted}, {remaining}")
+            return False
+        
+        try:
+            db.delete_patients(1, 'admin', 'admin')
+            print("  ❌ Missing selection was accepted")
+            return False
+        except ValueError:
+            pass
+        db.close()
+        
+        # Databases created without auto_vacuum are converted once
+        remove_test_db('test_bulk_delete.db')
+        conn = sqlite3.connect('test_bulk_delete.db')
+        conn.execute('CREATE TABLE legacy (x)')
+        conn.close()
+        db = DatabaseManager('test_bulk_delete.db')
+        before = db.get_storage_stats()['auto_vacuum']
+        if before == 'none' and db.enable_incremental_vacuum() \
+                and db.get_storage_stats()['auto_vacuum'] == 'incremental':
+            print("  ✅ Existing database switched to incremental vacuum")
+        else:
+            print(f"  ❌ Conversion failed (was {before})")
+            return False
+        
+        db.close()
+        remove_test_db('test_bulk_delete.db')
+        return True
+        
+    except Exception as e:
+        print(f"  ❌ Bulk delete test error: {e}")
+        return False
+
+def test_bulk_import():
+    """Test streaming CSV / JSON Lines patient import with validation"""
+    print("\nTesting bulk import...")
+    try:
+        import json
+        from database import DatabaseManager
+        from hospital_cli import main, EXIT_REJECTED
+        
+        remove_test_db('test_import.db')
+        lines = ['Name,Contact,Diagnosis,Consent']
+        lines += [f'Patient {i},555-100-{i:04d},Checkup,{"no" if i % 4 == 0 else "yes"}' for i in range(2000)]
+        lines += [',555-000-0000,Flu,', 'Bad Contact,call me,Flu,', 'No Diagnosis,555-000-0001,,',
+                  'Odd Consent,555-000-0002,Flu,maybe']
+        with open('test_import.csv', 'w') as f:
+            f.write('\n'.join(lines))
+        
+        db = DatabaseManager('test_import.db')
+        result = db.import_patients('test_import.csv', 1, 'admin', 'admin', chunk_size=300, workers=2)
+        stats = db.get_statistics()
+        with db.connection() as conn:
+            consents = conn.execute('SELECT COUNT(*) FROM consent_records').fetchone()[0]
+        reasons = [reason for row, reason in result['rejects']]
+        if result['imported'] == 2000 and result['rejected'] == 4 and stats['total_patients'] == 2005 \
+                and consents == 1500 and stats['patients_with_consent'] == 1505 \
+                and reasons == ['missing name', 'invalid contact number', 'missing diagnosis', 'invalid consent value'] \
+                and result['rejects'][0][0] == 2001 and db.count_logs(actions=['import_patients']) == 7:
+            print(f"  ✅ Imported {result['imported']} CSV rows in 7 chunks "
+                  f"({result['rows_per_sec']:.0f} rows/s), rejected {result['rejected']}")
+        else:
+            print(f"  ❌ CSV import failed: {result}, {stats}, consents {consents}")
+            return False
+        
+        with open('test_import.jsonl', 'w') as f:
+            # A row without a contact must not turn the numeric contacts into floats
+            f.write(json.dumps({'name': 'Json Missing', 'diagnosis': 'Flu'}) + '\n')
+            for i in range(50):
+                f.write(json.dumps({'name': f'Json Patient {i}', 'contact': 5552000000 + i,
+                                    'diagnosis': 'Flu', 'consent': True}) + '\n')
+        result = db.import_patients('test_import.jsonl', 1, 'admin', 'admin', encrypt=True)
+        found = db.find_patients('doctor', contact='555-200-0007')
+        with db.connection() as conn:
+            restored = db.decrypt_data(conn.execute(
+                "SELECT encrypted_name FROM patients WHERE name = 'Json Patient 49'").fetchone()[0])
+        if result['imported'] == 50 and result['rejects'] == [(1, 'missing contact')] and result['encrypted'] \
+                and len(found) == 1 and found[0][1].startswith('ANON_') and restored == 'Json Patient 49':
+            print("  ✅ JSON Lines import encrypted on ingest and indexed for lookup")
+        else:
+            print(f"  ❌ JSON Lines import failed: {result}, {found}, {restored}")
+            return False
+        db.close()
+        
+        code = main(['--db', 'test_import.db', '--quiet', 'import', 'test_import.csv', '--show-rejects', '0'])
+        db = DatabaseManager('test_import.db')
+        if code == EXIT_REJECTED and db.get_statistics()['total_patients'] == 4055:
+            print("  ✅ Command line import reports rejected rows in its exit code")
+        else:
+            print(f"  ❌ Command line import failed (exit code {code})")
+            return False
+        
+        db.close()
+        remove_test_db('test_import.db')
+        os.remove('test_import.csv')
+        os.remove('test_import.jsonl')
+        return True
+        
+    except Exception as e:
+        print(f"  ❌ Bulk import test error: {e}")
+        return False
+
+def test_command_line():
+    """Test headless bulk jobs, exit codes and cross-process job claiming"""
+    print("\nTesting command line tool...")
+    try:
+        import gzip
+        from database import DatabaseManager
+        import hospital_cli
+        from hospital_cli import main, job_progress, EXIT_OK, EXIT_ERROR, EXIT_BUSY, EXIT_PAUSED
+        
+        remove_test_db('test_cli.db')
+        db = DatabaseManager('test_cli.db')
+        seed_patients(db, 1000)
+        
+        # A job another process is running (fresh checkpoint) cannot be claimed
+        job_id = db.create_job('anonymize', 1, 'admin', 'admin')
+        with db.connection() as conn:
+            conn.execute("UPDATE jobs SET status = 'running', updated_at = CURRENT_TIMESTAMP WHERE job_id = ?",
+                         (job_id,))
+            conn.commit()
+        args = ['--db', 'test_cli.db', '--quiet']
+        busy = main(args + ['anonymize', '--batch-size', '200', '--workers', '2'])
+        with db.connection() as conn:
+            conn.execute("UPDATE jobs SET updated_at = datetime('now', '-1 hour') WHERE job_id = ?", (job_id,))
+            conn.commit()
+        done = main(args + ['anonymize', '--batch-size', '200', '--workers', '2'])
+        job = db.get_job(job_id)
+        if busy == EXIT_BUSY and done == EXIT_OK and job['status'] == 'completed' \
+                and db.get_statistics()['anonymized_patients'] == 1005:
+            print("  ✅ Anonymized from the command line, resuming a job abandoned by another process")
+        else:
+            print(f"  ❌ Command line anonymization failed: exit codes {busy}, {done}, {job}")
+            return False
+        
+        # Ctrl-C pauses the job instead of leaving it claimed as running
+        def interrupt(processed, total, rows_per_sec):
+            raise KeyboardInterrupt
+        hospital_cli.job_progress = interrupt
+        try:
+            interrupted = main(['--db', 'test_cli.db', 'de-anonymize', '--batch-size', '200'])
+        finally:
+            hospital_cli.job_progress = job_progress
+        job = db.get_job(db.list_jobs(1)[0][0])
+        if interrupted == EXIT_PAUSED and job['status'] == 'paused' and job['processed_count'] == 200:
+            print("  ✅ Interrupted job paused at its checkpoint, free to resume")
+        else:
+            print(f"  ❌ Interrupted job left as {job['status']} (exit code {interrupted})")
+            return False
+        
+        codes = [main(args + ['retention']), main(args + ['export', 'logs', 'test_cli_logs.csv.gz']),
+                 main(args + ['de-anonymize', '--processes'])]
+        with gzip.open('test_cli_logs.csv.gz', 'rt') as f:
+            exported = f.read()
+        if codes == [EXIT_OK] * 3 and 'anonymize_data' in exported \
+                and db.get_statistics()['anonymized_patients'] == 0:
+            print("  ✅ Retention, export and de-anonymization commands succeeded")
+        else:
+            print(f"  ❌ Command failures: exit codes {codes}")
+            return False
+        
+        # Database errors, including opening the database, are errors rather than busy jobs
+        unopenable = main(['--db', 'test_cli_missing/none.db', '--quiet', 'jobs'])
+        with open('test_cli_corrupt.db', 'wb') as f:
+            f.write(b'not a database' * 100)
+        corrupt = main(['--db', 'test_cli_corrupt.db', '--quiet', 'jobs'])
+        os.remove('test_cli_corrupt.db')
+        if unopenable == EXIT_ERROR and corrupt == EXIT_ERROR:
+            print("  ✅ Database errors exit with an error code, not busy")
+        else:
+            print(f"  ❌ Unexpected exit codes for database errors: {unopenable}, {corrupt}")
+            return False
+        
+        db.close()
+        remove_test_db('test_cli.db')
+        os.remove('test_cli_logs.csv.gz')
+        return True
+        
+    except Exception as e:
+        print(f"  ❌ Command line test error: {e}")
+        return False
+
+def test_backup():
+    """Test online backups under concurrent writes, restore, pruning and scheduling"""
+    print("\nTesting backups...")
+    try:
+        import shutil
+        import sqlite3
+        import threading
+        import time
+        from database import DatabaseManager, list_backups
+        
+        remove_test_db('test_backup.db')
+        shutil.rmtree('test_backups', ignore_errors=True)
+        shutil.rmtree('test_key_backups', ignore_errors=True)
+        db = DatabaseManager('test_backup.db')
+        seed_patients(db, 20000, diagnosis='Checkup ' * 20)
+        
+        # Writers keep committing while the backup copies small page batches
+        stop = threading.Event()
+        writes = []
+        def writer():
+            while not stop.is_set():
+                db.add_patient('Writer', '555-123-4567', 'Flu', 1, 'admin', 'admin')
+                writes.append(1)
+                time.sleep(0.002)
+        thread = threading.Thread(target=writer)
+        thread.start()
+        steps = []
+        try:
+            plain = db.backup_database('test_backups', 1, 'admin', 'admin', pages=64, sleep=0.005,
+                                       progress_callback=lambda copied, total: steps.append(len(writes)))
+        finally:
+            stop.set()
+            thread.join()
+        db.restore_backup(plain['path'], 'test_restored.db')
+        conn = sqlite3.connect('test_restored.db')
+        restored = conn.execute("SELECT COUNT(*) FROM patients WHERE name LIKE 'Patient %'").fetchone()[0]
+        conn.close()
+        if restored == 20000 and steps[-1] > steps[0] and plain['size_bytes'] == plain['database_bytes']:
+            print(f"  ✅ Online backup of {plain['database_bytes']:,} bytes in {len(steps)} steps "
+                  f"({steps[-1] - steps[0]} writes committed meanwhile)")
+        else:
+            print(f"  ❌ Online backup failed: {restored} rows restored, writes per step {steps[:3]}...")
+            return False
+        
+        packed = db.backup_database('test_backups', 1, 'admin', 'admin', compress=True, encrypt=True, keep=1)
+        check = db.restore_backup(packed['path'], 'test_restored.db')
+        with open(packed['path'], 'rb') as f:
+            data = bytearray(f.read())
+        data[-100] ^= 1
+        with open('test_tampered.db.gz.enc', 'wb') as f:
+            f.write(data)
+        try:
+            db.restore_backup('test_tampered.db.gz.enc', 'test_restored.db')
+            tamper_detected = False
+        except ValueError:
+            tamper_detected = True
+        if check == 'ok' and packed['size_bytes'] < packed['database_bytes'] / 2 and tamper_detected \
+                and packed['pruned'] == [plain['name']] and len(list_backups('test_backups')) == 1:
+            print(f"  ✅ Compressed, encrypted backup ({packed['size_bytes']:,} bytes) restored; "
+                  f"tampering detected, old backups pruned")
+        else:
+            print(f"  ❌ Packed backup failed: {check}, {packed}, tamper detected {tamper_detected}")
+            return False
+        
+        # No plaintext copy is staged in the backup directory while encrypting
+        remove_test_file('test_backup.key')
+        keyed = DatabaseManager('test_backup.db', key_file='test_backup.key')
+        staged = []
+        encrypted = keyed.backup_database('test_key_backups', 1, 'admin', 'admin', encrypt=True, sleep=0,
+                                          progress_callback=lambda copied, total: staged.extend(
+                                              os.listdir('test_key_backups')))
+        if staged == [] and os.listdir('test_key_backups') == [encrypted['name']]:
+            print("  ✅ Plaintext snapshot staged outside the backup directory")
+        else:
+            print(f"  ❌ Backup directory held {staged} during the backup")
+            return False
+        
+        # Keys that encrypted backups still need are not retired
+        keyed.rotate_encryption_key(1, 'admin', 'admin')
+        kept = keyed.retire_encryption_keys()
+        check = keyed.restore_backup(encrypted['path'], 'test_restored.db')
+        os.remove(encrypted['path'])
+        retired = keyed.retire_encryption_keys()
+        keyed.close()
+        os.remove('test_backup.key')
+        shutil.rmtree('test_key_backups')
+        if kept == [] and check == 'ok' and retired == [1]:
+            print("  ✅ Key kept while an encrypted backup needs it, retired once it is gone")
+        else:
+            print(f"  ❌ Key retirement ignored backups: kept {kept}, restore {check}, retired {retired}")
+            return False
+        
+        # The scheduler waits out the interval since the newest backup on disk
+        shutil.rmtree('test_backups')
+        db.start_backup_scheduler('test_backups', interval_seconds=3600, keep=2)
+        for _ in range(100):
+            if db.get_backup_scheduler_stats()['runs']:
+                break
+            time.sleep(0.1)
+        db.close()
+        db = DatabaseManager('test_backup.db')
+        db.start_backup_scheduler('test_backups', interval_seconds=3600, keep=2)
+        time.sleep(0.5)
+        if len(list_backups('test_backups')) == 1 and db.get_backup_scheduler_stats()['runs'] == 0:
+            print("  ✅ Scheduled backup taken once, not repeated on restart")
+        else:
+            print(f"  ❌ Scheduler misbehaved: {db.get_backup_scheduler_stats()}")
+            return False
+        
+        db.close()
+        remove_test_db('test_backup.db')
+        os.remove('test_restored.db')
+        os.remove('test_tampered.db.gz.enc')
+        shutil.rmtree('test_backups')
+        return True
+        
+    except Exception as e:
+        print(f"  ❌ Backup test error: {e}")
+        return False
+
+def test_schema_migrations():
+    """Test versioned migrations upgrade an existing database"""
+    print("\nTesting schema migrations...")
+    try:
+        import sqlite3
+        from database import DatabaseManager, MIGRATIONS
+        
+        # Simulate a database created before migrations existed
+        remove_test_db('test_migrate.db')
+        conn = sqlite3.connect('test_migrate.db')
+        conn.execute('''
+            CREATE TABLE logs (
+                log_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, username TEXT,
+                role TEXT, action TEXT NOT NULL, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP, details TEXT
+            )
+        ''')
+        conn.execute("INSERT INTO logs (username, role, action, details) "
+                     "VALUES ('admin', 'admin', 'update_patient', 'Updated patient ID: 42')")
+        conn.commit()
+        conn.close()
+        
+        db = DatabaseManager('test_migrate.db')
+        latest = MIGRATIONS[-1][0]
+        with db.connection() as conn:
+            indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        if db.get_schema_version() == latest and 'idx_logs_timestamp' in indexes \
+                and len(db.get_patient_access_history(42)) == 1:
+            print(f"  ✅ Existing database migrated to version {latest}")
+        else:
+            print(f"  ❌ Migration failed (version {db.get_schema_version()})")
+            return False
+        
+        if db.migrate() == []:
+            print("  ✅ Migrations are not re-applied")
+        else:
+            print("  ❌ Migrations were applied twice")
+            return False
+        
+        db.close()
+        remove_test_db('test_migrate.db')
+        return True
+        
+    except Exception as e:
+        print(f"  ❌ Schema migration test error: {e}")
+        return False
+
+def test_keyset_pagination():
+    """Test cursor-based paging through patients and logs"""
+    print("\nTesting keyset pagination...")
+    try:
+        from database import DatabaseManager
+        
+        db = DatabaseManager('test_paging.db')
+        seed_patients(db, 20)
+        
+        # Walk forward through all 25 patients, then back one page
+        seen = []
+        page = db.get_patients_page('doctor', page_size=10)
+        pages = [page]
+        while page['next_cursor'] is not None:
+            page = db.get_patients_page('doctor', page_size=10, cursor=page['next_cursor'])
+            pages.append(page)
+        for p in pages:
+            seen.extend(row[0] for row in p['rows'])
+        back = db.get_patients_page('doctor', page_size=10, cursor=pages[-1]['prev_cursor'], direction='prev')
+        
+        if seen == sorted(seen, reverse=True) and len(seen) == 25 and back['rows'] == pages[-2]['rows']:
+            print(f"  ✅ Paged through {len(seen)} patients in {len(pages)} pages")
+        else:
+            print(f"  ❌ Unexpected pages: {seen}")
+            return False
+        
+        for i in range(5):
+            db.log_action(1, 'admin', 'admin', 'test', f'Event {i}')
+        logs = db.get_logs_page(page_size=3)
+        if len(logs['rows']) == 3 and logs['rows'][0][5] == 'Event 4' and logs['prev_cursor'] is None:
+            print("  ✅ Log pages are newest first")
+        else:
+            print(f"  ❌ Unexpected log page: {logs}")
+            return False
+        
+        db.close()
+        remove_test_db('test_paging.db')
+        return True
+        
+    except Exception as e:
+        print(f"  ❌ Pagination test error: {e}")
+        return False
+
+def test_log_queries():
+    """Test server-side audit log filtering and distinct values"""
+    print("\nTesting log queries...")
+    try:
+        from database import DatabaseManager
+        
+        db = DatabaseManager('test_logquery.db')
+        for i in range(10):
+            db.log_action(1, 'admin', 'admin', 'login', f'Admin event {i}')
+        db.log_action(2, 'DrBob', 'doctor', 'update_patient', 'Updated patient ID: 42')
+        db.log_action(3, 'Alice_recep', 'receptionist', 'add_patient', 'Added 100%_real patient')
+        
+        db.flush_logs()
+        values = db.get_log_filter_values()
+        if values['roles'] == ['admin', 'doctor', 'receptionist'] and 'update_patient' in values['actions']:
+            print(f"  ✅ Distinct values: {len(values['actions'])} actions, {len(values['users'])} users")
+        else:
+            print(f"  ❌ Unexpected distinct values: {values}")
+            return False
+        
+        doctor = db.query_logs(roles=['doctor'])['rows']
+        text = db.query_logs(text='100%_')['rows']
+        none = db.query_logs(actions=[])['rows']
+        page = db.query_logs(roles=['admin'], limit=4)
+        if (len(doctor) == 1 and len(text) == 1 and none == [] and len(page['rows']) == 4
+                and db.count_logs(roles=['admin']) == 10):
+            print("  ✅ Role, text and limit filters applied in SQL")
+        else:
+            print("  ❌ Log filters returned unexpected rows")
+            return False
+        
+        # Broad filters walk log_id backwards instead of sorting every match
+        with db.connection() as conn:
+            conn.executemany('INSERT INTO logs (user_id, username, role, action, details) VALUES (?, ?, ?, ?, ?)',
+                             [(1, f'user{i % 7}', ('admin', 'doctor', 'receptionist')[i % 3],
+                               ('login', 'view_patient', 'update_patient', 'logout')[i % 4], f'Bulk {i}')
+                              for i in range(5000)])
+            conn.commit()
+        
+        def plan(roles, actions):
+            where, params = db._log_page_filters(roles, actions, None, None, None, None, 50)
+            with db.connection() as conn:
+                return ' '.join(row[3] for row in conn.execute(
+                    f'EXPLAIN QUERY PLAN SELECT log_id FROM logs {where} AND 1 = 1 ORDER BY log_id DESC LIMIT ?',
+                    params + [51]))
+        
+        broad_plan = plan(['admin', 'doctor'], ['login', 'view_patient', 'update_patient'])
+        narrow_plan = plan(None, ['add_patient'])
+        broad = db.query_logs(roles=['admin', 'doctor'], actions=['login', 'view_patient', 'update_patient'])
+        with db.connection() as conn:
+            expected = [row[0] for row in conn.execute('''
+                SELECT log_id FROM logs
+                WHERE role IN ('admin', 'doctor') AND action IN ('login', 'view_patient', 'update_patient')
+                ORDER BY log_id DESC LIMIT 50
+            ''')]
+        if 'TEMP B-TREE' not in broad_plan and 'INDEX' in narrow_plan and \
+                [row[0] for row in broad['rows']] == expected:
+            print(f"  ✅ Broad filter scans log_id ({broad_plan}); narrow filter uses an index")
+        else:
+            print(f"  ❌ Unexpected plans: broad '{broad_plan}', narrow '{narrow_plan}'")
+            return False
+        
+        db.close()
+        remove_test_db('test_logquery.db')
+        return True
+        
+    except Exception as e:
+        print(f"  ❌ Log query test error: {e}")
+        return False
+
+def test_streaming_export():
+    """Test chunked CSV export to memory, gzip files and the cached export file"""
+    print("\nTesting streaming export...")
+    try:
+        import gzip
+        from database import DatabaseManager
+        
+        remove_test_db('test_export.db')
+        db = DatabaseManager('test_export.db')
+        for i in range(250):
+            db.log_action(1, 'admin', 'admin', 'test', f'Event {i}, with "quotes"')
+        
+        chunks = list(db.stream_logs_csv(chunk_size=100))
+        csv_text = db.export_logs_csv()
+        if len(chunks) == 3 and b''.join(chunks).decode('utf-8') == csv_text and csv_text.count('\n') == 251:
+            print(f"  ✅ Streamed 250 logs in {len(chunks)} chunks")
+        else:
+            print(f"  ❌ Unexpected stream: {len(chunks)} chunks")
+            return False
+        
+        size = db.export_logs_to_file('test_export.csv.gz')
+        with gzip.open('test_export.csv.gz', 'rt', encoding='utf-8', newline='') as f:
+            same = f.read() == csv_text
+        os.remove('test_export.csv.gz')
+        if same:
+            print(f"  ✅ Gzip file export ({size:,} bytes)")
+        else:
+            print("  ❌ Gzip export content mismatch")
+            return False
+        
+        first = db.get_export_file('logs')
+        reused = db.get_export_file('logs') == first
+        db.log_action(1, 'admin', 'admin', 'test', 'Event after export')
+        second = db.get_export_file('logs')
+        with open(second, 'r', encoding='utf-8', newline='') as f:
+            fresh = f.read() == db.export_logs_csv()
+        export_dir = os.path.dirname(second)
+        if reused and second != first and not os.path.exists(first) and fresh:
+            print("  ✅ Cached export file reused until logs change")
+        else:
+            print("  ❌ Cached export not invalidated correctly")
+            return False
+        
+        db.close()
+        if os.path.exists(export_dir):
+            print("  ❌ Export directory not removed on close")
+            return False
+        remove_test_db('test_export.db')
+        return True
+        
+    except Exception as e:
+        print(f"  ❌ Streaming export test error: {e}")
+        return False
+
+def test_activity_rollups():
+    """Test analytics served from trigger-maintained rollups"""
+    print("\nTesting activity rollups...")
+    try:
+        from database import DatabaseManager
+        
+        remove_test_db('test_rollup.db')
+        db = DatabaseManager('test_rollup.db')
+        with db.connection() as conn:
+            conn.executemany('''
+                INSERT INTO logs (user_id, username, role, action, timestamp)
+                VALUES (1, 'admin', 'admin', ?, datetime('now', ?))
+            ''', [('login' if i % 3 else 'logout', f'-{i * 7} hours') for i in range(200)])
+            conn.commit()
+            raw_total = conn.execute(
+                "SELECT COUNT(*) FROM logs WHERE timestamp >= datetime('now', '-30 days')").fetchone()[0]
+            rollup_rows = conn.execute('SELECT SUM(count) FROM log_rollup_daily').fetchone()[0]
+        
+        daily = db.get_logs_by_date_range(30)
+        actions = dict(db.get_action_counts(30))
+        if rollup_rows == 200 and sum(c for _, c in daily) == raw_total == sum(actions.values()):
+            print(f"  ✅ Rollups match raw logs ({raw_total} events in 30 days, {len(daily)} day buckets)")
+        else:
+            print(f"  ❌ Rollup mismatch: {daily}, {actions}, raw {raw_total}")
+            return False
+        
+        db.close()
+        remove_test_db('test_rollup.db')
+        return True
+        
+    except Exception as e:
+        print(f"  ❌ Activity rollup test error: {e}")
+        return False
+
+def test_statistics_counters():
+    """Test trigger-maintained dashboard counters stay consistent"""
+    print("\nTesting statistics counters...")
+    try:
+        from database import DatabaseManager
+        
+        remove_test_db('test_stats.db')
+        db = DatabaseManager('test_stats.db')
+        db.add_patient('Jane Roe', '555-111-2222', 'Flu', 1, 'admin', 'admin', consent=False)
+        db.anonymize_patient_data(1, 'admin', 'admin')
+        db.update_patient(1, 'John Smith', '555-123-4567', 'Hypertension', 1, 'admin', 'admin')
+        db.delete_patient(2, 1, 'admin', 'admin')
+        
+        # Counters only see audit records once the group commit writes them
+        db.flush_logs()
+        stats = db.get_statistics()
+        patients = db.get_patients('admin')
+        expected = {
+            'total_patients': len(patients),
+            'anonymized_patients': sum(1 for p in patients if p[5] == 1),
+            'patients_with_consent': sum(1 for p in patients if p[6] == 1),
+            'total_logs': len(db.get_all_logs()),
+        }
+        if stats == expected and db.recount_statistics() == expected:
+            print(f"  ✅ Counters match base tables: {stats}")
+        else:
+            print(f"  ❌ Counters {stats} != {expected}")
+            return False
+        
+        db.close()
+        remove_test_db('test_stats.db')
+        return True
+        
+    except Exception as e:
+        print(f"  ❌ Statistics counter test error: {e}")
+        return False
+
+def test_data_retention():
+    """Test batched retention cleanup and the background sweeper"""
+    print("\nTesting data retention...")
+    try:
+        import time
+        from database import DatabaseManager
+        
+        remove_test_db('test_retention.db')
+        db = DatabaseManager('test_retention.db')
+        with db.connection() as conn:
+            for i in range(25):
+                cursor = conn.execute('''
+                    INSERT INTO patients (name, contact, diagnosis, consent_given, data_retention_date)
+                    VALUES (?, '555-000-0000', 'Checkup', 1, datetime('now', '-1 day'))
+                ''', (f'Expired {i}',))
+                conn.execute("INSERT INTO consent_records (patient_id, consent_type) VALUES (?, 'data_processing')",
+                             (cursor.lastrowid,))
+            conn.commit()
+        
+        deleted = db.check_data_retention(batch_size=10)
+        cleanup_logs = db.query_logs(actions=['data_retention_cleanup'])['rows']
+        with db.connection() as conn:
+            orphans = conn.execute('SELECT COUNT(*) FROM consent_records WHERE patient_id > 5').fetchone()[0]
+        if deleted == 25 and len(cleanup_logs) == 3 and orphans == 0 and db.get_statistics()['total_patients'] == 5:
+            print(f"  ✅ Deleted {deleted} expired records in {len(cleanup_logs)} batches")
+        else:
+            print(f"  ❌ Deleted {deleted}, {len(cleanup_logs)} audit entries, {orphans} orphaned consents")
+            return False
+        
+        # The sweeper runs once immediately after starting
+        db.add_patient('Short Stay', '555-999-0000', 'Flu', 1, 'admin', 'admin')
+        with db.connection() as conn:
+            conn.execute("UPDATE patients SET data_retention_date = datetime('now', '-1 hour') WHERE name = 'Short Stay'")
+            conn.commit()
+        db.start_retention_sweeper(interval_seconds=60, batch_size=10)
+        for _ in range(50):
+            if db.get_retention_sweeper_stats()['runs']:
+                break
+            time.sleep(0.05)
+        if db.get_retention_sweeper_stats()['total_deleted'] == 1:
+            print("  ✅ Background sweeper purged expired record")
+        else:
+            print(f"  ❌ Sweeper stats: {db.get_retention_sweeper_stats()}")
+            return False
+        
+        db.close()
+        remove_test_db('test_retention.db')
+        return True
+        
+    except Exception as e:
+        print(f"  ❌ Data retention test error: {e}")
+        return False
+
+def test_query_cache():
+    """Test cached reads are invalidated by writes"""
+    print("\nTesting query cache...")
+    try:
+        import sqlite3
+        from database import DatabaseManager
+        
+        remove_test_db('test_cache.db')
+        db = DatabaseManager('test_cache.db')
+        first = db.get_patients('doctor')
+        second = db.get_patients('doctor')
+        if second is first and db.get_cache_stats()['hits'] == 1:
+            print("  ✅ Repeated read served from cache")
+        else:
+            print("  ❌ Repeated read was not cached")
+            return False
+        
+        # Writes through the manager and from another connection both invalidate
+        db.add_patient('Cache Test', '555-222-3333', 'Flu', 1, 'admin', 'admin')
+        after_add = len(db.get_patients('doctor'))
+        other = sqlite3.connect('test_cache.db')
+        other.execute("INSERT INTO patients (name, contact, diagnosis) VALUES ('External', '555', 'Flu')")
+        other.commit()
+        other.close()
+        after_external = len(db.get_patients('doctor'))
+        if after_add == len(first) + 1 and after_external == len(first) + 2:
+            print(f"  ✅ Cache invalidated on change ({db.get_cache_stats()['invalidations']} invalidations)")
+        else:
+            print(f"  ❌ Stale cache: {after_add}, {after_external}")
+            return False
+        
+        db.close()
+        remove_test_db('test_cache.db')
+        return True
+        
+    except Exception as e:
+        print(f"  ❌ Query cache test error: {e}")
+        return False
+
+def test_read_context():
+    """Test per-run read memoization over a consistent snapshot"""
+    print("\nTesting read context...")
+    try:
+        import sqlite3
+        import threading
+        import time
+        from database import DatabaseManager
+        
+        remove_test_db('test_context.db')
+        # Caching disabled so repeated reads can only be served by the memo
+        db = DatabaseManager('test_context.db', cache_size=0)
+        with db.read_context() as context:
+            first = db.get_statistics()
+            second = db.get_statistics()
+            
+            # Commits by other connections are not visible within the unit of work
+            other = sqlite3.connect('test_context.db')
+            other.execute("INSERT INTO patients (name, contact, diagnosis) VALUES ('External', '555', 'Flu')")
+            other.commit()
+            other.close()
+            during = db.get_patients('admin')
+            
+            # Writes by this unit of work are; the snapshot is ended before writing
+            db.add_patient('Context Test', '555-444-5555', 'Flu', 1, 'admin', 'admin')
+            released = not context.conn.in_transaction
+            after_write = db.get_statistics()
+            stats = context.stats()
+        
+        if second is first and len(during) == first['total_patients']:
+            print(f"  ✅ Repeated read memoized over one snapshot ({stats['hits']} memo hits)")
+        else:
+            print("  ❌ Read context returned inconsistent results")
+            return False
+        
+        if after_write['total_patients'] == first['total_patients'] + 2 and released and \
+                db.get_pool_stats()['in_use'] == 0:
+            print("  ✅ Own writes refresh the snapshot; connection released")
+        else:
+            print(f"  ❌ Unexpected state after write: {after_write}, {db.get_pool_stats()}")
+            return False
+        
+        # Snapshot connections are reused across units of work, not reopened
+        for _ in range(20):
+            with db.read_context():
+                db.get_statistics()
+        readers = db.get_pool_stats()['read_pool']
+        if readers['open'] == 1 and readers['checkouts'] >= 20:
+            print(f"  ✅ One reader connection served {readers['checkouts']} read contexts")
+        else:
+            print(f"  ❌ Reader connections not reused: {readers}")
+            return False
+        db.close()
+        
+        # Concurrent units of work do not hold pool slots, even with more
+        # of them than the pool has connections
+        db = DatabaseManager('test_context.db', pool_size=2, pool_timeout=0.5)
+        errors = []
+        
+        def render(n):
+            try:
+                with db.read_context():
+                    db.get_statistics()
+                    db.get_patients('admin')
+                    time.sleep(0.05)
+                    db.add_patient(f'Concurrent {n}', '555-444-5555', 'Flu', 1, 'admin', 'admin')
+                    db.get_statistics()
+                    time.sleep(0.05)
+                    db.get_patients('admin')
+            except Exception as e:
+                errors.append(e)
+        
+        threads = [threading.Thread(target=render, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        stats = db.get_pool_stats()
+        if not errors and stats['timeouts'] == 0 and stats['read_pool']['timeouts'] == 0:
+            print(f"  ✅ {len(threads)} concurrent read contexts on a pool of 2 without timeouts")
+        else:
+            print(f"  ❌ Concurrent read contexts failed: {errors[:1]}, {db.get_pool_stats()}")
+            return False
+        
+        db.close()
+        remove_test_db('test_context.db')
+        return True
+        
+    except Exception as e:
+        print(f"  ❌ Read context test error: {e}")
+        return False
+
 def test_encryption():
     """Test Fernet encryption functionality"""
     print("\nTesting encryption...")
@@ -195,7 +1534,30 @@ def run_all_tests():
         "Password Hashing": test_password_hashing(),
         "Encryption": test_encryption(),
         "Data Masking": test_data_masking(),
-        "Database Module": test_database_module()
+        "Database Module": test_database_module(),
+        "Connection Pool": test_connection_pool(),
+        "Audit Log Writer": test_audit_log_writer(),
+        "Bulk Anonymization": test_bulk_anonymization(),
+        "Encrypt On Write": test_encrypt_on_write(),
+        "Resumable Jobs": test_resumable_jobs(),
+        "Key Rotation": test_key_rotation(),
+        "Cipher Backends": test_cipher_backends(),
+        "Decryption Cache": test_decryption_cache(),
+        "Blind Index": test_blind_index(),
+        "Patient Access History": test_patient_access_history(),
+        "Bulk Delete": test_bulk_delete(),
+        "Bulk Import": test_bulk_import(),
+        "Command Line": test_command_line(),
+        "Backup": test_backup(),
+        "Schema Migrations": test_schema_migrations(),
+        "Keyset Pagination": test_keyset_pagination(),
+        "Log Queries": test_log_queries(),
+        "Streaming Export": test_streaming_export(),
+        "Activity Rollups": test_activity_rollups(),
+        "Statistics Counters": test_statistics_counters(),
+        "Data Retention": test_data_retention(),
+        "Query Cache": test_query_cache(),
+        "Read Context": test_read_context()
     }
     
     print("\n" + "="*60)